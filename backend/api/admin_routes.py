@@ -0,0 +1,50 @@
+from fastapi import APIRouter, HTTPException, Header
+from fastapi.responses import PlainTextResponse
+from typing import Optional
+from dotenv import load_dotenv
+from .request_profiler import list_profiles, get_profile
+from . import aggregations
+import hmac
+import os
+
+load_dotenv()
+
+router = APIRouter()
+
+# Admin routes are disabled unless ADMIN_TOKEN is set, and then require it in X-Admin-Token
+ADMIN_TOKEN = os.getenv("ADMIN_TOKEN")
+
+def require_admin(admin_token: Optional[str]) -> None:
+    if not ADMIN_TOKEN:
+        raise HTTPException(status_code=404, detail="Not found")
+    if not admin_token or not hmac.compare_digest(admin_token, ADMIN_TOKEN):
+        raise HTTPException(status_code=403, detail="Invalid admin token")
+
+@router.get("/profiles")
+def list_profiles_route(route: Optional[str] = None, user_id: Optional[str] = None, x_admin_token: Optional[str] = Header(None)):
+    """Recent request profiles from every worker, newest first, without their stacks"""
+    require_admin(x_admin_token)
+    return {"profiles": list_profiles(route, user_id)}
+
+@router.get("/profiles/{profile_id}")
+def get_profile_route(profile_id: str, x_admin_token: Optional[str] = Header(None)):
+    require_admin(x_admin_token)
+    profile = get_profile(profile_id)
+    if profile is None:
+        raise HTTPException(status_code=404, detail="Profile not found")
+    return profile
+
+@router.get("/profiles/{profile_id}/folded")
+def download_profile(profile_id: str, x_admin_token: Optional[str] = Header(None)):
+    """Folded stacks of a profile, for speedscope or flamegraph.pl"""
+    require_admin(x_admin_token)
+    profile = get_profile(profile_id)
+    if profile is None:
+        raise HTTPException(status_code=404, detail="Profile not found")
+    return PlainTextResponse(profile["folded"], headers={"Content-Disposition": f'attachment; filename="profile-{profile_id}.folded"'})
+
+@router.get("/read-costs")
+def get_read_costs(x_admin_token: Optional[str] = Header(None)):
+    """Reads billed for totals and counts on this worker, per label, aggregated vs streamed"""
+    require_admin(x_admin_token)
+    return {"aggregations_available": not aggregations.aggregations_unavailable, "read_costs": aggregations.read_costs}
@@ -0,0 +1,115 @@
+from concurrent.futures import ThreadPoolExecutor
+from decimal import Decimal
+from google.api_core.exceptions import GoogleAPICallError
+from typing import Optional
+import threading
+import logging
+
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+# Counts and totals through Firestore's server-side count() and sum() aggregations.
+# An aggregation is billed one read per 1000 index entries it scans (at least one),
+# while streaming the same documents to add them up in Python is billed one read per
+# document. When aggregations are unavailable (an older client library, an emulator
+# without them, a failed request) the helpers fall back to streaming.
+#
+# Both paths record what they cost in read_costs, per label, so the savings show up
+# side by side in /admin/read-costs and in the db_validation_check output:
+#
+#     label -> {"aggregation": {"calls", "reads", "documents"}, "stream": {...}}
+AGGREGATION_READ_UNIT = 1000
+AGGREGATION_WORKERS = 8
+
+read_costs = {}
+read_costs_lock = threading.Lock()
+# Set once the client turns out not to support aggregations, so they are not retried
+aggregations_unavailable = False
+
+def aggregation_reads(documents: int) -> int:
+    return max(1, -(-documents // AGGREGATION_READ_UNIT))
+
+def record_read_cost(label: str, path: str, reads: int, documents: int) -> None:
+    with read_costs_lock:
+        totals = read_costs.setdefault(label, {}).setdefault(path, {"calls": 0, "reads": 0, "documents": 0})
+        totals["calls"] += 1
+        totals["reads"] += reads
+        totals["documents"] += documents
+
+def to_decimal(value) -> Decimal:
+    # Server-side sums are doubles; amounts are money, so round to cents
+    return Decimal(str(value or 0)).quantize(Decimal('0.01'))
+
+def run_aggregation(query, sum_field: Optional[str] = None) -> dict:
+    """count, and the sum of `sum_field`, of a query in one aggregation request"""
+    aggregation_query = query.count(alias="count")
+    if sum_field:
+        aggregation_query = aggregation_query.sum(sum_field, alias="sum")
+    results = aggregation_query.get()
+    return {result.alias: result.value for result in results[0]}
+
+def stream_totals(query, sum_field: Optional[str] = None, label: str = "unlabeled") -> dict:
+    """The streaming fallback: read the (projected) documents and add them up here"""
+    count = 0
+    total = Decimal('0.0')
+    for doc in query.select([sum_field] if sum_field else []).stream():
+        count += 1
+        if sum_field:
+            total += Decimal(str(doc.to_dict().get(sum_field, 0.0)))
+    record_read_cost(label, "stream", max(1, count), count)
+    return {"count": count, "sum": total}
+
+def count_and_sum(query, sum_field: Optional[str] = None, label: str = "unlabeled") -> dict:
+    """{"count": int, "sum": Decimal} of a query, server-side when possible"""
+    global aggregations_unavailable
+    if not aggregations_unavailable:
+        try:
+            values = run_aggregation(query, sum_field)
+            count = int(values["count"])
+            record_read_cost(label, "aggregation", aggregation_reads(count), count)
+            return {"count": count, "sum": to_decimal(values.get("sum"))}
+        except (AttributeError, NotImplementedError) as e:
+            aggregations_unavailable = True
+            logger.warning(f"Firestore aggregations are unavailable, streaming instead: {str(e)}")
+        except GoogleAPICallError as e:
+            logger.warning(f"Aggregation for {label} failed, streaming instead: {str(e)}")
+    return stream_totals(query, sum_field, label)
+
+def count_documents(query, label: str = "unlabeled") -> int:
+    return count_and_sum(query, None, label)["count"]
+
+def sum_field(query, field: str, label: str = "unlabeled") -> Decimal:
+    return count_and_sum(query, field, label)["sum"]
+
+def sums_by_group(query, group_field: str, group_values: list, field: str, label: str = "unlabeled") -> dict:
+    """
+    Sum of `field` for each of `group_values` of `group_field`, as Decimals. Firestore has
+    no GROUP BY, so this costs one aggregation per group (run concurrently) plus a count
+    of the whole query; when the query holds fewer documents than there are groups,
+    streaming them once is cheaper and is used instead.
+    """
+    if group_values and not aggregations_unavailable:
+        count = count_documents(query, label)
+        if count == 0:
+            return {}
+        # One read per group against one read per document
+        if count > len(group_values) and not aggregations_unavailable:
+            group_values = list(dict.fromkeys(group_values))
+            with ThreadPoolExecutor(max_workers=min(AGGREGATION_WORKERS, len(group_values))) as executor:
+                results = list(executor.map(
+                    lambda value: count_and_sum(query.where(group_field, "==", value), field, label),
+                    group_values
+                ))
+            return {value: result["sum"] for value, result in zip(group_values, results) if result["count"]}
+
+    totals = {}
+    count = 0
+    for doc in query.select([group_field, field]).stream():
+        count += 1
+        doc_data = doc.to_dict()
+        group = doc_data.get(group_field)
+        if not group:
+            continue
+        totals[group] = totals.get(group, Decimal('0.0')) + Decimal(str(doc_data.get(field, 0.0)))
+    record_read_cost(label, "stream", max(1, count), count)
+    return totals
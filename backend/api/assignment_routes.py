@@ -1,8 +1,17 @@
-from fastapi import APIRouter, HTTPException
+from fastapi import APIRouter, HTTPException, Header
 from pydantic import BaseModel
-from datetime import datetime, timezone
+from datetime import datetime, timezone, timedelta
 from decimal import Decimal
-from .db import db
+from typing import Optional, List
+from .db import db, new_batch
+from .data_version import bump_data_version
+from .period_snapshots import invalidate_closed_snapshots
+from .period_keys import get_pay_start, get_window_filter
+from .budget_periods import get_period_keys, get_period_settings, get_period_bounds, parse_date, format_date
+from .budget_aggregates import sum_by_category, compute_goal_progress
+from .sharded_counters import get_shard_counts, stage_available_change, read_balance
+from .category_routes import list_categories, load_allocated_and_spent
+from .idempotency import get_idempotency_ref, lookup_idempotent_response, record_idempotent_response, commit_idempotent
 from backend.db.schemas import Assignment as AssignmentSchema
 import logging
 import os
@@ -20,17 +29,42 @@ assignment_logger.propagate = False
 
 router = APIRouter()
 
+# Each bulk assignment is two writes (the assignment and its category's increment).
+# A bulk assignment commits as one batch, so it is all-or-nothing and its idempotency
+# key is only recorded once everything is in; this cap leaves room in the 500-write
+# batch for the unallocated update, the user doc updates and the key.
+BULK_ASSIGN_MAX_ASSIGNMENTS = 200
+BULK_STRATEGIES = ("fund-goals", "copy-last-period")
+
 class Assignment(BaseModel):
     amount: Decimal
     user_id: str
     category_id: str
     date: str
 
+class BulkAssignmentItem(BaseModel):
+    category_id: str
+    amount: Decimal
+
+class BulkAssignmentRequest(BaseModel):
+    user_id: str
+    date: str  # Date given to every assignment
+    assignments: Optional[List[BulkAssignmentItem]] = None
+    strategy: Optional[str] = None  # "fund-goals" or "copy-last-period", instead of explicit assignments
+    start_date: Optional[str] = None  # Budget period the strategy works on
+    end_date: Optional[str] = None
+
 @router.post("/create-assignment")
-async def create_assignment(assignment: Assignment):
+async def create_assignment(assignment: Assignment, idempotency_key: Optional[str] = Header(None)):
     try:
         # logger.info("Creating a new assignment for user_id: %s and category_id: %s", assignment.user_id, assignment.category_id)
         
+        # Replay the stored response if this is a retry of a request that already committed
+        idempotency_ref = get_idempotency_ref(assignment.user_id, "create-assignment", idempotency_key)
+        cached_response = lookup_idempotent_response(idempotency_ref, assignment)
+        if cached_response is not None:
+            return cached_response
+        
         if assignment.amount == 0:
             raise HTTPException(status_code=400, detail="Assignment amount cannot be zero")
         
@@ -50,45 +84,42 @@ async def create_assignment(assignment: Assignment):
             amount=assignment.amount,
             user_id=assignment.user_id,
             category_id=assignment.category_id,
-            date=assignment.date
+            date=assignment.date,
+            **get_period_keys(assignment.date, get_pay_start(user_doc.to_dict()))
         )
         
-        # Find unallocated funds category before starting batch
-        unallocated_query = db.collection("categories").where("user_id", "==", assignment.user_id).where("is_unallocated_funds", "==", True).limit(1)
-        unallocated_docs = unallocated_query.stream()
-        unallocated_category = None
-        for doc in unallocated_docs:
-            unallocated_category = doc
-            break
-
-        if not unallocated_category:
+        # Use batch write for atomicity
+        batch = new_batch()
+
+        shard_counts = get_shard_counts(assignment.user_id, batch)
+        if not shard_counts:
             raise HTTPException(status_code=404, detail="Unallocated funds category not found")
+        unallocated_category_id, unallocated_shard_count = next(iter(shard_counts.items()))
+        unallocated_category_ref = db.collection("categories").document(unallocated_category_id)
 
-        # Get current data for calculations
-        unallocated_data = unallocated_category.to_dict()
         category_data = category_doc.to_dict()
-        
-        current_available = Decimal(str(unallocated_data.get("available", 0.0)))
-        new_available = current_available - assignment.amount
-        
-        current_category_available = Decimal(str(category_data.get("available", 0.0)))
+        current_category_available = Decimal(str(read_balance(assignment.category_id, category_data)))
         new_category_available = current_category_available + assignment.amount
 
-        # Use batch write for atomicity
-        batch = db.batch()
-        
         # 1. Create assignment document
         assignment_ref = db.collection("assignments").document()
         batch.set(assignment_ref, assignment_schema.to_dict())
         
-        # 2. Update unallocated funds (subtract assignment amount)
-        batch.update(unallocated_category.reference, {"available": float(new_available)})
+        # 2. Update unallocated funds (subtract assignment amount), on one of its shards
+        stage_available_change(batch, unallocated_category_ref, -float(assignment.amount), unallocated_shard_count)
         
         # 3. Update target category (add assignment amount)
-        batch.update(category_ref, {"available": float(new_category_available)})
+        stage_available_change(batch, category_ref, float(assignment.amount), category_data.get("shard_count", 0))
+        bump_data_version(assignment.user_id, batch)
+        invalidate_closed_snapshots(assignment.user_id, [assignment.date], batch)
+        
+        response = {"message": "Assignment created successfully.", "assignment_id": assignment_ref.id}
+        record_idempotent_response(batch, idempotency_ref, assignment.user_id, "create-assignment", assignment, response)
         
         # Execute all writes atomically
-        batch.commit()
+        replayed_response = commit_idempotent(batch, idempotency_ref, assignment)
+        if replayed_response is not None:
+            return replayed_response
 
         # Get user email for logging
         user_data = user_doc.to_dict()
@@ -98,7 +129,128 @@ async def create_assignment(assignment: Assignment):
         assignment_logger.info(f"Assignment created - ID: {assignment_ref.id}, Amount: ${assignment.amount}, Category: '{category_data.get('name', 'Unknown')}' (ID: {assignment.category_id}), New category available: ${new_category_available}, User ID: {assignment.user_id}, User Email: {user_email}")
 
         # logger.info("Assignment created successfully with ID: %s", assignment_ref.id)
-        return {"message": "Assignment created successfully.", "assignment_id": assignment_ref.id}
+        return response
+    except HTTPException as e:
+        raise e
     except Exception as e:
         # logger.error("Failed to create assignment: %s", e)
-        raise HTTPException(status_code=500, detail=f"Failed to create assignment: %e")
\ No newline at end of file
+        raise HTTPException(status_code=500, detail=f"Failed to create assignment: %e")
+def plan_strategy(request: BulkAssignmentRequest, user_data: dict) -> List[tuple]:
+    """Turn a funding strategy into (category_id, amount) pairs for the request's period"""
+    if not request.start_date or not request.end_date:
+        raise HTTPException(status_code=400, detail="start_date and end_date are required with a strategy")
+
+    if request.strategy == "fund-goals":
+        # Assign what each goal still misses this period
+        progress = compute_goal_progress(
+            list_categories(request.user_id)["categories"],
+            load_allocated_and_spent(request.user_id, request.start_date, request.end_date)
+        )
+        return [(goal["category_id"], Decimal(str(goal["remaining"]))) for goal in progress["goals"] if goal["remaining"] > 0]
+
+    # copy-last-period: repeat what was assigned to each category in the previous period
+    budget_period, pay_start = get_period_settings(user_data)
+    start, end = get_period_bounds(parse_date(request.start_date) - timedelta(days=1), budget_period, pay_start)
+    start_date, end_date = format_date(start), format_date(end)
+    window_filter = get_window_filter(request.user_id, start_date, end_date)
+    last_assigned = sum_by_category("assignments", request.user_id, start_date, end_date, window_filter)
+    return [(category_id, amount) for category_id, amount in last_assigned.items() if amount != 0]
+
+@router.post("/bulk-assign")
+async def bulk_assign(request: BulkAssignmentRequest, idempotency_key: Optional[str] = Header(None)):
+    """
+    Fund many categories at once, from explicit (category, amount) pairs or a strategy.
+    Everything is validated before anything is written, all of it commits in one batch,
+    and the Unallocated Funds change is netted into one update instead of one per
+    assignment.
+    """
+    try:
+        idempotency_ref = get_idempotency_ref(request.user_id, "bulk-assign", idempotency_key)
+        cached_response = lookup_idempotent_response(idempotency_ref, request)
+        if cached_response is not None:
+            return cached_response
+
+        if (request.assignments is None) == (request.strategy is None):
+            raise HTTPException(status_code=400, detail="Provide either assignments or a strategy")
+        if request.strategy is not None and request.strategy not in BULK_STRATEGIES:
+            raise HTTPException(status_code=400, detail=f"Unknown strategy: {request.strategy}")
+
+        user_doc = db.collection("users").document(request.user_id).get()
+        if not user_doc.exists:
+            raise HTTPException(status_code=404, detail="User not found")
+        user_data = user_doc.to_dict()
+
+        if request.strategy is not None:
+            planned = plan_strategy(request, user_data)
+        else:
+            planned = [(item.category_id, item.amount) for item in request.assignments]
+        if not planned:
+            return {"message": "Nothing to assign.", "assignment_ids": [], "total": 0.0}
+
+        # Validate every pair up front, with one read for all the categories
+        if len(planned) > BULK_ASSIGN_MAX_ASSIGNMENTS:
+            raise HTTPException(status_code=400, detail=f"At most {BULK_ASSIGN_MAX_ASSIGNMENTS} assignments can be made at once")
+        category_ids = [category_id for category_id, _ in planned]
+        if len(set(category_ids)) != len(category_ids):
+            raise HTTPException(status_code=400, detail="Each category can only appear once")
+        if any(amount == 0 for _, amount in planned):
+            raise HTTPException(status_code=400, detail="Assignment amount cannot be zero")
+        category_refs = [db.collection("categories").document(category_id) for category_id in category_ids]
+        category_docs = {doc.id: doc for doc in db.get_all(category_refs, field_paths=["user_id", "is_unallocated_funds", "shard_count"])}
+        for category_id in category_ids:
+            category_doc = category_docs.get(category_id)
+            if category_doc is None or not category_doc.exists or category_doc.to_dict().get("user_id") != request.user_id:
+                raise HTTPException(status_code=404, detail=f"Category not found: {category_id}")
+            if category_doc.to_dict().get("is_unallocated_funds", False):
+                raise HTTPException(status_code=400, detail="Cannot assign to the unallocated funds category")
+
+        batch = new_batch()
+        shard_counts = get_shard_counts(request.user_id, batch)
+        if not shard_counts:
+            raise HTTPException(status_code=404, detail="Unallocated funds category not found")
+        unallocated_category_id, unallocated_shard_count = next(iter(shard_counts.items()))
+        unallocated_category_ref = db.collection("categories").document(unallocated_category_id)
+
+        period_keys = get_period_keys(request.date, get_pay_start(user_data))
+        assignments = []
+        for category_id, amount in planned:
+            assignment_schema = AssignmentSchema(
+                amount=amount,
+                user_id=request.user_id,
+                category_id=category_id,
+                date=request.date,
+                **period_keys
+            )
+            assignments.append((db.collection("assignments").document(), category_id, assignment_schema))
+
+        total = sum((amount for _, amount in planned), Decimal('0.0'))
+        response = {
+            "message": "Assignments created successfully.",
+            "assignment_ids": [assignment_ref.id for assignment_ref, _, _ in assignments],
+            "total": float(total)
+        }
+
+        for assignment_ref, category_id, assignment_schema in assignments:
+            batch.set(assignment_ref, assignment_schema.to_dict())
+            shard_count = category_docs[category_id].to_dict().get("shard_count", 0)
+            stage_available_change(batch, db.collection("categories").document(category_id), float(assignment_schema.amount), shard_count)
+        # One netted update of Unallocated Funds for the whole request
+        stage_available_change(batch, unallocated_category_ref, -float(total), unallocated_shard_count)
+        bump_data_version(request.user_id, batch)
+        invalidate_closed_snapshots(request.user_id, [request.date], batch)
+
+        # The key commits with the assignments, so a retry replays this response only
+        # when every assignment in it was written
+        record_idempotent_response(batch, idempotency_ref, request.user_id, "bulk-assign", request, response)
+        replayed_response = commit_idempotent(batch, idempotency_ref, request)
+        if replayed_response is not None:
+            return replayed_response
+
+        assignment_logger.info(f"Bulk assignment created - {len(assignments)} assignments, Total: ${total}, Strategy: {request.strategy or 'explicit'}, User ID: {request.user_id}, User Email: {user_data.get('email', 'Unknown')}")
+        return response
+    except HTTPException as e:
+        raise e
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Failed to create assignments: {str(e)}")
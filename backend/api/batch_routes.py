@@ -0,0 +1,229 @@
+from fastapi import APIRouter, HTTPException, Request, Response, BackgroundTasks
+from pydantic import BaseModel
+from typing import Any, Dict, List, Optional
+from .db import shared_batch, SharedBatch
+import asyncio
+import json
+import logging
+
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+router = APIRouter()
+
+MAX_OPERATIONS = 25
+
+# Body fields naming a document whose current state a mutation reads to compute its
+# writes. In an atomic batch every handler reads the data as it was before the batch,
+# so two mutations naming the same document would both start from that state and one
+# of their updates would be lost. Such batches are rejected; send them non-atomic.
+CONFLICT_FIELDS = {
+    "transaction_id": "transactions",
+    "transaction_ids": "transactions",
+    "category_id": "categories",
+    "group_id": "category_groups",
+    "assignment_id": "assignments",
+    "rule_id": "categorization_rules",
+    "item_id": "plaid_items"
+}
+# Routes that rewrite the user document itself
+USER_DOCUMENT_ROUTES = ("/user/",)
+
+class BatchOperation(BaseModel):
+    id: Optional[str] = None  # Echoed back so the client can match results
+    method: str = "POST"
+    path: str  # Full path of an existing route, e.g. /category/get-categories
+    body: Optional[Dict[str, Any]] = None
+    headers: Dict[str, str] = {}
+
+class BatchRequest(BaseModel):
+    operations: List[BatchOperation]
+    # Stage every mutation into one Firestore batch that is committed only if all of them succeed
+    atomic: bool = False
+
+def is_read_operation(operation: BatchOperation) -> bool:
+    """Read routes in this API are all named get-*"""
+    return operation.method.upper() == "GET" or operation.path.rstrip("/").rsplit("/", 1)[-1].startswith("get-")
+
+def conflict_keys(operation: BatchOperation) -> set:
+    """(collection, id) of the documents a mutation reads before writing, found anywhere in its body"""
+    keys = set()
+
+    def walk(value):
+        if isinstance(value, dict):
+            for field, item in value.items():
+                if field in CONFLICT_FIELDS and item:
+                    for doc_id in (item if isinstance(item, list) else [item]):
+                        keys.add((CONFLICT_FIELDS[field], str(doc_id)))
+                else:
+                    walk(item)
+        elif isinstance(value, list):
+            for item in value:
+                walk(item)
+
+    walk(operation.body or {})
+    user_id = (operation.body or {}).get("user_id")
+    if user_id and operation.path.startswith(USER_DOCUMENT_ROUTES):
+        keys.add(("users", user_id))
+    return keys
+
+def find_conflict(operations: List[BatchOperation]) -> Optional[str]:
+    """Describe the first document two mutations of an atomic batch both target, if any"""
+    seen = {}
+    for index, operation in enumerate(operations):
+        if is_read_operation(operation):
+            continue
+        for key in conflict_keys(operation):
+            if key in seen:
+                return f"operations {seen[key]} and {index} both modify {key[0]}/{key[1]}"
+            seen[key] = index
+    return None
+
+def mark_not_committed(results: list, operations: List[BatchOperation], status: int, detail: str) -> None:
+    """Replace the success bodies of mutations whose writes were never committed"""
+    for index, operation in enumerate(operations):
+        result = results[index]
+        if not is_read_operation(operation) and result["status"] < 400:
+            results[index] = {"id": result["id"], "path": result["path"], "status": status, "body": {"detail": detail}}
+
+async def dispatch_operation(app, operation: BatchOperation) -> Dict[str, Any]:
+    """Run one sub-request through the ASGI app in-process and collect its response"""
+    body = json.dumps(operation.body).encode() if operation.body is not None else b""
+    headers = [(b"content-type", b"application/json"), (b"content-length", str(len(body)).encode())]
+    headers += [(name.lower().encode(), value.encode()) for name, value in operation.headers.items()]
+    path, _, query_string = operation.path.partition("?")
+
+    scope = {
+        "type": "http",
+        "asgi": {"version": "3.0"},
+        "http_version": "1.1",
+        "method": operation.method.upper(),
+        "scheme": "http",
+        "path": path,
+        "raw_path": path.encode(),
+        "root_path": "",
+        "query_string": query_string.encode(),
+        "headers": headers,
+        "client": None,
+        "server": None,
+    }
+
+    body_sent = False
+
+    async def receive():
+        nonlocal body_sent
+        if not body_sent:
+            body_sent = True
+            return {"type": "http.request", "body": body, "more_body": False}
+        return {"type": "http.disconnect"}
+
+    status = 500
+    response_headers = {}
+    chunks = []
+
+    async def send(message):
+        nonlocal status, response_headers
+        if message["type"] == "http.response.start":
+            status = message["status"]
+            response_headers = {name.decode().lower(): value.decode() for name, value in message.get("headers", [])}
+        elif message["type"] == "http.response.body":
+            chunks.append(message.get("body", b""))
+
+    try:
+        await app(scope, receive, send)
+    except Exception as e:
+        # The server error middleware has already sent a 500, keep the detail for the caller
+        logger.error(f"Batch operation {operation.method} {operation.path} failed: {str(e)}")
+        if not chunks:
+            chunks.append(json.dumps({"detail": str(e)}).encode())
+
+    raw_body = b"".join(chunks)
+    try:
+        response_body = json.loads(raw_body) if raw_body else None
+    except ValueError:
+        response_body = raw_body.decode(errors="replace")
+
+    result = {"id": operation.id, "path": operation.path, "status": status, "body": response_body}
+    if "etag" in response_headers:
+        result["etag"] = response_headers["etag"]
+    return result
+
+def dispatch_operation_in_thread(app, operation: BatchOperation) -> Dict[str, Any]:
+    # Route handlers block on Firestore, so reads get their own event loop in a
+    # worker thread to actually overlap
+    return asyncio.run(dispatch_operation(app, operation))
+
+@router.post("")
+async def run_batch(request: BatchRequest, http_request: Request, response: Response, background_tasks: BackgroundTasks):
+    """
+    Run an ordered list of sub-requests against the existing routes in one round trip.
+    Consecutive reads run concurrently; mutations run one at a time in the given order.
+    With atomic=True the mutations share one Firestore batch, so reads issued by later
+    operations still see the data as it was before the batch. That is also why an atomic
+    batch cannot contain two mutations of the same document (see CONFLICT_FIELDS), and
+    when it is not committed every mutation in it is reported failed: 424 when another
+    operation failed, 500 when the commit itself did. Background work the mutations
+    start (applying rules, backfills, large cascades) runs only once the batch commits.
+    """
+    if len(request.operations) == 0:
+        raise HTTPException(status_code=400, detail="No operations provided")
+    if len(request.operations) > MAX_OPERATIONS:
+        raise HTTPException(status_code=400, detail=f"A batch can contain at most {MAX_OPERATIONS} operations")
+    for operation in request.operations:
+        if operation.path.rstrip("/").startswith("/batch"):
+            raise HTTPException(status_code=400, detail="Batch operations cannot be nested")
+        if request.atomic and operation.path.rstrip("/").endswith("/sync-plaid-transactions"):
+            raise HTTPException(status_code=400, detail="Plaid sync cannot be part of an atomic batch")
+    if request.atomic:
+        conflict = find_conflict(request.operations)
+        if conflict:
+            raise HTTPException(status_code=400, detail=f"An atomic batch cannot modify a document twice: {conflict}")
+
+    app = http_request.app
+    results = [None] * len(request.operations)
+    batch = SharedBatch() if request.atomic else None
+    token = shared_batch.set(batch)
+
+    try:
+        pending_reads = []
+
+        async def flush_reads():
+            outcomes = await asyncio.gather(*[
+                asyncio.to_thread(dispatch_operation_in_thread, app, request.operations[index])
+                for index in pending_reads
+            ])
+            for index, outcome in zip(pending_reads, outcomes):
+                results[index] = outcome
+            pending_reads.clear()
+
+        for index, operation in enumerate(request.operations):
+            if is_read_operation(operation):
+                pending_reads.append(index)
+                continue
+            # A mutation is a barrier: reads queued before it must finish first
+            await flush_reads()
+            results[index] = await dispatch_operation(app, operation)
+
+        await flush_reads()
+    finally:
+        shared_batch.reset(token)
+
+    committed = None
+    if batch is not None:
+        mutation_results = [result for operation, result in zip(request.operations, results) if not is_read_operation(operation)]
+        committed = all(result["status"] < 400 for result in mutation_results)
+        if not committed:
+            mark_not_committed(results, request.operations, 424, "Not committed: another operation of the atomic batch failed")
+        else:
+            try:
+                batch.commit_shared()
+            except Exception as e:
+                logger.error(f"Failed to commit atomic batch: {str(e)}")
+                committed = False
+                mark_not_committed(results, request.operations, 500, f"Not committed: the batch commit failed: {str(e)}")
+                response.status_code = 500
+        if committed:
+            for func, args, kwargs in batch.background_tasks:
+                background_tasks.add_task(func, *args, **kwargs)
+
+    return {"results": results, "committed": committed}
@@ -0,0 +1,121 @@
+from decimal import Decimal
+from datetime import datetime, timedelta
+from .db import db
+from .period_keys import get_window_filter
+from .aggregations import sums_by_group
+
+# Helper function to get the next day for date range queries
+def get_next_day_str(date_str: str) -> str:
+    """
+    Takes a date string in YYYY-MM-DD format and returns the next day
+    in the same format, to be used for inclusive querying of the end date
+    """
+    date_obj = datetime.strptime(date_str, "%Y-%m-%d")
+    next_day = date_obj + timedelta(days=1)
+    return next_day.strftime("%Y-%m-%d")
+
+def user_window_query(collection: str, user_id: str, start_date: str, end_date: str, window_filter=None):
+    """
+    Query all of a user's documents in a window, across categories. Whole months and pay
+    periods use the denormalized period keys, which are pure equality filters.
+    """
+    query = db.collection(collection).where("user_id", "==", user_id)
+    if window_filter:
+        field, value = window_filter
+        return query.where(field, "==", value)
+    return query.where("date", ">=", start_date).where("date", "<", get_next_day_str(end_date))
+
+def sum_by_category(collection: str, user_id: str, start_date: str, end_date: str, window_filter=None, category_ids=None) -> dict:
+    """
+    Sum the `amount` of a user's documents in a window, grouped by category_id. Given the
+    category ids, the sums are server-side aggregations whenever that reads less than
+    streaming the window once (see aggregations.py).
+    """
+    query = user_window_query(collection, user_id, start_date, end_date, window_filter)
+    return sums_by_group(query, "category_id", category_ids or [], "amount", label=f"{collection}.sum_by_category")
+
+def compute_allocated_and_spent(user_id: str, start_date: str, end_date: str) -> dict:
+    """
+    Sum each category's assignments and spending, and the user's unallocated income, over a window.
+    The assignments and transactions are each summed per category with aggregations, or
+    read with one query and grouped here when the window holds only a few documents.
+    """
+    window_filter = get_window_filter(user_id, start_date, end_date)
+
+    categories_docs = list(db.collection("categories").where("user_id", "==", user_id).select(["is_unallocated_funds"]).stream())
+    category_ids = [doc.id for doc in categories_docs]
+    assigned = sum_by_category("assignments", user_id, start_date, end_date, window_filter, category_ids)
+    transacted = sum_by_category("transactions", user_id, start_date, end_date, window_filter, category_ids)
+
+    allocated_and_spent = []
+    unallocated_income = Decimal('0.0')
+    for doc in categories_docs:
+        category_data = doc.to_dict()
+        if category_data.get("is_unallocated_funds", False):
+            # Income lands in the unallocated funds category; it has no spending
+            unallocated_income = transacted.get(doc.id, Decimal('0.0'))
+            spent_amount = Decimal('0.0')
+        else:
+            # Negative amounts are spending, positive ones refunds/returns. Spending can be
+            # negative when refunds exceed it.
+            spent_amount = -transacted.get(doc.id, Decimal('0.0'))
+        allocated_and_spent.append({
+            "category_id": doc.id,
+            "allocated": float(assigned.get(doc.id, Decimal('0.0'))),
+            "spent": float(spent_amount)
+        })
+
+    return {"allocated_and_spent": allocated_and_spent, "unallocated_income": float(unallocated_income)}
+
+def compute_goal_progress(categories: list, allocated_and_spent: dict) -> dict:
+    """
+    Goal progress of every category for a period, from the category docs and the grouped
+    allocated/spent totals of that period. A goal is the amount to assign to the category
+    each period; overspent categories also need their negative balance covered.
+    """
+    totals = {item["category_id"]: item for item in allocated_and_spent["allocated_and_spent"]}
+
+    goals = []
+    total_goal = Decimal('0.0')
+    total_needed = Decimal('0.0')
+    unallocated_available = Decimal('0.0')
+    for category in categories:
+        available = Decimal(str(category.get("available", 0.0)))
+        if category.get("is_unallocated_funds", False):
+            unallocated_available = available
+            continue
+        category_totals = totals.get(category["id"], {})
+        allocated = Decimal(str(category_totals.get("allocated", 0.0)))
+        goal_amount = Decimal(str(category["goal_amount"])) if category.get("goal_amount") else None
+
+        overspent = max(-available, Decimal('0.0'))
+        if goal_amount is None:
+            progress = None
+            remaining = Decimal('0.0')
+        else:
+            progress = min(allocated / goal_amount, Decimal('1.0'))
+            remaining = max(goal_amount - allocated, Decimal('0.0'))
+            total_goal += goal_amount
+        needed = max(remaining, overspent)
+        total_needed += needed
+
+        goals.append({
+            "category_id": category["id"],
+            "goal_amount": float(goal_amount) if goal_amount is not None else None,
+            "allocated": float(allocated),
+            "spent": float(category_totals.get("spent", 0.0)),
+            "available": float(available),
+            "progress": round(float(progress), 4) if progress is not None else None,
+            "remaining": float(remaining),
+            "needed_this_period": float(needed),
+            "funded": goal_amount is not None and remaining == 0
+        })
+
+    return {
+        "goals": goals,
+        "total_goal": float(total_goal),
+        "total_needed": float(total_needed),
+        "unallocated_available": float(unallocated_available),
+        # What is still missing after assigning all unallocated funds
+        "shortfall": float(max(total_needed - max(unallocated_available, Decimal('0.0')), Decimal('0.0')))
+    }
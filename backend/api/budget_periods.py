@@ -0,0 +1,78 @@
+from datetime import date, datetime, timedelta
+from typing import List, Optional, Tuple
+
+# Server-side mirror of the period math in frontend/utils/dateUtils.ts
+
+PAY_PERIOD_DAYS = 14
+
+def parse_date(date_str: str) -> date:
+    return datetime.strptime(date_str, "%Y-%m-%d").date()
+
+def format_date(day: date) -> str:
+    return day.strftime("%Y-%m-%d")
+
+def get_period_settings(user_data: Optional[dict]) -> Tuple[str, Optional[str]]:
+    """Return (budget_period, pay schedule start date) from a user document"""
+    preferences = (user_data or {}).get("preferences") or {}
+    budget_period = preferences.get("budget_period", "monthly")
+    pay_start = (preferences.get("pay_schedule") or {}).get("start_date")
+    if budget_period == "bi-weekly" and not pay_start:
+        # Without a pay schedule the app has no bi-weekly periods to show
+        budget_period = "monthly"
+    return budget_period, pay_start
+
+def get_month_bounds(day: date) -> Tuple[date, date]:
+    start = day.replace(day=1)
+    next_month = (start + timedelta(days=32)).replace(day=1)
+    return start, next_month - timedelta(days=1)
+
+def get_pay_period_index(day: date, pay_start: str) -> int:
+    """Number of whole pay periods between the pay schedule start and the given day"""
+    return (day - parse_date(pay_start)).days // PAY_PERIOD_DAYS
+
+def get_pay_period_bounds(index: int, pay_start: str) -> Tuple[date, date]:
+    start = parse_date(pay_start) + timedelta(days=index * PAY_PERIOD_DAYS)
+    return start, start + timedelta(days=PAY_PERIOD_DAYS - 1)
+
+def get_period_bounds(day: date, budget_period: str, pay_start: Optional[str] = None) -> Tuple[date, date]:
+    """Return the (start, end) dates of the budget period containing the given day"""
+    if budget_period == "bi-weekly" and pay_start:
+        return get_pay_period_bounds(get_pay_period_index(day, pay_start), pay_start)
+    if budget_period == "yearly":
+        return day.replace(month=1, day=1), day.replace(month=12, day=31)
+    return get_month_bounds(day)
+
+def get_closed_periods(today: date, budget_period: str, pay_start: Optional[str], count: int) -> List[Tuple[date, date]]:
+    """Return up to `count` completed periods before the current one, most recent first"""
+    periods = []
+    current_start, _ = get_period_bounds(today, budget_period, pay_start)
+    for _ in range(count):
+        start, end = get_period_bounds(current_start - timedelta(days=1), budget_period, pay_start)
+        periods.append((start, end))
+        current_start = start
+    return periods
+
+def get_period_keys(date_str: str, pay_start: Optional[str]) -> dict:
+    """
+    Denormalized period keys stored on transactions and assignments, so period
+    queries are equality lookups instead of range scans on `date`
+    """
+    day = parse_date(date_str)
+    return {
+        "period_month": day.strftime("%Y-%m"),
+        "pay_period": get_pay_period_index(day, pay_start) if pay_start else None
+    }
+
+def get_window_period_key(start_date: str, end_date: str, pay_start: Optional[str]) -> Optional[Tuple[str, object]]:
+    """
+    Return the (field, value) period key matching a query window exactly, or None
+    when the window is not a whole month or pay period
+    """
+    start, end = parse_date(start_date), parse_date(end_date)
+    if (start, end) == get_month_bounds(start):
+        return "period_month", start.strftime("%Y-%m")
+    if pay_start:
+        index = get_pay_period_index(start, pay_start)
+        if (start, end) == get_pay_period_bounds(index, pay_start):
+            return "pay_period", index
+    return None
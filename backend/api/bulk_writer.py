@@ -0,0 +1,135 @@
+from concurrent.futures import ThreadPoolExecutor
+from typing import List, Optional, Tuple
+from .db import db
+import time
+import logging
+
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+# Firestore allows 500 writes per batch
+CHUNK_SIZE = 500
+# Batches committed at the same time. Firestore sustains far more than this per
+# database, but a handful of parallel commits is where an import stops being latency bound.
+MAX_CONCURRENT_COMMITS = 8
+# Attempts per chunk before the whole flush fails
+CHUNK_ATTEMPTS = 4
+RETRY_BACKOFF_SECONDS = 0.5
+
+# Running totals across every flush in this process
+bulk_write_stats = {"writes": 0, "chunks": 0, "retries": 0, "failed_chunks": 0, "seconds": 0.0}
+
+class BulkWriteError(Exception):
+    """Raised when a chunk still fails after its last attempt"""
+
+# (op, ref, data) with op "set", "merge" (set with merge=True), "update" or "delete"
+Write = Tuple[str, object, Optional[dict]]
+
+def plaid_transaction_doc_id(plaid_transaction_id: str) -> str:
+    """
+    Transactions imported from Plaid are stored under an id derived from the Plaid
+    transaction id, so writing the same transaction twice upserts one document.
+    """
+    return f"plaid_{plaid_transaction_id}"
+
+def plaid_transaction_ref(plaid_transaction_id: str):
+    return db.collection("transactions").document(plaid_transaction_doc_id(plaid_transaction_id))
+
+class BulkWriter:
+    """
+    Collects writes and commits them in parallel batches. Writes added as one group
+    always land in the same batch, for writes that must apply together (a delete and
+    the balance update that accounts for it). Chunks commit independently and in any
+    order. Failed chunks are retried, except chunks holding a group added with
+    retry=False, e.g. one with an Increment that must not apply twice if a commit that
+    reported an error did go through.
+    """
+
+    def __init__(self, max_concurrency: int = MAX_CONCURRENT_COMMITS, chunk_size: int = CHUNK_SIZE):
+        self.max_concurrency = max_concurrency
+        self.chunk_size = chunk_size
+        self.groups: List[Tuple[List[Write], bool]] = []
+
+    def set(self, ref, data: dict) -> None:
+        self.groups.append(([("set", ref, data)], True))
+
+    def update(self, ref, data: dict) -> None:
+        self.groups.append(([("update", ref, data)], True))
+
+    def delete(self, ref) -> None:
+        self.groups.append(([("delete", ref, None)], True))
+
+    def add_group(self, writes: List[Write], retry: bool = True) -> None:
+        if len(writes) > self.chunk_size:
+            raise ValueError(f"A write group cannot exceed {self.chunk_size} writes")
+        if writes:
+            self.groups.append((list(writes), retry))
+
+    def build_chunks(self) -> List[Tuple[List[Write], bool]]:
+        """Pack groups into (writes, retry) chunks without splitting any group"""
+        chunks = []
+        # Packed separately so one non-retryable group does not disable retries for a whole chunk
+        for retry in (True, False):
+            current = []
+            for writes, group_retry in self.groups:
+                if group_retry != retry:
+                    continue
+                if len(current) + len(writes) > self.chunk_size:
+                    chunks.append((current, retry))
+                    current = []
+                current.extend(writes)
+            if current:
+                chunks.append((current, retry))
+        return chunks
+
+    def commit_chunk(self, chunk: List[Write], retry: bool = True) -> int:
+        """Commit one chunk, retrying it on its own with backoff. Returns the number of retries."""
+        attempts = CHUNK_ATTEMPTS if retry else 1
+        for attempt in range(attempts):
+            batch = db.batch()
+            for op, ref, data in chunk:
+                if op == "set":
+                    batch.set(ref, data)
+                elif op == "merge":
+                    batch.set(ref, data, merge=True)
+                elif op == "update":
+                    batch.update(ref, data)
+                elif op == "delete":
+                    batch.delete(ref)
+            try:
+                batch.commit()
+                return attempt
+            except Exception as e:
+                if attempt == attempts - 1:
+                    raise BulkWriteError(f"Chunk of {len(chunk)} writes failed after {attempts} attempts: {e}") from e
+                logger.warning(f"Chunk of {len(chunk)} writes failed (attempt {attempt + 1}), retrying: {e}")
+                time.sleep(RETRY_BACKOFF_SECONDS * 2 ** attempt)
+
+    def flush(self) -> dict:
+        """Commit everything collected so far. Raises BulkWriteError if any chunk failed."""
+        chunks = self.build_chunks()
+        self.groups = []
+        stats = {"writes": sum(len(writes) for writes, _ in chunks), "chunks": len(chunks), "retries": 0, "failed_chunks": 0, "seconds": 0.0}
+        if not chunks:
+            return stats
+
+        start = time.perf_counter()
+        errors = []
+        with ThreadPoolExecutor(max_workers=min(self.max_concurrency, len(chunks))) as executor:
+            futures = [executor.submit(self.commit_chunk, writes, retry) for writes, retry in chunks]
+            for future in futures:
+                try:
+                    stats["retries"] += future.result()
+                except BulkWriteError as e:
+                    stats["failed_chunks"] += 1
+                    errors.append(e)
+        stats["seconds"] = round(time.perf_counter() - start, 3)
+        stats["writes_per_second"] = round(stats["writes"] / stats["seconds"], 1) if stats["seconds"] else None
+
+        for key in ("writes", "chunks", "retries", "failed_chunks", "seconds"):
+            bulk_write_stats[key] += stats[key]
+        logger.info(f"Bulk write: {stats}")
+
+        if errors:
+            raise BulkWriteError(f"{len(errors)}/{len(chunks)} chunks failed: {errors[0]}")
+        return stats
@@ -0,0 +1,256 @@
+from datetime import datetime, timezone, timedelta
+from typing import Callable, Optional
+from google.api_core.exceptions import FailedPrecondition, NotFound
+from google.cloud import firestore
+from .db import db, new_batch, add_background_task
+from .data_version import bump_data_version
+from .period_snapshots import invalidate_closed_snapshots
+from .sharded_counters import get_shard_refs
+from .aggregations import count_documents
+from .plaid_utils import remove_plaid_item
+import logging
+
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+# Deletes are committed in chunks well under the 500 writes Firestore allows per
+# batch, leaving room for the category balance updates staged with each chunk.
+CASCADE_BATCH_SIZE = 400
+# Cascades touching more documents than this run as a background job
+BACKGROUND_THRESHOLD = 400
+JOBS_COLLECTION = "cascade_jobs"
+# Job docs outlive the data they deleted so clients can poll the outcome; Firestore
+# drops them through a TTL policy on `expires_at`
+# (gcloud firestore fields ttls update expires_at --collection-group=cascade_jobs).
+job_ttl = timedelta(days=7)
+# A job moves its updated_at after every chunk. One still running with an older
+# updated_at was interrupted (its instance stopped or recycled mid-delete) and is
+# reported failed; deleting the target again resumes, since a cascade only deletes
+# what is left and removes its target last.
+job_stale_after = timedelta(minutes=5)
+
+def query_has_documents(query) -> bool:
+    """Existence check that reads at most one document name"""
+    return len(list(query.select([]).limit(1).stream())) > 0
+
+def create_job(user_id: str, kind: str, target_id: str, estimated_total: int):
+    job_ref = db.collection(JOBS_COLLECTION).document()
+    # Staged like the request's other writes, so an atomic /batch that is not committed
+    # leaves no job behind that would never run
+    batch = new_batch()
+    batch.set(job_ref, {
+        "user_id": user_id,
+        "kind": kind,
+        "target_id": target_id,
+        "status": "running",
+        "estimated_total": estimated_total,
+        "deleted": 0,
+        "error": None,
+        "created_at": datetime.now(timezone.utc),
+        "updated_at": datetime.now(timezone.utc),
+        "expires_at": datetime.now(timezone.utc) + job_ttl
+    })
+    batch.commit()
+    return job_ref
+
+def heartbeat_job(job_ref, deleted: int = 0) -> None:
+    if job_ref is None:
+        return
+    job_ref.update({"deleted": firestore.Increment(deleted), "updated_at": datetime.now(timezone.utc)})
+
+def fail_stale_job(job_doc) -> dict:
+    """The job's data, after marking it failed if it stopped heartbeating while running"""
+    job_data = job_doc.to_dict()
+    updated_at = job_data.get("updated_at")
+    if job_data.get("status") != "running" or not updated_at or datetime.now(timezone.utc) - updated_at < job_stale_after:
+        return job_data
+
+    update = {"status": "failed", "error": "Interrupted before it finished, delete again to resume", "updated_at": datetime.now(timezone.utc)}
+    try:
+        # Unless the job heartbeated or finished since it was read
+        job_doc.reference.update(update, option=db.write_option(last_update_time=job_doc.update_time))
+    except (FailedPrecondition, NotFound):
+        return job_doc.reference.get().to_dict() or job_data
+    logger.warning(f"Marked stale {job_data.get('kind')} delete job {job_doc.id} failed")
+    return {**job_data, **update}
+
+def finish_job(job_ref, error: Optional[str] = None) -> None:
+    if job_ref is None:
+        return
+    job_ref.update({
+        "status": "failed" if error else "completed",
+        "error": error,
+        "updated_at": datetime.now(timezone.utc)
+    })
+
+def run_cascade(background_tasks, user_id: str, kind: str, target_id: str, estimated_total: int, cascade, *args) -> dict:
+    """Run a cascade inline when it is small, otherwise hand it to a background job and return its id"""
+    if estimated_total > BACKGROUND_THRESHOLD:
+        job_ref = create_job(user_id, kind, target_id, estimated_total)
+        add_background_task(background_tasks, cascade, *args, job_ref=job_ref)
+        return {"status": "running", "job_id": job_ref.id, "estimated_total": estimated_total}
+    return {"status": "completed", "deleted": cascade(*args)}
+
+def delete_documents(query, job_ref=None, keep: Optional[Callable[[dict], bool]] = None, balance_category_ids: Optional[set] = None, touched_dates: Optional[set] = None) -> int:
+    """
+    Delete every document matched by a query in chunked batches.
+
+    keep: skip documents for which it returns False (they stay in place)
+    balance_category_ids: give each deleted transaction's amount back to its category,
+        as one Increment per category per chunk committed with the deletes
+    touched_dates: collects the `date` of deleted documents for snapshot invalidation
+    """
+    deleted = 0
+    last_doc = None
+    while True:
+        page_query = query.order_by("__name__").limit(CASCADE_BATCH_SIZE)
+        if last_doc is not None:
+            page_query = page_query.start_after(last_doc)
+        docs = list(page_query.stream())
+        if not docs:
+            break
+        last_doc = docs[-1]
+
+        batch = db.batch()
+        chunk_deleted = 0
+        category_adjustments = {}
+        for doc in docs:
+            doc_data = doc.to_dict()
+            if keep is not None and not keep(doc_data):
+                continue
+            batch.delete(doc.reference)
+            chunk_deleted += 1
+            if touched_dates is not None and doc_data.get("date"):
+                touched_dates.add(doc_data["date"])
+            category_id = doc_data.get("category_id")
+            if balance_category_ids is not None and category_id in balance_category_ids:
+                category_adjustments[category_id] = category_adjustments.get(category_id, 0.0) - doc_data.get("amount", 0.0)
+
+        for category_id, adjustment in category_adjustments.items():
+            if adjustment != 0:
+                batch.update(db.collection("categories").document(category_id), {"available": firestore.Increment(adjustment)})
+
+        if chunk_deleted or category_adjustments:
+            batch.commit()
+        deleted += chunk_deleted
+        heartbeat_job(job_ref, chunk_deleted)
+
+        if len(docs) < CASCADE_BATCH_SIZE:
+            break
+    return deleted
+
+def delete_balance_shards(category_docs) -> None:
+    """Shards live in a subcollection, which deleting the category doc leaves behind"""
+    for doc in category_docs:
+        shard_count = doc.to_dict().get("shard_count") if doc.exists else None
+        if shard_count:
+            batch = db.batch()
+            for shard_ref in get_shard_refs(doc.reference, shard_count):
+                batch.delete(shard_ref)
+            batch.commit()
+
+def get_user_category_ids(user_id: str) -> set:
+    return {doc.id for doc in db.collection("categories").where("user_id", "==", user_id).select([]).stream()}
+
+def cascade_delete_category(user_id: str, category_id: str, job_ref=None) -> dict:
+    """Delete a category's assignments and rules in chunks, then the category itself"""
+    try:
+        touched_dates = set()
+        assignments_query = db.collection("assignments").where("category_id", "==", category_id)
+        deleted_assignments = delete_documents(assignments_query, job_ref, touched_dates=touched_dates)
+        # Rules pointing at the category would otherwise be skipped forever
+        delete_documents(db.collection("categorization_rules").where("category_id", "==", category_id), job_ref)
+        delete_balance_shards([db.collection("categories").document(category_id).get(field_paths=["shard_count"])])
+
+        batch = new_batch()
+        batch.delete(db.collection("categories").document(category_id))
+        bump_data_version(user_id, batch)
+        batch.commit()
+        invalidate_closed_snapshots(user_id, touched_dates)
+
+        finish_job(job_ref)
+        return {"assignments": deleted_assignments}
+    except Exception as e:
+        logger.error(f"Cascade delete of category {category_id} failed: {str(e)}")
+        finish_job(job_ref, str(e))
+        raise
+
+def plaid_item_transactions_query(user_id: str, item_doc_id: str):
+    return db.collection("transactions").where("user_id", "==", user_id).where("plaid_item_id", "==", item_doc_id)
+
+def legacy_plaid_item_transactions(user_id: str, item_data: dict):
+    """
+    Transactions synced before plaid_item_id was stored are matched by institution
+    and account name instead. Returns the query and the filter for its results.
+    """
+    account_names = {account.get("name") for account in item_data.get("accounts", [])}
+    query = db.collection("transactions").where("user_id", "==", user_id).where("institution_name", "==", item_data.get("institution_name"))
+
+    def keep(transaction_data: dict) -> bool:
+        return (
+            not transaction_data.get("plaid_item_id")
+            and bool(transaction_data.get("plaid_transaction_id"))
+            and transaction_data.get("account_name") in account_names
+        )
+
+    return query, keep
+
+def cascade_delete_plaid_item(user_id: str, item_doc_id: str, item_data: dict, job_ref=None) -> dict:
+    """Remove the item at Plaid, then delete its transactions, fixing up category balances, then the item itself"""
+    try:
+        if item_data.get("access_token"):
+            remove_plaid_item(item_data["access_token"])
+        category_ids = get_user_category_ids(user_id)
+        touched_dates = set()
+
+        deleted = delete_documents(plaid_item_transactions_query(user_id, item_doc_id), job_ref, balance_category_ids=category_ids, touched_dates=touched_dates)
+        legacy_query, keep = legacy_plaid_item_transactions(user_id, item_data)
+        deleted += delete_documents(legacy_query, job_ref, keep=keep, balance_category_ids=category_ids, touched_dates=touched_dates)
+
+        batch = new_batch()
+        batch.delete(db.collection("plaid_items").document(item_doc_id))
+        bump_data_version(user_id, batch)
+        batch.commit()
+        invalidate_closed_snapshots(user_id, touched_dates)
+
+        finish_job(job_ref)
+        return {"transactions": deleted}
+    except Exception as e:
+        logger.error(f"Cascade delete of plaid item {item_doc_id} failed: {str(e)}")
+        finish_job(job_ref, str(e))
+        raise
+
+# Every collection holding per-user documents, children before the things they reference
+USER_COLLECTIONS = ["transactions", "assignments", "categorization_rules", "plaid_items", "categories", "category_groups", "period_snapshots", "recurring_series", "sync_leases", "accounts", "idempotency_keys", "request_profiles", JOBS_COLLECTION]
+
+def count_user_documents(user_id: str) -> int:
+    return sum(count_documents(db.collection(collection).where("user_id", "==", user_id), "delete_user.estimate") for collection in USER_COLLECTIONS)
+
+def cascade_delete_user(user_id: str, job_ref=None) -> dict:
+    """Remove the user's items at Plaid, delete everything they own in chunks, then the user document"""
+    try:
+        # Before anything is deleted, so a Plaid failure leaves the user intact to retry
+        for doc in db.collection("plaid_items").where("user_id", "==", user_id).select(["access_token"]).stream():
+            access_token = doc.to_dict().get("access_token")
+            if access_token:
+                remove_plaid_item(access_token)
+                heartbeat_job(job_ref)
+
+        deleted = {}
+        for collection in USER_COLLECTIONS:
+            keep = None
+            if collection == "categories":
+                delete_balance_shards(db.collection("categories").where("user_id", "==", user_id).select(["shard_count"]).stream())
+            if collection == JOBS_COLLECTION:
+                # The job reporting this deletion stays until its TTL, for the client to poll
+                keep = lambda job_data: job_data.get("kind") != "user"
+            deleted[collection] = delete_documents(db.collection(collection).where("user_id", "==", user_id), job_ref, keep=keep)
+
+        db.collection("users").document(user_id).delete()
+
+        finish_job(job_ref)
+        return deleted
+    except Exception as e:
+        logger.error(f"Cascade delete of user {user_id} failed: {str(e)}")
+        finish_job(job_ref, str(e))
+        raise
@@ -0,0 +1,100 @@
+from fastapi import APIRouter, HTTPException, BackgroundTasks
+from pydantic import BaseModel
+from decimal import Decimal
+from typing import Optional
+from .db import db, new_batch, add_background_task
+from .data_version import bump_data_version
+from .categorization_rules import RULES_COLLECTION, apply_rules_to_history
+from backend.db.schemas import CategorizationRule as CategorizationRuleSchema
+
+router = APIRouter()
+
+class CreateRuleRequest(BaseModel):
+    user_id: str
+    category_id: str
+    merchant_pattern: Optional[str] = None
+    name_pattern: Optional[str] = None
+    personal_finance_category: Optional[str] = None
+    min_amount: Optional[Decimal] = None
+    max_amount: Optional[Decimal] = None
+    priority: int = 0
+    apply_to_history: bool = False  # Also categorize matching transactions that have no category yet
+
+class DeleteRuleRequest(BaseModel):
+    user_id: str
+    rule_id: str
+
+class UserIDRequest(BaseModel):
+    user_id: str
+
+@router.post("/create-rule")
+async def create_rule(request: CreateRuleRequest, background_tasks: BackgroundTasks):
+    try:
+        category_doc = db.collection("categories").document(request.category_id).get()
+        if not category_doc.exists or category_doc.to_dict().get("user_id") != request.user_id:
+            raise HTTPException(status_code=404, detail="Category not found")
+
+        rule_schema = CategorizationRuleSchema(**request.model_dump(exclude={"apply_to_history"}))
+
+        rule_ref = db.collection(RULES_COLLECTION).document()
+        batch = new_batch()
+        batch.set(rule_ref, rule_schema.to_dict())
+        bump_data_version(request.user_id, batch)
+        batch.commit()
+
+        if request.apply_to_history:
+            add_background_task(background_tasks, apply_rules_to_history, request.user_id)
+
+        return {"message": "Rule created successfully.", "rule_id": rule_ref.id}
+    except HTTPException as e:
+        raise e
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=f"Invalid rule: {str(e)}")
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Failed to create rule: {e}")
+
+@router.post("/get-rules")
+async def get_rules(request: UserIDRequest):
+    try:
+        rules = []
+        for doc in db.collection(RULES_COLLECTION).where("user_id", "==", request.user_id).stream():
+            rule_data = doc.to_dict()
+            rule_data["id"] = doc.id
+            rules.append(rule_data)
+        rules.sort(key=lambda rule: -rule.get("priority", 0))
+        return {"rules": rules}
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Failed to get rules: {e}")
+
+@router.post("/delete-rule")
+async def delete_rule(request: DeleteRuleRequest):
+    try:
+        rule_ref = db.collection(RULES_COLLECTION).document(request.rule_id)
+        rule_doc = rule_ref.get()
+        if not rule_doc.exists or rule_doc.to_dict().get("user_id") != request.user_id:
+            raise HTTPException(status_code=404, detail="Rule not found")
+
+        batch = new_batch()
+        batch.delete(rule_ref)
+        bump_data_version(request.user_id, batch)
+        batch.commit()
+        return {"message": "Rule deleted successfully."}
+    except HTTPException as e:
+        raise e
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Failed to delete rule: {e}")
+
+# Background job categorizing every uncategorized transaction the user's rules match
+@router.post("/apply-rules")
+async def apply_rules(request: UserIDRequest, background_tasks: BackgroundTasks):
+    try:
+        user_doc = db.collection("users").document(request.user_id).get()
+        if not user_doc.exists:
+            raise HTTPException(status_code=404, detail="User not found")
+
+        add_background_task(background_tasks, apply_rules_to_history, request.user_id)
+        return {"message": "Applying rules to transaction history."}
+    except HTTPException as e:
+        raise e
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Failed to start applying rules: {e}")
@@ -0,0 +1,160 @@
+from datetime import datetime, timezone
+from typing import List, Optional
+from google.api_core.exceptions import FailedPrecondition, NotFound
+from .db import db, Batch, NULL_VALUE
+from .data_version import get_data_version, bump_data_version
+from .period_snapshots import invalidate_closed_snapshots
+from .sharded_counters import get_shard_counts, stage_available_change
+import fnmatch
+import re
+import logging
+
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+RULES_COLLECTION = "categorization_rules"
+# Leaves room in the 500-write batch for the category increments and the user doc
+# updates staged with each chunk
+APPLY_BATCH_SIZE = 300
+# Reads of a chunk whose transactions keep changing before it is skipped for this run
+APPLY_PAGE_ATTEMPTS = 5
+
+# user_id -> (data_version, RuleMatcher). Every rule change bumps the data version,
+# so a cached matcher is reused until the user's data changes.
+matcher_cache = {}
+
+def compile_pattern(pattern: Optional[str]):
+    """Case-insensitive wildcard match when the pattern has * or ?, substring match otherwise"""
+    if not pattern:
+        return None
+    if "*" in pattern or "?" in pattern:
+        return re.compile(fnmatch.translate(pattern), re.IGNORECASE).match
+    needle = pattern.lower()
+    return lambda value: needle in value.lower()
+
+class CompiledRule:
+    def __init__(self, rule_id: str, rule_data: dict):
+        self.rule_id = rule_id
+        self.category_id = rule_data["category_id"]
+        self.priority = rule_data.get("priority", 0)
+        self.created_at = rule_data.get("created_at") or datetime.min.replace(tzinfo=timezone.utc)
+        self.min_amount = rule_data.get("min_amount")
+        self.max_amount = rule_data.get("max_amount")
+        self.personal_finance_category = rule_data.get("personal_finance_category")
+        self.merchant_matches = compile_pattern(rule_data.get("merchant_pattern"))
+        self.name_matches = compile_pattern(rule_data.get("name_pattern"))
+
+    def matches(self, transaction: dict) -> bool:
+        # Cheapest conditions first
+        amount = abs(transaction.get("amount") or 0.0)
+        if self.min_amount is not None and amount < self.min_amount:
+            return False
+        if self.max_amount is not None and amount > self.max_amount:
+            return False
+        if self.personal_finance_category:
+            pfc = transaction.get("personal_finance_category") or {}
+            if self.personal_finance_category not in (pfc.get("primary"), pfc.get("detailed")):
+                return False
+        if self.merchant_matches and not self.merchant_matches(transaction.get("merchant_name") or ""):
+            return False
+        if self.name_matches and not self.name_matches(transaction.get("name") or ""):
+            return False
+        return True
+
+class RuleMatcher:
+    """A user's rules in evaluation order; the first matching rule decides the category"""
+
+    def __init__(self, rules: List[CompiledRule]):
+        self.rules = sorted(rules, key=lambda rule: (-rule.priority, rule.created_at))
+
+    def match(self, transaction: dict) -> Optional[str]:
+        for rule in self.rules:
+            if rule.matches(transaction):
+                return rule.category_id
+        return None
+
+def load_rule_matcher(user_id: str) -> RuleMatcher:
+    """Compile the user's rules, skipping any whose category no longer exists"""
+    version = get_data_version(user_id)
+    cached = matcher_cache.get(user_id)
+    if cached and cached[0] == version:
+        return cached[1]
+
+    rule_docs = list(db.collection(RULES_COLLECTION).where("user_id", "==", user_id).stream())
+    category_ids = {doc.to_dict()["category_id"] for doc in rule_docs}
+    existing_category_ids = set()
+    if category_ids:
+        category_refs = [db.collection("categories").document(category_id) for category_id in category_ids]
+        existing_category_ids = {doc.id for doc in db.get_all(category_refs, field_paths=["user_id"]) if doc.exists}
+
+    rules = [CompiledRule(doc.id, doc.to_dict()) for doc in rule_docs if doc.to_dict()["category_id"] in existing_category_ids]
+    matcher = RuleMatcher(rules)
+    matcher_cache[user_id] = (version, matcher)
+    return matcher
+
+def apply_rules_to_history(user_id: str) -> dict:
+    """
+    Categorize the user's uncategorized transactions with their rules, in chunks. Each
+    chunk's category updates, the matching `available` increments and the closed-period
+    snapshots it makes stale commit together. Transactions that already have a category
+    are never changed.
+
+    A chunk can be read well before it commits. Each update is conditional on the
+    transaction being unchanged since the read, so a recategorization or a sync that
+    lands in between is never overwritten; the chunk is then read again.
+    """
+    matcher = load_rule_matcher(user_id)
+    if not matcher.rules:
+        return {"scanned": 0, "categorized": 0}
+
+    shard_counts = get_shard_counts(user_id)
+    query = db.collection("transactions").where("user_id", "==", user_id).where("category_id", "==", NULL_VALUE).order_by("__name__")
+    scanned = 0
+    categorized = 0
+    page_start = None
+    attempts = 0
+    while True:
+        page_query = query.limit(APPLY_BATCH_SIZE)
+        if page_start is not None:
+            page_query = page_query.start_after(page_start)
+        docs = list(page_query.stream())
+        if not docs:
+            break
+
+        batch = Batch()
+        category_adjustments = {}
+        touched_dates = set()
+        page_categorized = 0
+        for doc in docs:
+            transaction_data = doc.to_dict()
+            category_id = matcher.match(transaction_data)
+            if category_id is None:
+                continue
+            batch.update(doc.reference, {"category_id": category_id}, option=db.write_option(last_update_time=doc.update_time))
+            category_adjustments[category_id] = category_adjustments.get(category_id, 0.0) + transaction_data.get("amount", 0.0)
+            touched_dates.add(transaction_data.get("date"))
+            page_categorized += 1
+        if category_adjustments:
+            for category_id, adjustment in category_adjustments.items():
+                stage_available_change(batch, db.collection("categories").document(category_id), adjustment, shard_counts.get(category_id, 0))
+            invalidate_closed_snapshots(user_id, touched_dates, batch)
+            bump_data_version(user_id, batch)
+            try:
+                batch.commit()
+            except (FailedPrecondition, NotFound):
+                attempts += 1
+                if attempts < APPLY_PAGE_ATTEMPTS:
+                    # A transaction in the chunk changed since it was read, read the chunk again
+                    continue
+                logger.warning(f"Skipping a chunk of user {user_id}'s transactions that kept changing while rules were applied")
+                page_categorized = 0
+
+        attempts = 0
+        scanned += len(docs)
+        categorized += page_categorized
+        page_start = docs[-1]
+        if len(docs) < APPLY_BATCH_SIZE:
+            break
+
+    logger.info(f"Applied categorization rules for user {user_id}: {categorized}/{scanned} transactions categorized")
+    return {"scanned": scanned, "categorized": categorized}
@@ -1,7 +1,8 @@
-from fastapi import APIRouter, HTTPException
+from fastapi import APIRouter, HTTPException, Request, Response
 from pydantic import BaseModel
 from datetime import datetime, timezone
-from .db import db
+from .db import db, new_batch
+from .data_version import get_etag, etag_matches, not_modified, bump_data_version
 from backend.db.schemas import CategoryGroup as CategoryGroupSchema
 
 router = APIRouter()
@@ -43,11 +44,15 @@ async def create_category_group(request: CreateCategoryGroupRequest):
         )
         
         # Add to Firestore
-        doc_ref = db.collection(CategoryGroupSchema.collection_name()).add(category_group.to_dict())
+        doc_ref = db.collection(CategoryGroupSchema.collection_name()).document()
+        batch = new_batch()
+        batch.set(doc_ref, category_group.to_dict())
+        bump_data_version(request.user_id, batch)
+        batch.commit()
         
         return {
             "message": "Category group created successfully",
-            "category_group_id": doc_ref[1].id
+            "category_group_id": doc_ref.id
         }
     except ValueError as e:
         raise HTTPException(status_code=400, detail=str(e))
@@ -55,9 +60,15 @@ async def create_category_group(request: CreateCategoryGroupRequest):
         raise HTTPException(status_code=500, detail=f"Error creating category group: {str(e)}")
 
 @router.post("/get-category-groups")
-async def get_category_groups_by_user(request: UserIDRequest):
+async def get_category_groups_by_user(request: UserIDRequest, http_request: Request, response: Response):
     """Get all category groups for a user"""
     try:
+        # Answer conditional requests from the data version before querying Firestore
+        etag = get_etag(request.user_id, "category_groups")
+        if etag_matches(http_request, etag):
+            return not_modified(etag)
+        response.headers["ETag"] = etag
+
         # Query category groups by user_id
         category_groups_ref = db.collection(CategoryGroupSchema.collection_name())
         query = category_groups_ref.where("user_id", "==", request.user_id).order_by("sort_order")
@@ -99,7 +110,10 @@ async def delete_category_group(request: DeleteCategoryGroupRequest):
             )
         
         # Delete the category group
-        doc_ref.delete()
+        batch = new_batch()
+        batch.delete(doc_ref)
+        bump_data_version(request.user_id, batch)
+        batch.commit()
         
         return {"message": "Category group deleted successfully"}
     except HTTPException:
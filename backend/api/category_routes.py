@@ -1,24 +1,20 @@
-from fastapi import APIRouter, HTTPException
+from fastapi import APIRouter, HTTPException, Request, Response, BackgroundTasks
 from pydantic import BaseModel
 from datetime import datetime, timezone, timedelta, date
 from decimal import Decimal
 from typing import Optional
-from .db import db
+from .db import db, new_batch
+from .data_version import get_etag, etag_matches, not_modified, bump_data_version, get_data_version
+from .single_flight import single_flight
+from .budget_aggregates import compute_allocated_and_spent, compute_goal_progress
+from .period_snapshots import is_closed_period, get_snapshot, save_snapshot, snapshot_closed_periods, read_data_version, drop_stale_snapshots
+from .sharded_counters import read_balance
+from .cascade_delete import query_has_documents, count_documents, run_cascade, cascade_delete_category
 from backend.db.schemas import Category as CategorySchema
 import time
 
 router = APIRouter()
 
-# Helper function to get the next day for date range queries
-def get_next_day_str(date_str: str) -> str:
-    """
-    Takes a date string in YYYY-MM-DD format and returns the next day
-    in the same format, to be used for inclusive querying of the end date
-    """
-    date_obj = datetime.strptime(date_str, "%Y-%m-%d")
-    next_day = date_obj + timedelta(days=1)
-    return next_day.strftime("%Y-%m-%d")
-
 # Models
 class User(BaseModel):
     email: str
@@ -33,6 +29,10 @@ class CategoriesWithAllocatedRequest(BaseModel):
     start_date: str
     end_date: str
 
+class SnapshotClosedPeriodsRequest(BaseModel):
+    user_id: str
+    periods_back: int = 12
+
 class Category(BaseModel):
     name: str
     user_id: str
@@ -57,29 +57,42 @@ class UpdateCategoryGroupRequest(BaseModel):
     group_id: Optional[str] = None  # None means remove from group
 
 # Category Methods
+def list_categories(user_id: str) -> dict:
+    # logger.info("Fetching categories for user_id: %s", user_id)
+    
+    # Query categories with a `user` field equal to `user_ref`
+    # logger.info("Querying categories for user_ref: %s", user_id)
+    categories_query = db.collection("categories").where("user_id", "==", user_id)
+    categories_docs = categories_query.stream()
+    data_version = get_data_version(user_id)
+
+    # Collect categories into a list, converting each document to a dictionary
+    categories = []
+    for doc in categories_docs:
+        category_data = doc.to_dict()
+        category_data["id"] = doc.id  # Add the category ID to the response
+        # Sharded balances are summed here (and cached until the data version moves)
+        category_data["available"] = read_balance(doc.id, category_data, data_version)
+        
+        # Remove or handle any unserializable fields here, if necessary
+        
+        categories.append(category_data)
+
+    # logger.info("Successfully fetched categories for user_id: %s", user_id)
+    # logger.info("Categories: %s", categories)
+    return {"categories": categories}
+
 @router.post("/get-categories")
-async def get_categories(request: UserIDRequest):
+async def get_categories(request: UserIDRequest, http_request: Request, response: Response):
     try:
-        # logger.info("Fetching categories for user_id: %s", request.user_id)
-        
-        # Query categories with a `user` field equal to `user_ref`
-        # logger.info("Querying categories for user_ref: %s", request.user_id)
-        categories_query = db.collection("categories").where("user_id", "==", request.user_id)
-        categories_docs = categories_query.stream()
-
-        # Collect categories into a list, converting each document to a dictionary
-        categories = []
-        for doc in categories_docs:
-            category_data = doc.to_dict()
-            category_data["id"] = doc.id  # Add the category ID to the response
-            
-            # Remove or handle any unserializable fields here, if necessary
-            
-            categories.append(category_data)
+        # Answer conditional requests from the data version before querying Firestore
+        etag = get_etag(request.user_id, "categories")
+        if etag_matches(http_request, etag):
+            return not_modified(etag)
+        response.headers["ETag"] = etag
 
-        # logger.info("Successfully fetched categories for user_id: %s", request.user_id)
-        # logger.info("Categories: %s", categories)
-        return {"categories": categories}
+        # Identical concurrent requests share one Firestore query
+        return await single_flight(("get-categories", request.user_id, get_data_version(request.user_id)), list_categories, request.user_id)
     
     except Exception as e:
         # logger.error("Failed to get categories for user_id: %s, error: %s", request.user_id, e)
@@ -145,10 +158,27 @@ def read_from_cache(key: str) -> object:
     return gas_cache[key]['value']
 
 
+def load_allocated_and_spent(user_id: str, start_date: str, end_date: str) -> dict:
+    # Closed periods are frozen into a snapshot, so browsing history costs one read
+    if not is_closed_period(end_date):
+        return compute_allocated_and_spent(user_id, start_date, end_date)
+
+    # Read before computing, so a write landing meanwhile keeps the result from being frozen
+    version_doc = read_data_version(user_id)
+    if drop_stale_snapshots(user_id, version_doc):
+        version_doc = read_data_version(user_id)
+    response = get_snapshot(user_id, start_date, end_date)
+    if response is not None:
+        return response
+    response = compute_allocated_and_spent(user_id, start_date, end_date)
+    save_snapshot(user_id, start_date, end_date, response, version_doc)
+    return response
+
 @router.post("/get-allocated-and-spent")
 async def get_allocated_and_spent(request: CategoriesWithAllocatedRequest):
-    # hash request params
-    req_hash = hash(f'{request.user_id}{request.start_date}{request.end_date}')
+    # hash request params, with the data version so any write to the user's data misses
+    data_version = get_data_version(request.user_id)
+    req_hash = hash(f'{request.user_id}{request.start_date}{request.end_date}{data_version}')
     # print(f'req hash: {req_hash}')
     
     # if hash is in cache
@@ -166,117 +196,13 @@ async def get_allocated_and_spent(request: CategoriesWithAllocatedRequest):
             remove_from_cache(req_hash)
         
     try:
-        # Query categories with a `user_id` field equal to `request.user_id`
-        categories_query = db.collection("categories").where("user_id", "==", request.user_id)
-        categories_docs = categories_query.stream()
-        
-        # print(f"DEBUG - Categories query: {categories_query._query.to_dict()}")
-        
-        # Count categories for debugging
-        category_count = 0
-        
-        # Collect categories into a list, converting each document to a dictionary
-        allocated_and_spent = []
-        for doc in categories_docs:
-            category_count += 1
-            category_data = doc.to_dict()
-            # print(f"DEBUG - Processing category: {doc.id}, name: {category_data.get('name', 'Unknown')}")
-            
-            category_result = {}
-            category_result["category_id"] = doc.id  # Add the category ID to the response
-            
-            # Calculate allocated amount for the category
-            # Using helper function to get the next day for inclusive end date
-            next_day_str = get_next_day_str(request.end_date)
-            assignments_query = db.collection("assignments").where("category_id", "==", doc.id).where("date", ">=", request.start_date).where("date", "<", next_day_str)
-            # print(f"DEBUG - Using date range: {request.start_date} to {request.end_date} (exclusive upper bound: {next_day_str})")
+        # The budget and insights tabs ask for the same window at once on a cold cache
+        flight_key = ("get-allocated-and-spent", request.user_id, request.start_date, request.end_date, data_version)
+        response = await single_flight(flight_key, load_allocated_and_spent, request.user_id, request.start_date, request.end_date)
 
-            try:
-                # print(f"DEBUG - About to stream assignments for category {doc.id}")
-                assignments_docs = assignments_query.stream()
-                # print(f"DEBUG - Stream operation completed for category {doc.id}")
-                
-                # Count assignments for debugging
-                assignment_count = 0
-                assignment_total = Decimal('0.0')
-                
-                for assignment in assignments_docs:
-                    assignment_count += 1
-                    assignment_data = assignment.to_dict()
-                    # print(f"DEBUG - Assignment found: {assignment_data}")
-                    amount = Decimal(str(assignment_data.get("amount", 0.0)))
-                    assignment_total += amount
-                    # print(f"DEBUG - Running total: {assignment_total}")
-                
-                # print(f"DEBUG - Found {assignment_count} assignments for category {doc.id}")
-                allocated_amount = float(assignment_total)
-                
-            except Exception as stream_error:
-                # print(f"DEBUG - Error streaming assignments: {str(stream_error)}")
-                # Fallback to ensure we continue processing
-                allocated_amount = 0.0
-                
-            category_result["allocated"] = allocated_amount
-
-            # Calculate spent amount for the category (transactions in the time period)
-            spent_amount = Decimal('0.0')
-            try:
-                # Skip spending calculation for unallocated funds category
-                if not category_data.get("is_unallocated_funds", False):
-                    transactions_query = db.collection("transactions").where("category_id", "==", doc.id).where("date", ">=", request.start_date).where("date", "<", next_day_str)
-                    transactions_docs = transactions_query.stream()
-                    
-                    for transaction in transactions_docs:
-                        transaction_data = transaction.to_dict()
-                        amount = Decimal(str(transaction_data.get("amount", 0.0)))
-                        # If amount is negative, it's spending (add to total)
-                        # If amount is positive, it's a refund/return (subtract from total)
-                        if amount < 0:
-                            spent_amount += abs(amount)
-                        else:
-                            spent_amount -= amount
-                    
-                    # Allow negative spent amounts (when refunds exceed spending)
-                    
-            except Exception as spent_error:
-                # print(f"DEBUG - Error calculating spent amount: {str(spent_error)}")
-                spent_amount = Decimal('0.0')
-            
-            category_result["spent"] = float(spent_amount)
-            allocated_and_spent.append(category_result)
-
-        # print(f"DEBUG - Processed {category_count} categories, returning {len(allocated_and_spent)} allocation records")
-        
-        # Calculate unallocated funds (sum of transactions in unallocated funds category)
-        unallocated_income = Decimal('0.0')
-        try:
-            # Find the unallocated funds category for this user
-            unallocated_query = db.collection("categories").where("user_id", "==", request.user_id).where("is_unallocated_funds", "==", True).limit(1)
-            unallocated_docs = unallocated_query.stream()
-            
-            unallocated_category = None
-            for doc in unallocated_docs:
-                unallocated_category = doc
-                break
-            
-            if unallocated_category:
-                # Get transactions for the unallocated funds category within the date range
-                next_day_str = get_next_day_str(request.end_date)
-                unallocated_transactions_query = db.collection("transactions").where("category_id", "==", unallocated_category.id).where("date", ">=", request.start_date).where("date", "<", next_day_str)
-                unallocated_transactions_docs = unallocated_transactions_query.stream()
-                
-                # Sum up the transaction amounts (income should be positive)
-                for transaction in unallocated_transactions_docs:
-                    transaction_data = transaction.to_dict()
-                    amount = Decimal(str(transaction_data.get("amount", 0.0)))
-                    unallocated_income += amount
-                    
-        except Exception as unallocated_error:
-            # Don't fail the entire request if unallocated funds calculation fails
-            print(f"DEBUG - Error calculating unallocated funds: {str(unallocated_error)}")
-            unallocated_income = Decimal('0.0')
-        
-        response = {"allocated_and_spent": allocated_and_spent, "unallocated_income": float(unallocated_income)}
+        # Only the first of the coalesced requests adds the shared result to the cache
+        if req_hash in gas_cache:
+            return response
 
         # if size of cache plus size of val <= capacity
         if len(gas_cache) == capacity:
@@ -302,6 +228,28 @@ async def get_allocated_and_spent(request: CategoriesWithAllocatedRequest):
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Failed to get categories with allocated and spent amounts: {str(e)}")
 
+# Snapshot job: freeze the user's recently completed budget periods ahead of time
+@router.post("/snapshot-closed-periods")
+async def snapshot_closed_periods_route(request: SnapshotClosedPeriodsRequest):
+    try:
+        result = snapshot_closed_periods(request.user_id, request.periods_back)
+        return {"message": "Closed periods snapshotted successfully.", **result}
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Failed to snapshot closed periods: {str(e)}")
+
+# Goal progress and funding needed for every category in one call. Reuses the categories
+# and the grouped allocated/spent totals, including their snapshots and in-flight reads.
+@router.post("/get-goal-progress")
+async def get_goal_progress(request: CategoriesWithAllocatedRequest):
+    try:
+        data_version = get_data_version(request.user_id)
+        categories = await single_flight(("get-categories", request.user_id, data_version), list_categories, request.user_id)
+        flight_key = ("get-allocated-and-spent", request.user_id, request.start_date, request.end_date, data_version)
+        allocated_and_spent = await single_flight(flight_key, load_allocated_and_spent, request.user_id, request.start_date, request.end_date)
+        return compute_goal_progress(categories["categories"], allocated_and_spent)
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Failed to get goal progress: {str(e)}")
+
 @router.post("/create-category")
 async def create_category(category: Category):
     try:
@@ -320,7 +268,10 @@ async def create_category(category: Category):
         
         # logger.info("Creating a new category with name: %s", category.name)
         category_ref = db.collection("categories").document()
-        category_ref.set(category_data.to_dict())
+        batch = new_batch()
+        batch.set(category_ref, category_data.to_dict())
+        bump_data_version(category.user_id, batch)
+        batch.commit()
         
         # logger.info("Category created successfully with ID: %s", category_ref.id)
         return {"message": "Category created successfully.", "category_id": category_ref.id}
@@ -346,7 +297,10 @@ async def update_category_name(request: UpdateCategoryNameRequest):
             raise HTTPException(status_code=403, detail="Not authorized to update this category")
         
         # Update the category name
-        category_ref.update({"name": request.name})
+        batch = new_batch()
+        batch.update(category_ref, {"name": request.name})
+        bump_data_version(request.user_id, batch)
+        batch.commit()
         
         return {"message": "Category name updated successfully"}
     
@@ -375,7 +329,10 @@ async def update_category_goal(request: UpdateCategoryGoalRequest):
         
         # Update the category goal amount
         goal_amount = None if request.goal_amount == 0 else float(request.goal_amount)
-        category_ref.update({"goal_amount": goal_amount})
+        batch = new_batch()
+        batch.update(category_ref, {"goal_amount": goal_amount})
+        bump_data_version(request.user_id, batch)
+        batch.commit()
         
         return {"message": "Category goal updated successfully"}
     
@@ -411,7 +368,10 @@ async def update_category_group(request: UpdateCategoryGroupRequest):
                 raise HTTPException(status_code=403, detail="Not authorized to use this category group")
         
         # Update the category group
-        category_ref.update({"group_id": request.group_id})
+        batch = new_batch()
+        batch.update(category_ref, {"group_id": request.group_id})
+        bump_data_version(request.user_id, batch)
+        batch.commit()
         
         return {"message": "Category group updated successfully"}
     
@@ -421,7 +381,7 @@ async def update_category_group(request: UpdateCategoryGroupRequest):
         raise HTTPException(status_code=500, detail=f"Failed to update category group: {str(e)}")
 
 @router.post("/delete-category")
-async def delete_category(request: DeleteCategoryRequest):
+async def delete_category(request: DeleteCategoryRequest, background_tasks: BackgroundTasks):
     try:
         # Verify the category exists and belongs to the user
         category_ref = db.collection("categories").document(request.category_id)
@@ -434,35 +394,21 @@ async def delete_category(request: DeleteCategoryRequest):
         if category_data.get("user_id") != request.user_id:
             raise HTTPException(status_code=403, detail="Not authorized to delete this category")
         
-        # Check if any transactions use this category
+        # Check if any transactions use this category, reading at most one of them
         transactions_query = db.collection("transactions").where("category_id", "==", request.category_id)
-        transactions = list(transactions_query.stream())
-        
-        if transactions:
+        if query_has_documents(transactions_query):
             raise HTTPException(status_code=400, detail="Cannot delete category with associated transactions")
         
         # Check if category has non-zero available amount
-        available_amount = category_data.get("available", 0.0)
+        available_amount = read_balance(request.category_id, category_data)
         if available_amount != 0:
             raise HTTPException(status_code=400, detail="Cannot delete category with non-zero available amount. Please allocate or move the funds first.")
         
-        # Delete all assignments associated with this category
-        assignments_query = db.collection("assignments").where("category_id", "==", request.category_id)
-        assignments = list(assignments_query.stream())
-        
-        # Use batch write for atomicity
-        batch = db.batch()
-        
-        # Delete each assignment
-        for assignment_doc in assignments:
-            batch.delete(assignment_doc.reference)
-        
-        # Delete the category
-        batch.delete(category_ref)
-        
-        # Execute all deletions atomically
-        batch.commit()
-        return {"message": "Category deleted successfully"}
+        # Delete the category's assignments in chunks, in the background if there are many
+        assignments_count = count_documents(db.collection("assignments").where("category_id", "==", request.category_id), "delete_category.estimate")
+        result = run_cascade(background_tasks, request.user_id, "category", request.category_id, assignments_count, cascade_delete_category, request.user_id, request.category_id)
+        message = "Category deleted successfully" if result["status"] == "completed" else "Category deletion started"
+        return {"message": message, **result}
     
     except HTTPException as e:
         raise e
@@ -0,0 +1,77 @@
+from fastapi import Request, Response
+from google.cloud import firestore
+from .db import db
+import hashlib
+import time
+
+# Every user document carries a `data_version` counter that is bumped by every
+# mutating route. Read endpoints derive their ETag from it, so a client holding
+# the current ETag can be answered with a 304 before any query runs.
+
+# In-process cache of user_id -> data_version. Entries are dropped once a bump made by
+# this process commits. Every instance (and every worker) keeps its own cache, so a
+# bump committed elsewhere goes unnoticed by the cache for up to version_ttl seconds.
+# That is only acceptable for in-process caches keyed on the version (allocated/spent,
+# balances, rule matchers): ETags are built from a fresh read of the user doc, so a
+# client that just wrote through another instance never gets a stale 304. Reading the
+# version also refreshes the cache, so the caches used to build that response are
+# keyed on the current version too.
+version_cache = {}
+version_ttl = 30
+
+def get_data_version(user_id: str, fresh: bool = False) -> int:
+    """Return the user's data version, reading the user doc only on a cache miss or when fresh"""
+    entry = version_cache.get(user_id)
+    now = time.perf_counter()
+    if not fresh and entry and now < entry['expiration_time']:
+        return entry['value']
+
+    user_doc = db.collection("users").document(user_id).get(field_paths=["data_version"])
+    version = 0
+    if user_doc.exists:
+        version = (user_doc.to_dict() or {}).get("data_version", 0)
+
+    version_cache[user_id] = {
+        'value': version,
+        'expiration_time': now + version_ttl
+    }
+    return version
+
+def bump_data_version(user_id: str, batch=None) -> None:
+    """
+    Increment the user's data version. When a batch is given (a db.Batch) the increment
+    is staged in it so the bump commits atomically with the mutation, and the cached
+    version is dropped once that commit succeeds.
+    """
+    user_ref = db.collection("users").document(user_id)
+    update = {"data_version": firestore.Increment(1)}
+    if batch is not None:
+        batch.set(user_ref, update, merge=True)
+        batch.after_commit(lambda: version_cache.pop(user_id, None))
+    else:
+        user_ref.set(update, merge=True)
+        version_cache.pop(user_id, None)
+
+def make_etag(user_id: str, version: int, *scope) -> str:
+    """Build a weak ETag for one user's resource at the given data version"""
+    digest = hashlib.sha1("|".join([user_id, *[str(part) for part in scope]]).encode()).hexdigest()[:16]
+    return f'W/"{version}-{digest}"'
+
+def get_etag(user_id: str, *scope) -> str:
+    """One point read of the user doc, still far cheaper than the query a 304 saves"""
+    return make_etag(user_id, get_data_version(user_id, fresh=True), *scope)
+
+def etag_matches(http_request: Request, etag: str) -> bool:
+    """Check the request's If-None-Match header against an ETag (weak comparison)"""
+    if_none_match = http_request.headers.get("if-none-match")
+    if not if_none_match:
+        return False
+    if if_none_match.strip() == "*":
+        return True
+    # Weak comparison ignores the W/ prefix on either side
+    opaque_tag = etag.removeprefix("W/")
+    candidates = [candidate.strip().removeprefix("W/") for candidate in if_none_match.split(",")]
+    return opaque_tag in candidates
+
+def not_modified(etag: str) -> Response:
+    return Response(status_code=304, headers={"ETag": etag})
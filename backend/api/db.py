@@ -1,13 +1,98 @@
 from google.cloud import firestore
 from google.oauth2 import service_account
+import contextvars
+import os
 
 # Path to your service account key file
 SERVICE_ACCOUNT_FILE = "./budgeting-app-firebase-adminsdk.json"
 
-# Initialize Firestore client
-credentials = service_account.Credentials.from_service_account_file(SERVICE_ACCOUNT_FILE)
-db = firestore.Client(credentials=credentials)
+# Initialize Firestore client. FIRESTORE_BACKEND=memory swaps in the in-process
+# stand-in used by the load-test harness.
+if os.getenv("FIRESTORE_BACKEND") == "memory":
+    from .memory_firestore import MemoryClient
+    db = MemoryClient()
+else:
+    credentials = service_account.Credentials.from_service_account_file(SERVICE_ACCOUNT_FILE)
+    db = firestore.Client(credentials=credentials)
 
 # Export constants for special Firestore values
 DELETE_FIELD = firestore.DELETE_FIELD
-NULL_VALUE = None  # Python's None will be stored as a null value in Firestore
\ No newline at end of file
+NULL_VALUE = None  # Python's None will be stored as a null value in Firestore
+
+# Set by the /batch endpoint when several route handlers should write through one
+# Firestore batch instead of committing their own
+shared_batch = contextvars.ContextVar("shared_batch", default=None)
+
+class Batch:
+    """
+    Wraps a WriteBatch so callbacks can run once its writes are committed, e.g. to drop
+    process caches of the data it changes. Dropping them when the write is only staged
+    would let a concurrent read cache the old state again before the commit lands.
+    """
+
+    def __init__(self):
+        self._batch = db.batch()
+        self._after_commit = []
+
+    def set(self, *args, **kwargs):
+        self._batch.set(*args, **kwargs)
+        return self
+
+    def update(self, *args, **kwargs):
+        self._batch.update(*args, **kwargs)
+        return self
+
+    def delete(self, *args, **kwargs):
+        self._batch.delete(*args, **kwargs)
+        return self
+
+    def create(self, *args, **kwargs):
+        self._batch.create(*args, **kwargs)
+        return self
+
+    def after_commit(self, callback) -> None:
+        """Run `callback` after the batch commits; not at all if the commit fails"""
+        self._after_commit.append(callback)
+
+    def commit(self):
+        result = self._batch.commit()
+        callbacks, self._after_commit = self._after_commit, []
+        for callback in callbacks:
+            callback()
+        return result
+
+class SharedBatch(Batch):
+    """
+    A Batch route handlers can stage writes into as usual. Their commit() calls are
+    deferred; the owner commits once with commit_shared(), which runs every handler's
+    after_commit callbacks. Background tasks the handlers start through
+    add_background_task are collected in `background_tasks` for the owner to schedule
+    once the commit succeeds.
+    """
+
+    def __init__(self):
+        super().__init__()
+        self.background_tasks = []
+
+    def commit(self):
+        # Deferred until every handler sharing the batch has run
+        return None
+
+    def commit_shared(self):
+        return Batch.commit(self)
+
+def new_batch():
+    """Return the shared batch for this request if there is one, otherwise a fresh Batch"""
+    return shared_batch.get() or Batch()
+
+def add_background_task(background_tasks, func, *args, **kwargs) -> None:
+    """
+    background_tasks.add_task, for tasks that read what the request wrote. Under a shared
+    batch the request's response is sent before its writes are committed, so the task
+    is handed to the batch owner instead and only runs if the commit succeeds.
+    """
+    batch = shared_batch.get()
+    if batch is not None:
+        batch.background_tasks.append((func, args, kwargs))
+    else:
+        background_tasks.add_task(func, *args, **kwargs)
@@ -14,6 +14,8 @@ sys.path.insert(0, os.getcwd())
 
 # Now import the database connection
 from api.db import db
+from api.sharded_counters import read_balance
+from api.aggregations import count_documents, sum_field, sums_by_group, read_costs
 
 # Load environment variables
 load_dotenv()
@@ -76,7 +78,22 @@ def get_assignments_for_user(user_id):
     
     return assignments
 
-def calculate_expected_available(category_id, transactions, assignments, is_unallocated_funds=False):
+def get_category_totals_for_user(user_id, category_ids):
+    """
+    Per-category transaction and assignment totals of a user, and the sum of all their
+    assignments, from server-side aggregations (streaming when unavailable)
+    """
+    transactions_query = db.collection("transactions").where("user_id", "==", user_id)
+    assignments_query = db.collection("assignments").where("user_id", "==", user_id)
+    return {
+        'transactions': {key: float(value) for key, value in sums_by_group(transactions_query, "category_id", category_ids, "amount", label="db_validation.transactions").items()},
+        'assignments': {key: float(value) for key, value in sums_by_group(assignments_query, "category_id", category_ids, "amount", label="db_validation.assignments").items()},
+        'all_assignments': float(sum_field(assignments_query, "amount", label="db_validation.assignments")),
+        'transaction_count': count_documents(transactions_query, label="db_validation.counts"),
+        'assignment_count': count_documents(assignments_query, label="db_validation.counts")
+    }
+
+def calculate_expected_available(category_id, totals, is_unallocated_funds=False):
     """
     Calculate what the available amount should be for a category based on transactions and assignments.
     
@@ -93,19 +110,15 @@ def calculate_expected_available(category_id, transactions, assignments, is_unal
     
     Note: Transaction amounts are stored as negative for expenses and positive for income.
     Assignment amounts are always positive (money being allocated TO a category).
+    `totals` comes from get_category_totals_for_user.
     """
     
     if is_unallocated_funds:
         # For unallocated funds: transactions assigned to it minus all assignments
-        total_transactions = 0.0
-        for transaction in transactions:
-            if transaction.get('category_id') == category_id:
-                total_transactions += transaction.get('amount', 0.0)
+        total_transactions = totals['transactions'].get(category_id, 0.0)
         
         # Sum ALL assignments for the user (regardless of category)
-        total_all_assignments = 0.0
-        for assignment in assignments:
-            total_all_assignments += assignment.get('amount', 0.0)
+        total_all_assignments = totals['all_assignments']
         
         # Unallocated available = transactions to unallocated - all assignments
         expected_available = total_transactions - total_all_assignments
@@ -114,16 +127,10 @@ def calculate_expected_available(category_id, transactions, assignments, is_unal
     else:
         # Regular category logic
         # Sum all assignments TO this category
-        total_assignments = 0.0
-        for assignment in assignments:
-            if assignment.get('category_id') == category_id:
-                total_assignments += assignment.get('amount', 0.0)
+        total_assignments = totals['assignments'].get(category_id, 0.0)
         
         # Sum all transaction amounts FOR this category
-        total_transactions = 0.0
-        for transaction in transactions:
-            if transaction.get('category_id') == category_id:
-                total_transactions += transaction.get('amount', 0.0)
+        total_transactions = totals['transactions'].get(category_id, 0.0)
         
         # Available = Assignments + Transactions
         # (Assignments add money, negative transactions subtract money, positive transactions add money)
@@ -159,14 +166,13 @@ def validate_database_integrity():
         
         print(f"\n--- Checking User: {user_email} (ID: {user_id}) ---")
         
-        # Get user's categories, transactions, and assignments
+        # Get user's categories, and their transaction and assignment totals
         categories = get_categories_for_user(user_id)
-        transactions = get_transactions_for_user(user_id)
-        assignments = get_assignments_for_user(user_id)
+        totals = get_category_totals_for_user(user_id, list(categories))
         
         print(f"  Categories: {len(categories)}")
-        print(f"  Transactions: {len(transactions)}")
-        print(f"  Assignments: {len(assignments)}")
+        print(f"  Transactions: {totals['transaction_count']}")
+        print(f"  Assignments: {totals['assignment_count']}")
         
         user_issues = []
         
@@ -175,17 +181,17 @@ def validate_database_integrity():
             summary_stats['total_categories_checked'] += 1
             
             category_name = category_data.get('name', 'Unknown')
-            stored_available = category_data.get('available', 0.0)
+            stored_available = read_balance(category_id, category_data)
             is_unallocated = category_data.get('is_unallocated_funds', False)
             
             # Calculate expected available amount
             if is_unallocated:
                 expected_available, total_assignments, total_transactions, total_all_assignments = calculate_expected_available(
-                    category_id, transactions, assignments, is_unallocated_funds=True
+                    category_id, totals, is_unallocated_funds=True
                 )
             else:
                 expected_available, total_assignments, total_transactions = calculate_expected_available(
-                    category_id, transactions, assignments, is_unallocated_funds=False
+                    category_id, totals, is_unallocated_funds=False
                 )
                 total_all_assignments = None  # Not applicable for regular categories
             
@@ -239,6 +245,12 @@ def validate_database_integrity():
     print(f"Categories with Issues: {summary_stats['categories_with_issues']}")
     print(f"Total Discrepancy Amount: ${summary_stats['total_discrepancy_amount']:.2f}")
     
+    # Reads billed for the totals, server-side aggregations vs streamed documents
+    print("\nREAD COST")
+    for label, paths in sorted(read_costs.items()):
+        for path, cost in paths.items():
+            print(f"  {label} ({path}): {cost['reads']} reads for {cost['documents']} documents in {cost['calls']} calls")
+    
     if all_issues:
         print(f"\n❌ Found {len(all_issues)} categories with availability discrepancies!")
         print("\nDETAILED ISSUES:")
@@ -271,6 +283,7 @@ def validate_database_integrity():
     results = {
         'validation_timestamp': timestamp.isoformat(),
         'summary': summary_stats,
+        'read_costs': read_costs,
         'issues': all_issues
     }
     
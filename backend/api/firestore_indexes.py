@@ -0,0 +1,91 @@
+from itertools import combinations
+from .transaction_filters import EQUALITY_FILTERS, index_fields
+from .period_snapshots import SNAPSHOT_COLLECTION
+from .request_profiler import PROFILES_COLLECTION
+import json
+
+# firestore.indexes.json, generated from the queries the backend runs. Queries on a
+# single field (ordered by document name at most) use Firestore's automatic
+# single-field indexes. Every query combining fields has a composite index here,
+# including equality-only ones Firestore could serve by merging single-field indexes,
+# so none of them depends on merging.
+#
+# The feed's amount-range filters sit next to its date order (and date range), so
+# they need Firestore's support for inequality filters on multiple fields.
+#
+# Regenerate after changing a query, from backend/ (the memory backend avoids
+# needing Firestore credentials just to import the query modules):
+#
+#     FIRESTORE_BACKEND=memory python -m api.firestore_indexes > firestore.indexes.json
+#     firebase deploy --only firestore:indexes
+
+# Period key equality filters that replace date ranges for whole months and pay periods
+PERIOD_KEY_FIELDS = ("period_month", "pay_period")
+# Collections summed per category over a budget window
+BUDGET_WINDOW_COLLECTIONS = ("assignments", "transactions")
+
+def ascending(*field_paths: str) -> list:
+    return [{"fieldPath": field_path, "order": "ASCENDING"} for field_path in field_paths]
+
+def transaction_feed_indexes() -> list:
+    """get-transactions: every supported filter combination (see transaction_filters.py)"""
+    indexes = []
+    for size in range(len(EQUALITY_FILTERS) + 1):
+        for equality_fields in combinations(EQUALITY_FILTERS, size):
+            for amount_range in (False, True):
+                indexes.append(("transactions", index_fields(equality_fields, amount_range)))
+    return indexes
+
+def budget_window_indexes() -> list:
+    """
+    A user's assignments and transactions in a window (budget_aggregates.py), by date
+    range or by period key, and the per-category amount sums over that window
+    (aggregations.sums_by_group). sum() reads the summed field from the index.
+    """
+    indexes = []
+    for collection in BUDGET_WINDOW_COLLECTIONS:
+        indexes.append((collection, ascending("user_id", "date")))
+        indexes.append((collection, ascending("user_id", "category_id", "date", "amount")))
+        for period_field in PERIOD_KEY_FIELDS:
+            indexes.append((collection, ascending("user_id", period_field)))
+            indexes.append((collection, ascending("user_id", period_field, "category_id", "amount")))
+    return indexes
+
+def other_query_indexes() -> list:
+    return [
+        # Invalidating the closed-period snapshots a backdated write makes stale
+        (SNAPSHOT_COLLECTION, ascending("user_id", "end_date")),
+        # Paging through uncategorized transactions when rules are applied to history
+        ("transactions", ascending("user_id", "category_id", "__name__")),
+        # A Plaid sync page's transactions stored under random ids (plaid_sync.py), and
+        # the merchants it touched (recurring_detection.py), both `in` queries
+        ("transactions", ascending("user_id", "plaid_transaction_id")),
+        ("transactions", ascending("user_id", "merchant_key")),
+        # Deleting a Plaid item's transactions, and those synced before plaid_item_id was
+        # stored (cascade_delete.py), in document name order
+        ("transactions", ascending("user_id", "plaid_item_id", "__name__")),
+        ("transactions", ascending("user_id", "institution_name", "__name__")),
+        # The user's Unallocated Funds category (sharded_counters.py)
+        ("categories", ascending("user_id", "is_unallocated_funds")),
+        # Category groups in display order
+        ("category_groups", ascending("user_id", "sort_order")),
+        # /admin/profiles filtered by route or user, newest first
+        (PROFILES_COLLECTION, ascending("route") + [{"fieldPath": "started_at", "order": "DESCENDING"}]),
+        (PROFILES_COLLECTION, ascending("user_id") + [{"fieldPath": "started_at", "order": "DESCENDING"}]),
+        (PROFILES_COLLECTION, ascending("route", "user_id") + [{"fieldPath": "started_at", "order": "DESCENDING"}]),
+    ]
+
+def build_index_manifest() -> dict:
+    """firestore.indexes.json with a composite index for every query that needs one"""
+    indexes = []
+    seen = set()
+    for collection, fields in transaction_feed_indexes() + budget_window_indexes() + other_query_indexes():
+        key = (collection, tuple((field["fieldPath"], field["order"]) for field in fields))
+        if key in seen:
+            continue
+        seen.add(key)
+        indexes.append({"collectionGroup": collection, "queryScope": "COLLECTION", "fields": fields})
+    return {"indexes": indexes, "fieldOverrides": []}
+
+if __name__ == "__main__":
+    print(json.dumps(build_index_manifest(), indent=2))
@@ -1,9 +1,26 @@
-from fastapi import APIRouter
+from fastapi import APIRouter, Response
 from datetime import datetime, timezone
 from pydantic import BaseModel
+from urllib.parse import urlparse
+from .db import db
+from .single_flight import single_flight
+from .plaid_utils import configuration as plaid_configuration
+import asyncio
+import socket
+import time
 
 router = APIRouter()
 
+# Readiness probes. Each dependency gets a short timeout, and probe results (failures
+# included) are cached for a few seconds and shared by concurrent checks, so however
+# often the load balancer polls, each worker costs Firestore at most one document read
+# per PROBE_CACHE_SECONDS.
+PROBE_TIMEOUT_SECONDS = 2.0
+PROBE_CACHE_SECONDS = 5.0
+HEALTH_COLLECTION = "health"
+# probe name -> (expires_at, result)
+probe_cache = {}
+
 class HealthResponse(BaseModel):
     status: str
     timestamp: str
@@ -26,3 +43,59 @@ def ping():
     Simple ping endpoint for basic connectivity checks.
     """
     return {"ping": "pong"}
+
+def probe_firestore() -> dict:
+    """One document read; the document does not need to exist"""
+    db.collection(HEALTH_COLLECTION).document("probe").get(field_paths=[], timeout=PROBE_TIMEOUT_SECONDS)
+    return {}
+
+def probe_plaid() -> dict:
+    """Plaid credentials are configured and the Plaid host accepts connections. No API call is made."""
+    if not plaid_configuration.api_key.get("clientId") or not plaid_configuration.api_key.get("secret"):
+        raise ValueError("Plaid client id or secret is not configured")
+    host = urlparse(plaid_configuration.host)
+    port = host.port or (443 if host.scheme == "https" else 80)
+    with socket.create_connection((host.hostname, port), timeout=PROBE_TIMEOUT_SECONDS):
+        pass
+    return {"host": host.hostname}
+
+PROBES = {"firestore": probe_firestore, "plaid": probe_plaid}
+# Without Firestore no route works. Without Plaid only linking and syncing banks fail,
+# which is no reason to take the instance out of rotation; it reports `degraded`.
+REQUIRED_PROBES = ("firestore",)
+
+async def run_probe(name: str) -> dict:
+    cached = probe_cache.get(name)
+    if cached and cached[0] > time.monotonic():
+        return {**cached[1], "cached": True}
+
+    start = time.perf_counter()
+    try:
+        detail = await asyncio.wait_for(single_flight(("health-probe", name), PROBES[name]), PROBE_TIMEOUT_SECONDS)
+        result = {"status": "ok", **detail}
+    except asyncio.TimeoutError:
+        result = {"status": "timeout", "error": f"No answer within {PROBE_TIMEOUT_SECONDS}s"}
+    except Exception as e:
+        result = {"status": "error", "error": str(e)}
+    result["latency_ms"] = round((time.perf_counter() - start) * 1000, 1)
+    probe_cache[name] = (time.monotonic() + PROBE_CACHE_SECONDS, result)
+    return {**result, "cached": False}
+
+@router.get("/ready")
+async def readiness_check(response: Response):
+    """
+    Readiness for the load balancer, with each dependency's status and probe latency:
+    200 `ready` when every dependency is usable from this instance, 200 `degraded` when
+    only optional ones (Plaid) are not, 503 `not_ready` when a required one (Firestore) is not.
+    """
+    results = await asyncio.gather(*(run_probe(name) for name in PROBES))
+    checks = {name: {**result, "required": name in REQUIRED_PROBES} for name, result in zip(PROBES, results)}
+    ready = all(check["status"] == "ok" for check in checks.values() if check["required"])
+    degraded = ready and any(check["status"] != "ok" for check in checks.values())
+    if not ready:
+        response.status_code = 503
+    return {
+        "status": "degraded" if degraded else "ready" if ready else "not_ready",
+        "timestamp": datetime.now(timezone.utc).isoformat(),
+        "checks": checks
+    }
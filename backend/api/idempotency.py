@@ -0,0 +1,87 @@
+from fastapi import HTTPException
+from google.api_core.exceptions import AlreadyExists, Conflict
+from datetime import datetime, timezone, timedelta
+from typing import Optional
+from fastapi.encoders import jsonable_encoder
+from .db import db
+import hashlib
+import json
+
+# Responses of create/mutation routes are stored under the client's Idempotency-Key
+# so a retried request is answered from one document read instead of re-executing.
+# The key document is written in the same batch as the mutation with create(),
+# so two racing duplicates cannot both commit.
+#
+# The key document also holds a fingerprint of the request body. A key reused with a
+# different body is a client bug; it gets a 422 instead of the first request's response.
+#
+# Firestore deletes expired keys through a TTL policy on `expires_at`
+# (gcloud firestore fields ttls update expires_at --collection-group=idempotency_keys).
+IDEMPOTENCY_COLLECTION = "idempotency_keys"
+idempotency_ttl = timedelta(hours=24)
+MAX_KEY_LENGTH = 255
+
+def get_idempotency_ref(user_id: str, route: str, key: Optional[str]):
+    """Return the key document reference, or None when the client sent no key"""
+    if not key:
+        return None
+    if len(key) > MAX_KEY_LENGTH:
+        raise HTTPException(status_code=400, detail=f"Idempotency-Key cannot be longer than {MAX_KEY_LENGTH} characters")
+    # Keys are scoped per user and route so clients only need them to be unique locally
+    doc_id = hashlib.sha256(f"{user_id}:{route}:{key}".encode()).hexdigest()
+    return db.collection(IDEMPOTENCY_COLLECTION).document(doc_id)
+
+def request_fingerprint(request) -> str:
+    """sha256 of the canonical JSON of a request body (a Pydantic model or a dict)"""
+    body = json.dumps(jsonable_encoder(request), sort_keys=True, separators=(",", ":"))
+    return hashlib.sha256(body.encode()).hexdigest()
+
+def lookup_idempotent_response(key_ref, request) -> Optional[dict]:
+    """
+    Return the stored response for a repeated key, or None if the request should run.
+    Raises a 422 when the key was first used with a different request body.
+    """
+    if key_ref is None:
+        return None
+
+    key_doc = key_ref.get()
+    if not key_doc.exists:
+        return None
+
+    key_data = key_doc.to_dict()
+    if key_data["expires_at"] <= datetime.now(timezone.utc):
+        # TTL deletion can lag by a day, clear it so the key can be recorded again
+        key_ref.delete()
+        return None
+
+    if key_data.get("request_hash") != request_fingerprint(request):
+        raise HTTPException(status_code=422, detail="Idempotency-Key was already used with a different request body")
+    return key_data["response"]
+
+def record_idempotent_response(batch, key_ref, user_id: str, route: str, request, response: dict) -> None:
+    """Stage the response in the mutation's batch so both commit together"""
+    if key_ref is None:
+        return
+    now = datetime.now(timezone.utc)
+    batch.create(key_ref, {
+        # Lets deleting the user remove their keys before the TTL does
+        "user_id": user_id,
+        "route": route,
+        "request_hash": request_fingerprint(request),
+        "response": response,
+        "created_at": now,
+        "expires_at": now + idempotency_ttl
+    })
+
+def commit_idempotent(batch, key_ref, request) -> Optional[dict]:
+    """
+    Commit the batch. If a concurrent request with the same key committed first,
+    nothing from this batch is written and the winner's response is returned instead.
+    """
+    try:
+        batch.commit()
+        return None
+    except (AlreadyExists, Conflict):
+        if key_ref is None:
+            raise
+        return lookup_idempotent_response(key_ref, request)
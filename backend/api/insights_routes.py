@@ -0,0 +1,124 @@
+from fastapi import APIRouter, HTTPException, Request, Response
+from pydantic import BaseModel
+from decimal import Decimal
+from .data_version import get_etag, etag_matches, not_modified, get_data_version
+from .single_flight import single_flight
+from .period_keys import get_window_filter
+from .budget_aggregates import user_window_query
+import logging
+
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+router = APIRouter()
+
+# Fields the breakdown reads from each transaction in the window
+BREAKDOWN_FIELDS = ["amount", "personal_finance_category", "merchant_name", "merchant_key", "name"]
+# Transactions without a Plaid personal finance category (manual ones, older syncs)
+UNCLASSIFIED = "UNCLASSIFIED"
+DEFAULT_TOP_MERCHANTS = 10
+# (user_id, start_date, end_date) -> (data_version, breakdown). Entries go stale when the
+# user's data version moves; the oldest are dropped past the cap.
+breakdown_cache = {}
+BREAKDOWN_CACHE_SIZE = 256
+
+class SpendingBreakdownRequest(BaseModel):
+    user_id: str
+    start_date: str
+    end_date: str
+    top_merchants: int = DEFAULT_TOP_MERCHANTS
+
+def add_spend(groups: dict, key: str, amount: Decimal, **details) -> dict:
+    group = groups.get(key)
+    if group is None:
+        group = groups[key] = {**details, "spent": Decimal('0.0'), "count": 0}
+    group["spent"] += amount
+    group["count"] += 1
+    return group
+
+def sorted_groups(groups: dict, key_name: str, limit: int = None) -> list:
+    items = sorted(groups.items(), key=lambda item: item[1]["spent"], reverse=True)
+    if limit is not None:
+        items = items[:limit]
+    return [{key_name: key, **group, "spent": float(group["spent"])} for key, group in items]
+
+def compute_spending_breakdown(user_id: str, start_date: str, end_date: str) -> dict:
+    """
+    Spending in a window per primary and detailed Plaid personal finance category, and
+    per merchant, from one pass over the window's transactions. Spending is money out
+    (negative amounts, reported positive); money in is only totalled.
+    """
+    window_filter = get_window_filter(user_id, start_date, end_date)
+    query = user_window_query("transactions", user_id, start_date, end_date, window_filter).select(BREAKDOWN_FIELDS)
+
+    primary = {}
+    merchants = {}
+    total_spent = Decimal('0.0')
+    total_inflow = Decimal('0.0')
+    for doc in query.stream():
+        transaction = doc.to_dict()
+        amount = Decimal(str(transaction.get("amount", 0.0)))
+        if amount >= 0:
+            total_inflow += amount
+            continue
+        spent = -amount
+        total_spent += spent
+
+        pfc = transaction.get("personal_finance_category") or {}
+        primary_name = pfc.get("primary") or UNCLASSIFIED
+        primary_group = add_spend(primary, primary_name, spent, detailed={})
+        add_spend(primary_group["detailed"], pfc.get("detailed") or primary_name, spent)
+
+        merchant_key = transaction.get("merchant_key") or transaction.get("name")
+        if merchant_key:
+            add_spend(merchants, merchant_key, spent, merchant_name=transaction.get("merchant_name") or transaction.get("name"))
+
+    categories = []
+    for group in sorted_groups(primary, "primary"):
+        group["detailed"] = sorted_groups(group["detailed"], "detailed")
+        categories.append(group)
+
+    return {
+        "start_date": start_date,
+        "end_date": end_date,
+        "total_spent": float(total_spent),
+        "total_inflow": float(total_inflow),
+        "categories": categories,
+        # All merchants ranked; the route trims them to the requested count
+        "merchants": sorted_groups(merchants, "merchant_key")
+    }
+
+def load_spending_breakdown(user_id: str, start_date: str, end_date: str, data_version: int) -> dict:
+    key = (user_id, start_date, end_date)
+    cached = breakdown_cache.get(key)
+    if cached and cached[0] == data_version:
+        return cached[1]
+
+    breakdown = compute_spending_breakdown(user_id, start_date, end_date)
+    breakdown_cache.pop(key, None)
+    breakdown_cache[key] = (data_version, breakdown)
+    while len(breakdown_cache) > BREAKDOWN_CACHE_SIZE:
+        breakdown_cache.pop(next(iter(breakdown_cache)))
+    return breakdown
+
+# Spend per personal finance category and top merchants for the insights tab
+@router.post("/get-spending-breakdown")
+async def get_spending_breakdown(request: SpendingBreakdownRequest, http_request: Request, response: Response):
+    try:
+        if request.start_date > request.end_date:
+            raise HTTPException(status_code=400, detail="start_date is after end_date")
+
+        etag = get_etag(request.user_id, "spending-breakdown", request.start_date, request.end_date, request.top_merchants)
+        if etag_matches(http_request, etag):
+            return not_modified(etag)
+        response.headers["ETag"] = etag
+
+        data_version = get_data_version(request.user_id)
+        flight_key = ("get-spending-breakdown", request.user_id, request.start_date, request.end_date, data_version)
+        breakdown = await single_flight(flight_key, load_spending_breakdown, request.user_id, request.start_date, request.end_date, data_version)
+        return {**breakdown, "merchants": breakdown["merchants"][:max(request.top_merchants, 0)]}
+
+    except HTTPException as e:
+        raise e
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Failed to get spending breakdown: {str(e)}")
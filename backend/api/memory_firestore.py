@@ -0,0 +1,437 @@
+from google.api_core.exceptions import AlreadyExists, NotFound, FailedPrecondition
+from google.cloud import firestore
+from datetime import datetime, timezone
+import contextvars
+import copy
+import random
+import string
+import threading
+
+# In-process stand-in for the subset of the Firestore client this API uses, selected
+# with FIRESTORE_BACKEND=memory (see db.py). It exists for the load-test harness:
+# queries behave like Firestore's (filters, ordering, cursors, projections, transforms)
+# and every read and write is counted so the harness can report amplification.
+
+# Totals for the whole process, and per unit of work when the caller sets op_counts
+op_totals = {"reads": 0, "writes": 0}
+op_counts = contextvars.ContextVar("op_counts", default=None)
+
+counts_lock = threading.Lock()
+
+def count_ops(reads: int = 0, writes: int = 0) -> None:
+    with counts_lock:
+        op_totals["reads"] += reads
+        op_totals["writes"] += writes
+        counts = op_counts.get()
+        if counts is not None:
+            counts["reads"] += reads
+            counts["writes"] += writes
+
+def generate_id() -> str:
+    return "".join(random.choices(string.ascii_letters + string.digits, k=20))
+
+# Firestore orders values of different types by type first
+TYPE_ORDER = [type(None), bool, (int, float), datetime, str, bytes, list, dict]
+
+def sort_key(value):
+    if isinstance(value, datetime) and value.tzinfo is None:
+        value = value.replace(tzinfo=timezone.utc)
+    for rank, types in enumerate(TYPE_ORDER):
+        if isinstance(value, types) and not (types == (int, float) and isinstance(value, bool)):
+            if isinstance(value, (list, dict)):
+                return (rank, repr(value))
+            return (rank, value)
+    return (len(TYPE_ORDER), repr(value))
+
+MISSING = object()
+
+def get_field(data: dict, field_path: str):
+    value = data
+    for part in field_path.split("."):
+        if not isinstance(value, dict) or part not in value:
+            return MISSING
+        value = value[part]
+    return value
+
+def set_field(data: dict, field_path: str, value) -> None:
+    parts = field_path.split(".")
+    for part in parts[:-1]:
+        if not isinstance(data.get(part), dict):
+            data[part] = {}
+        data = data[part]
+    if value is firestore.DELETE_FIELD:
+        data.pop(parts[-1], None)
+    else:
+        data[parts[-1]] = value
+
+def resolve_value(current, value):
+    """Apply Firestore sentinels and transforms to the value being written over `current`"""
+    if isinstance(value, firestore.Increment):
+        base = current if isinstance(current, (int, float)) and not isinstance(current, bool) else 0
+        return base + value.value
+    if value is firestore.SERVER_TIMESTAMP:
+        return datetime.now(timezone.utc)
+    if isinstance(value, firestore.ArrayUnion):
+        base = list(current) if isinstance(current, list) else []
+        return base + [item for item in value.values if item not in base]
+    if isinstance(value, firestore.ArrayRemove):
+        return [item for item in current if item not in value.values] if isinstance(current, list) else []
+    return copy.deepcopy(value)
+
+def merge_into(target: dict, data: dict) -> None:
+    for key, value in data.items():
+        if isinstance(value, dict) and isinstance(target.get(key), dict):
+            merge_into(target[key], value)
+        elif value is firestore.DELETE_FIELD:
+            target.pop(key, None)
+        else:
+            target[key] = resolve_value(target.get(key), value)
+
+def project(data: dict, field_paths) -> dict:
+    if field_paths is None:
+        return copy.deepcopy(data)
+    projected = {}
+    for field_path in field_paths:
+        value = get_field(data, field_path)
+        if value is not MISSING:
+            set_field(projected, field_path, copy.deepcopy(value))
+    return projected
+
+class MemoryDocumentSnapshot:
+    def __init__(self, reference, data, update_time=None):
+        self.reference = reference
+        self._data = data
+        self.update_time = update_time
+
+    @property
+    def id(self) -> str:
+        return self.reference.id
+
+    @property
+    def exists(self) -> bool:
+        return self._data is not None
+
+    def to_dict(self):
+        return copy.deepcopy(self._data) if self._data is not None else None
+
+    def get(self, field_path: str):
+        value = get_field(self._data or {}, field_path)
+        if value is MISSING:
+            raise KeyError(field_path)
+        return copy.deepcopy(value)
+
+class MemoryAggregationResult:
+    def __init__(self, alias: str, value):
+        self.alias = alias
+        self.value = value
+
+class MemoryAggregationQuery:
+    def __init__(self, query):
+        self._query = query
+        self._aggregations = []
+
+    def count(self, alias=None):
+        self._aggregations.append(("count", None, alias or "count"))
+        return self
+
+    def sum(self, field_path: str, alias=None):
+        self._aggregations.append(("sum", field_path, alias or "sum"))
+        return self
+
+    def get(self):
+        matches = self._query._matching_documents()
+        # Aggregations are billed one read per 1000 index entries
+        count_ops(reads=max(1, (len(matches) + 999) // 1000))
+        results = []
+        for kind, field_path, alias in self._aggregations:
+            if kind == "count":
+                results.append(MemoryAggregationResult(alias, len(matches)))
+            else:
+                # sum() skips documents whose field is missing or not a number
+                values = [get_field(data, field_path) for _, data, _ in matches]
+                numbers = [value for value in values if isinstance(value, (int, float)) and not isinstance(value, bool)]
+                results.append(MemoryAggregationResult(alias, sum(numbers)))
+        return [results]
+
+class MemoryQuery:
+    def __init__(self, client, collection: str, filters=None, orders=None, limit=None, cursor=None, fields=None):
+        self._client = client
+        self._collection = collection
+        self._filters = filters or []
+        self._orders = orders or []
+        self._limit = limit
+        self._cursor = cursor
+        self._fields = fields
+
+    def _copy(self, **changes):
+        values = {
+            "filters": list(self._filters),
+            "orders": list(self._orders),
+            "limit": self._limit,
+            "cursor": self._cursor,
+            "fields": self._fields,
+        }
+        values.update(changes)
+        return MemoryQuery(self._client, self._collection, **values)
+
+    def where(self, field_path: str, op_string: str, value):
+        return self._copy(filters=self._filters + [(field_path, op_string, value)])
+
+    def order_by(self, field_path: str, direction: str = "ASCENDING"):
+        return self._copy(orders=self._orders + [(field_path, direction)])
+
+    def limit(self, count: int):
+        return self._copy(limit=count)
+
+    def start_after(self, document_snapshot):
+        return self._copy(cursor=document_snapshot)
+
+    def select(self, field_paths):
+        return self._copy(fields=list(field_paths))
+
+    def count(self, alias=None):
+        return MemoryAggregationQuery(self).count(alias)
+
+    def sum(self, field_path: str, alias=None):
+        return MemoryAggregationQuery(self).sum(field_path, alias)
+
+    def _effective_orders(self):
+        orders = list(self._orders)
+        ordered_fields = {field for field, _ in orders}
+        # An inequality filter implicitly orders by its field first
+        for field, op_string, _ in self._filters:
+            if op_string in ("<", "<=", ">", ">=", "!=", "not-in") and field not in ordered_fields:
+                orders.insert(0, (field, "ASCENDING"))
+                ordered_fields.add(field)
+        if "__name__" not in ordered_fields:
+            orders.append(("__name__", orders[-1][1] if orders else "ASCENDING"))
+        return orders
+
+    @staticmethod
+    def _matches(doc_id: str, data: dict, field_path: str, op_string: str, value) -> bool:
+        actual = doc_id if field_path == "__name__" else get_field(data, field_path)
+        if actual is MISSING:
+            return False
+        if op_string == "==":
+            if isinstance(actual, bool) or isinstance(value, bool):
+                return actual is value
+            return actual == value
+        if op_string == "!=":
+            return actual != value and actual is not None
+        if op_string == "in":
+            return actual in value
+        if op_string == "not-in":
+            return actual not in value and actual is not None
+        if op_string == "array_contains":
+            return isinstance(actual, list) and value in actual
+        if op_string == "array_contains_any":
+            return isinstance(actual, list) and any(item in actual for item in value)
+        # Range filters only match values of the same type
+        if sort_key(actual)[0] != sort_key(value)[0]:
+            return False
+        if op_string == "<":
+            return sort_key(actual) < sort_key(value)
+        if op_string == "<=":
+            return sort_key(actual) <= sort_key(value)
+        if op_string == ">":
+            return sort_key(actual) > sort_key(value)
+        if op_string == ">=":
+            return sort_key(actual) >= sort_key(value)
+        raise ValueError(f"Unsupported operator {op_string}")
+
+    def _order_values(self, doc_id: str, data: dict, orders):
+        values = []
+        for field, _ in orders:
+            values.append(sort_key(doc_id if field == "__name__" else get_field(data, field)))
+        return values
+
+    def _matching_documents(self):
+        with self._client._lock:
+            update_times = self._client._update_times
+            documents = [
+                (doc_id, copy.deepcopy(data), update_times.get((self._collection, doc_id)))
+                for doc_id, data in self._client._store.get(self._collection, {}).items()
+            ]
+
+        matches = [
+            item for item in documents
+            if all(self._matches(item[0], item[1], *query_filter) for query_filter in self._filters)
+        ]
+        orders = self._effective_orders()
+        # Ordering by a field excludes documents that do not have it
+        matches = [
+            item for item in matches
+            if all(field == "__name__" or get_field(item[1], field) is not MISSING for field, _ in orders)
+        ]
+        for index in reversed(range(len(orders))):
+            field, direction = orders[index]
+            matches.sort(key=lambda item: self._order_values(item[0], item[1], [orders[index]]), reverse=direction == "DESCENDING")
+
+        if self._cursor is not None:
+            cursor_values = self._order_values(self._cursor.id, self._cursor._data or {}, orders)
+            def after_cursor(item) -> bool:
+                for value, cursor_value, (_, direction) in zip(self._order_values(item[0], item[1], orders), cursor_values, orders):
+                    if value == cursor_value:
+                        continue
+                    return value > cursor_value if direction != "DESCENDING" else value < cursor_value
+                return False
+            matches = [item for item in matches if after_cursor(item)]
+
+        if self._limit is not None:
+            matches = matches[:self._limit]
+        return matches
+
+    def stream(self):
+        matches = self._matching_documents()
+        # A query is billed at least one read even when it returns nothing
+        count_ops(reads=max(1, len(matches)))
+        collection = self._client.collection(self._collection)
+        for doc_id, data, update_time in matches:
+            yield MemoryDocumentSnapshot(collection.document(doc_id), project(data, self._fields), update_time)
+
+    def get(self):
+        return list(self.stream())
+
+class MemoryDocumentReference:
+    def __init__(self, client, collection: str, doc_id: str):
+        self._client = client
+        self._collection = collection
+        self.id = doc_id
+
+    @property
+    def path(self) -> str:
+        return f"{self._collection}/{self.id}"
+
+    def get(self, field_paths=None, timeout=None):
+        count_ops(reads=1)
+        with self._client._lock:
+            data = self._client._store.get(self._collection, {}).get(self.id)
+            data = project(data, field_paths) if data is not None else None
+            update_time = self._client._update_times.get((self._collection, self.id))
+        return MemoryDocumentSnapshot(self, data, update_time)
+
+    def set(self, document_data: dict, merge: bool = False):
+        self._client.batch().set(self, document_data, merge=merge).commit()
+
+    def update(self, field_updates: dict, option=None):
+        self._client.batch().update(self, field_updates, option=option).commit()
+
+    def create(self, document_data: dict):
+        self._client.batch().create(self, document_data).commit()
+
+    def delete(self):
+        self._client.batch().delete(self).commit()
+
+    def collection(self, collection_id: str):
+        return MemoryCollectionReference(self._client, f"{self.path}/{collection_id}")
+
+class MemoryCollectionReference(MemoryQuery):
+    def __init__(self, client, collection: str):
+        super().__init__(client, collection)
+        self.id = collection
+
+    def document(self, document_id=None):
+        return MemoryDocumentReference(self._client, self._collection, document_id or generate_id())
+
+class MemoryWriteBatch:
+    def __init__(self, client):
+        self._client = client
+        self._writes = []
+
+    def set(self, reference, document_data: dict, merge: bool = False):
+        self._writes.append(("set", reference, document_data, merge, None))
+        return self
+
+    def update(self, reference, field_updates: dict, option=None):
+        self._writes.append(("update", reference, field_updates, False, option))
+        return self
+
+    def create(self, reference, document_data: dict):
+        self._writes.append(("create", reference, document_data, False, None))
+        return self
+
+    def delete(self, reference):
+        self._writes.append(("delete", reference, None, False, None))
+        return self
+
+    def commit(self):
+        """Apply every write or none of them, like a Firestore batch"""
+        with self._client._lock:
+            store = self._client._store
+            staged = {}
+
+            def current(reference):
+                key = (reference._collection, reference.id)
+                if key in staged:
+                    return staged[key]
+                return copy.deepcopy(store.get(reference._collection, {}).get(reference.id))
+
+            for op, reference, data, merge, option in self._writes:
+                key = (reference._collection, reference.id)
+                existing = current(reference)
+                if op == "create":
+                    if existing is not None:
+                        raise AlreadyExists(f"Document already exists: {reference.path}")
+                    new_data = {}
+                    merge_into(new_data, data)
+                elif op == "set":
+                    new_data = existing if merge and existing is not None else {}
+                    merge_into(new_data, data)
+                elif op == "update":
+                    if existing is None:
+                        raise NotFound(f"No document to update: {reference.path}")
+                    if option is not None and self._client._update_times.get(key) != option.last_update_time:
+                        raise FailedPrecondition(f"Document was updated since it was read: {reference.path}")
+                    new_data = existing
+                    for field_path, value in data.items():
+                        existing_value = get_field(new_data, field_path)
+                        set_field(new_data, field_path, resolve_value(None if existing_value is MISSING else existing_value, value) if value is not firestore.DELETE_FIELD else value)
+                else:
+                    new_data = None
+                staged[key] = new_data
+
+            commit_time = datetime.now(timezone.utc)
+            for (collection, doc_id), data in staged.items():
+                documents = store.setdefault(collection, {})
+                if data is None:
+                    documents.pop(doc_id, None)
+                    self._client._update_times.pop((collection, doc_id), None)
+                else:
+                    documents[doc_id] = data
+                    self._client._update_times[(collection, doc_id)] = commit_time
+
+        count_ops(writes=len(self._writes))
+        return []
+
+class MemoryWriteOption:
+    """Precondition of an update, from MemoryClient.write_option"""
+
+    def __init__(self, last_update_time):
+        self.last_update_time = last_update_time
+
+class MemoryClient:
+    def __init__(self):
+        self._store = {}
+        self._update_times = {}
+        self._lock = threading.RLock()
+
+    def collection(self, collection_path: str):
+        return MemoryCollectionReference(self, collection_path)
+
+    def batch(self):
+        return MemoryWriteBatch(self)
+
+    def write_option(self, last_update_time=None):
+        return MemoryWriteOption(last_update_time)
+
+    def get_all(self, references, field_paths=None):
+        for reference in references:
+            yield reference.get(field_paths=field_paths)
+
+    def collections(self):
+        return [self.collection(name) for name in self._store]
+
+    def reset(self) -> None:
+        with self._lock:
+            self._store.clear()
+            self._update_times.clear()
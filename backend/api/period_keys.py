@@ -0,0 +1,75 @@
+from datetime import datetime, timezone
+from typing import Optional, Tuple
+from .db import db
+from .budget_periods import get_period_settings, get_period_keys, get_window_period_key
+import logging
+
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+# Progress of the period key backfill is kept on the user doc under `period_keys`.
+# Queries only rely on the keys once every document carries them for the user's
+# current pay schedule; until then they fall back to range scans on `date`.
+BACKFILL_BATCH_SIZE = 400
+
+def get_pay_start(user_data: Optional[dict]) -> Optional[str]:
+    _, pay_start = get_period_settings(user_data)
+    return pay_start
+
+def period_keys_ready(user_data: Optional[dict]) -> bool:
+    state = (user_data or {}).get("period_keys") or {}
+    return state.get("complete", False) and state.get("pay_start") == get_pay_start(user_data)
+
+def get_window_filter(user_id: str, start_date: str, end_date: str) -> Optional[Tuple[str, object]]:
+    """Return the period key equality filter for a window, or None if it has to be a range scan"""
+    user_doc = db.collection("users").document(user_id).get(field_paths=["preferences", "period_keys"])
+    user_data = user_doc.to_dict() if user_doc.exists else None
+    if not period_keys_ready(user_data):
+        return None
+    return get_window_period_key(start_date, end_date, get_pay_start(user_data))
+
+def backfill_period_keys(user_id: str) -> dict:
+    """
+    Recompute the period keys of every transaction and assignment of a user in
+    chunked batches, writing only documents whose keys changed.
+    """
+    user_ref = db.collection("users").document(user_id)
+    user_doc = user_ref.get()
+    if not user_doc.exists:
+        return {"updated": 0, "scanned": 0}
+    pay_start = get_pay_start(user_doc.to_dict())
+
+    user_ref.update({"period_keys": {"pay_start": pay_start, "complete": False, "updated_at": datetime.now(timezone.utc)}})
+
+    scanned = 0
+    updated = 0
+    for collection in ("transactions", "assignments"):
+        batch = db.batch()
+        pending = 0
+        query = db.collection(collection).where("user_id", "==", user_id).select(["date", "period_month", "pay_period"])
+        for doc in query.stream():
+            scanned += 1
+            doc_data = doc.to_dict()
+            if not doc_data.get("date"):
+                continue
+            keys = get_period_keys(doc_data["date"], pay_start)
+            if doc_data.get("period_month") == keys["period_month"] and doc_data.get("pay_period") == keys["pay_period"]:
+                continue
+            batch.update(doc.reference, keys)
+            pending += 1
+            if pending == BACKFILL_BATCH_SIZE:
+                batch.commit()
+                updated += pending
+                batch = db.batch()
+                pending = 0
+        if pending:
+            batch.commit()
+            updated += pending
+
+    # Only mark the keys usable if the pay schedule did not change while we were running
+    current_doc = user_ref.get(field_paths=["preferences"])
+    if get_pay_start(current_doc.to_dict()) == pay_start:
+        user_ref.update({"period_keys": {"pay_start": pay_start, "complete": True, "updated_at": datetime.now(timezone.utc)}})
+
+    logger.info(f"Backfilled period keys for user {user_id}: {updated}/{scanned} documents updated")
+    return {"updated": updated, "scanned": scanned}
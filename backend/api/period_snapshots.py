@@ -0,0 +1,189 @@
+from datetime import date, datetime, timezone
+from typing import Iterable, Optional
+from google.api_core.exceptions import FailedPrecondition, NotFound
+from google.cloud import firestore
+from .db import db
+from .budget_aggregates import compute_allocated_and_spent, get_next_day_str
+from .budget_periods import get_period_settings, get_closed_periods, format_date
+from .sharded_counters import read_balance
+import logging
+
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+# A budget period that ended before today is frozen into one document holding each
+# category's allocated, spent and closing available amounts. Snapshots are only
+# dropped when a write lands on or before their end date, e.g. a backdated
+# transaction or a Plaid modification of an old transaction.
+#
+# Such a write does not look for the snapshots it makes stale: a query made before it
+# commits can miss a snapshot saved in between. It adds its earliest date to the user
+# doc's `stale_snapshot_dates` in its own batch instead. Readers drop the snapshots
+# ending on or after those dates before using one (drop_stale_snapshots), and a
+# snapshot is only saved if the user doc is unchanged since its totals were read and
+# lists no stale date up to its end.
+SNAPSHOT_COLLECTION = "period_snapshots"
+STALE_DATES_FIELD = "stale_snapshot_dates"
+DROP_BATCH_SIZE = 400
+
+def is_closed_period(end_date: str) -> bool:
+    return end_date < format_date(date.today())
+
+def get_snapshot_ref(user_id: str, start_date: str, end_date: str):
+    return db.collection(SNAPSHOT_COLLECTION).document(f"{user_id}_{start_date}_{end_date}")
+
+def get_snapshot(user_id: str, start_date: str, end_date: str) -> Optional[dict]:
+    snapshot_doc = get_snapshot_ref(user_id, start_date, end_date).get()
+    if not snapshot_doc.exists:
+        return None
+    snapshot_data = snapshot_doc.to_dict()
+    return {
+        "allocated_and_spent": snapshot_data["allocated_and_spent"],
+        "unallocated_income": snapshot_data["unallocated_income"]
+    }
+
+def read_data_version(user_id: str):
+    """
+    The user doc's data version and stale snapshot dates, read past the version cache;
+    pass it to drop_stale_snapshots and save_snapshot
+    """
+    return db.collection("users").document(user_id).get(field_paths=["data_version", STALE_DATES_FIELD])
+
+def get_stale_dates(version_doc) -> list:
+    return ((version_doc.to_dict() or {}).get(STALE_DATES_FIELD) or []) if version_doc.exists else []
+
+def drop_stale_snapshots(user_id: str, version_doc) -> bool:
+    """
+    Delete the snapshots ending on or after the earliest stale date `version_doc` lists,
+    then clear those dates. Returns whether there was anything to drop. Snapshots cannot
+    be saved meanwhile: save_snapshot refuses while the dates are listed.
+    """
+    stale_dates = get_stale_dates(version_doc)
+    if not stale_dates:
+        return False
+
+    stale_query = db.collection(SNAPSHOT_COLLECTION).where("user_id", "==", user_id).where("end_date", ">=", min(stale_dates))
+    stale_refs = [doc.reference for doc in stale_query.select([]).stream()]
+    for index in range(0, len(stale_refs), DROP_BATCH_SIZE):
+        batch = db.batch()
+        for ref in stale_refs[index:index + DROP_BATCH_SIZE]:
+            batch.delete(ref)
+        batch.commit()
+    # Only the dates seen here; a date added since marks snapshots that are dropped next time
+    version_doc.reference.update({STALE_DATES_FIELD: firestore.ArrayRemove(stale_dates)})
+    return True
+
+def compute_closing_available(user_id: str, end_date: str) -> dict:
+    """
+    Work back from each category's current available to its value at the end of the
+    period by undoing every assignment and transaction dated after it.
+    """
+    after_end = get_next_day_str(end_date)
+    closing_available = {}
+    unallocated_category_id = None
+
+    for doc in db.collection("categories").where("user_id", "==", user_id).stream():
+        category_data = doc.to_dict()
+        closing_available[doc.id] = read_balance(doc.id, category_data)
+        if category_data.get("is_unallocated_funds", False):
+            unallocated_category_id = doc.id
+
+    assignments_query = db.collection("assignments").where("user_id", "==", user_id).where("date", ">=", after_end)
+    for doc in assignments_query.stream():
+        assignment_data = doc.to_dict()
+        amount = assignment_data.get("amount", 0.0)
+        category_id = assignment_data.get("category_id")
+        if category_id in closing_available:
+            closing_available[category_id] -= amount
+        # Every assignment was taken out of unallocated funds
+        if unallocated_category_id:
+            closing_available[unallocated_category_id] += amount
+
+    transactions_query = db.collection("transactions").where("user_id", "==", user_id).where("date", ">=", after_end)
+    for doc in transactions_query.stream():
+        transaction_data = doc.to_dict()
+        category_id = transaction_data.get("category_id")
+        if category_id in closing_available:
+            closing_available[category_id] -= transaction_data.get("amount", 0.0)
+
+    return closing_available
+
+def save_snapshot(user_id: str, start_date: str, end_date: str, response: dict, version_doc) -> dict:
+    """
+    Freeze the allocated/spent response of a closed period, adding each category's closing
+    available. `version_doc` is read_data_version() from before `response` was computed;
+    if the user's data changed since, or a write dated within the period has not had its
+    stale snapshots dropped yet, the snapshot is not saved.
+    """
+    if any(stale_date <= end_date for stale_date in get_stale_dates(version_doc)):
+        logger.info(f"Not saving the {start_date} - {end_date} snapshot of user {user_id}: a write dated within it is pending invalidation")
+        return response
+    closing_available = compute_closing_available(user_id, end_date)
+    allocated_and_spent = []
+    for category_result in response["allocated_and_spent"]:
+        allocated_and_spent.append({
+            **category_result,
+            "closing_available": round(closing_available.get(category_result["category_id"], 0.0), 2)
+        })
+
+    data_version = (version_doc.to_dict() or {}).get("data_version", 0) if version_doc.exists else 0
+    batch = db.batch()
+    batch.set(get_snapshot_ref(user_id, start_date, end_date), {
+        "user_id": user_id,
+        "start_date": start_date,
+        "end_date": end_date,
+        "allocated_and_spent": allocated_and_spent,
+        "unallocated_income": response["unallocated_income"],
+        "data_version": data_version,
+        "created_at": datetime.now(timezone.utc)
+    })
+    # Rewrites the same version, only to make the commit conditional on the user doc
+    batch.update(version_doc.reference, {"data_version": data_version}, option=db.write_option(last_update_time=version_doc.update_time))
+    try:
+        batch.commit()
+    except (FailedPrecondition, NotFound):
+        logger.info(f"Not saving the {start_date} - {end_date} snapshot of user {user_id}: their data changed while it was computed")
+    return {"allocated_and_spent": allocated_and_spent, "unallocated_income": response["unallocated_income"]}
+
+def invalidate_closed_snapshots(user_id: str, dates: Iterable[Optional[str]], batch=None) -> None:
+    """
+    Mark the snapshots a write dated on any of the given days makes stale: every
+    snapshot ending on or after the earliest day, since closing balances carry forward.
+    Pass the write's batch so the mark commits with it. Writes dated today or later
+    cannot touch a closed period and cost nothing.
+    """
+    dates = [day for day in dates if day]
+    if not dates:
+        return
+    earliest = min(dates)
+    if earliest >= format_date(date.today()):
+        return
+
+    user_ref = db.collection("users").document(user_id)
+    update = {STALE_DATES_FIELD: firestore.ArrayUnion([earliest])}
+    if batch is not None:
+        batch.set(user_ref, update, merge=True)
+    else:
+        user_ref.set(update, merge=True)
+
+def snapshot_closed_periods(user_id: str, periods_back: int = 12) -> dict:
+    """Freeze the user's most recent completed budget periods that have no snapshot yet"""
+    user_doc = db.collection("users").document(user_id).get()
+    if not user_doc.exists:
+        return {"created": 0, "existing": 0}
+    budget_period, pay_start = get_period_settings(user_doc.to_dict())
+
+    periods = [(format_date(start), format_date(end)) for start, end in get_closed_periods(date.today(), budget_period, pay_start, periods_back)]
+    drop_stale_snapshots(user_id, read_data_version(user_id))
+    snapshot_refs = [get_snapshot_ref(user_id, start, end) for start, end in periods]
+    existing_ids = {doc.id for doc in db.get_all(snapshot_refs) if doc.exists}
+
+    created = 0
+    for (start, end), ref in zip(periods, snapshot_refs):
+        if ref.id in existing_ids:
+            continue
+        version_doc = read_data_version(user_id)
+        save_snapshot(user_id, start, end, compute_allocated_and_spent(user_id, start, end), version_doc)
+        created += 1
+
+    return {"created": created, "existing": len(existing_ids)}
@@ -1,6 +1,8 @@
-from fastapi import APIRouter, HTTPException
+from fastapi import APIRouter, HTTPException, Request, Response, BackgroundTasks
 from pydantic import BaseModel
 from .db import db
+from .data_version import get_etag, etag_matches, not_modified
+from .cascade_delete import count_documents, run_cascade, cascade_delete_plaid_item, plaid_item_transactions_query, legacy_plaid_item_transactions
 
 router = APIRouter()
 
@@ -11,8 +13,14 @@ class DeletePlaidItemRequest(BaseModel):
     item_id: str
 
 @router.post("/get-plaid-items")
-async def get_plaid_items(request: UserIDRequest):
+async def get_plaid_items(request: UserIDRequest, http_request: Request, response: Response):
     try:
+        # Answer conditional requests from the data version before querying Firestore
+        etag = get_etag(request.user_id, "plaid_items")
+        if etag_matches(http_request, etag):
+            return not_modified(etag)
+        response.headers["ETag"] = etag
+
         # Query plaid_items with a `user_id` field equal to `request.user_id`
         plaid_items_query = db.collection("plaid_items").where("user_id", "==", request.user_id)
         plaid_items_docs = plaid_items_query.stream()
@@ -29,10 +37,22 @@ async def get_plaid_items(request: UserIDRequest):
         raise HTTPException(status_code=500, detail=f"Failed to get plaid items: {e}")
 
 @router.post("/delete-plaid-item")
-async def delete_plaid_item(request: DeletePlaidItemRequest):
+async def delete_plaid_item(request: DeletePlaidItemRequest, background_tasks: BackgroundTasks):
     try:
-        # Delete the plaid_item with the given ID
-        db.collection("plaid_items").document(request.item_id).delete()
-        return {"success": True, "message": "Plaid item deleted successfully"}
+        item_ref = db.collection("plaid_items").document(request.item_id)
+        item_doc = item_ref.get()
+        if not item_doc.exists:
+            return {"success": True, "message": "Plaid item deleted successfully"}
+        item_data = item_doc.to_dict()
+        user_id = item_data["user_id"]
+
+        # Delete the item together with its transactions, in the background if there are many
+        estimated_total = count_documents(plaid_item_transactions_query(user_id, request.item_id), "delete_plaid_item.estimate")
+        legacy_query, _ = legacy_plaid_item_transactions(user_id, item_data)
+        estimated_total += count_documents(legacy_query, "delete_plaid_item.estimate")
+        result = run_cascade(background_tasks, user_id, "plaid_item", request.item_id, estimated_total, cascade_delete_plaid_item, user_id, request.item_id, item_data)
+
+        message = "Plaid item deleted successfully" if result["status"] == "completed" else "Plaid item deletion started"
+        return {"success": True, "message": message, **result}
     except Exception as e:
-        raise HTTPException(status_code=500, detail=f"Failed to delete plaid item: {e}")
\ No newline at end of file
+        raise HTTPException(status_code=500, detail=f"Failed to delete plaid item: {e}")
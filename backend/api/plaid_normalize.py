@@ -0,0 +1,103 @@
+from datetime import datetime, timezone
+from typing import Dict, List, Optional
+from .db import NULL_VALUE
+from .budget_periods import get_period_keys
+from .recurring_detection import normalize_merchant
+
+# One normalization stage between Plaid's transactions_sync responses and Firestore.
+# A page is turned into plain storage records once, with each field converted exactly
+# once, before the added/modified/removed handling decides what to write. Anything
+# importing Plaid transactions should build its documents from these records.
+
+# Fields every stored Plaid transaction carries, whether it was added or modified
+RECORD_FIELDS = ("amount", "name", "date", "period_month", "pay_period", "merchant_name", "merchant_key", "personal_finance_category", "pending")
+
+def convert_personal_finance_category(pfc) -> Optional[dict]:
+    """Convert Plaid's PersonalFinanceCategory (a model object, or a dict) for Firestore storage"""
+    if not pfc:
+        return None
+    if isinstance(pfc, dict):
+        return pfc
+    if hasattr(pfc, "to_dict"):
+        return pfc.to_dict()
+    return {
+        "confidence_level": getattr(pfc, "confidence_level", None),
+        "detailed": getattr(pfc, "detailed", None),
+        "primary": getattr(pfc, "primary", None)
+    }
+
+def build_account_index(item_data: dict) -> Dict[str, str]:
+    """account_id -> account name for one Plaid item, built once per sync"""
+    return {account["account_id"]: account.get("name") for account in item_data.get("accounts", [])}
+
+def format_plaid_date(value) -> str:
+    return value if isinstance(value, str) else value.strftime("%Y-%m-%d")
+
+def normalize_transaction(transaction, account_index: Dict[str, str], pay_start: Optional[str] = None) -> dict:
+    """
+    Storage record for one Plaid transaction. Plaid amounts are positive for money
+    leaving the account; stored amounts are negative for spending.
+    """
+    date_str = format_plaid_date(transaction["date"])
+    merchant_name = transaction.get("merchant_name")
+    return {
+        "plaid_transaction_id": transaction["transaction_id"],
+        "account_name": account_index.get(transaction.get("account_id")),
+        "amount": -transaction["amount"],
+        "name": transaction["name"],
+        "date": date_str,
+        **get_period_keys(date_str, pay_start),
+        "merchant_name": merchant_name,
+        "merchant_key": normalize_merchant(merchant_name, transaction["name"]),
+        "personal_finance_category": convert_personal_finance_category(transaction.get("personal_finance_category")),
+        "pending": transaction.get("pending"),
+        # Set on a posted transaction that replaces a pending one
+        "pending_transaction_id": transaction.get("pending_transaction_id")
+    }
+
+class NormalizedPage:
+    """One transactions_sync page as storage records, keyed by Plaid transaction id"""
+
+    def __init__(self, page, item_data: dict, pay_start: Optional[str] = None, account_index: Optional[Dict[str, str]] = None):
+        account_index = account_index if account_index is not None else build_account_index(item_data)
+        self.added: Dict[str, dict] = {}
+        for transaction in page.get("added", []):
+            record = normalize_transaction(transaction, account_index, pay_start)
+            self.added[record["plaid_transaction_id"]] = record
+        self.modified: Dict[str, dict] = {}
+        for transaction in page.get("modified", []):
+            record = normalize_transaction(transaction, account_index, pay_start)
+            self.modified[record["plaid_transaction_id"]] = record
+        self.removed: List[str] = [transaction["transaction_id"] for transaction in page.get("removed", [])]
+        self.next_cursor = page.get("next_cursor")
+        self.has_more = page.get("has_more", False)
+
+    def pending_pairs(self) -> Dict[str, str]:
+        """
+        posted id -> pending id for posted transactions whose pending version this same
+        page removes. Plaid reports a pending transaction posting as exactly that pair.
+        """
+        removed = set(self.removed)
+        return {
+            plaid_id: record["pending_transaction_id"]
+            for plaid_id, record in self.added.items()
+            if record.get("pending_transaction_id") in removed
+        }
+
+def new_transaction_document(record: dict, user_id: str, item_id: str, item_data: dict) -> dict:
+    """Firestore document for a transaction Plaid reported as new"""
+    return {
+        **record,
+        "user_id": user_id,
+        "plaid_item_id": item_id,
+        "institution_name": item_data["institution_name"],
+        "category_id": NULL_VALUE,
+        "created_at": datetime.now(timezone.utc),
+        "type": "debit" if record["amount"] < 0 else "credit"
+    }
+
+def modified_transaction_fields(record: dict) -> dict:
+    """Fields of an already stored transaction that a modification overwrites"""
+    fields = {field: record[field] for field in RECORD_FIELDS}
+    fields["type"] = "debit" if record["amount"] < 0 else "credit"
+    return fields
@@ -1,6 +1,10 @@
-from .db import db
+from .db import db, new_batch
+from .data_version import bump_data_version
+from .idempotency import get_idempotency_ref, lookup_idempotent_response, record_idempotent_response, commit_idempotent
+from .plaid_utils import verify_plaid_webhook, WebhookVerificationError
+from .sync_scheduler import schedule_item_sync
 import time
-from fastapi import APIRouter, HTTPException
+from fastapi import APIRouter, HTTPException, Header, Request
 from pydantic import BaseModel
 import plaid
 from plaid.api import plaid_api
@@ -12,8 +16,10 @@ from plaid.model.item_public_token_exchange_request import ItemPublicTokenExchan
 from plaid.model.item_public_token_exchange_response import ItemPublicTokenExchangeResponse
 from dotenv import load_dotenv
 import os
+import json
 import logging
 from datetime import datetime, timezone
+from typing import Optional
 from backend.db.schemas import PlaidItem as PlaidItemSchema
 
 load_dotenv()
@@ -25,6 +31,8 @@ router = APIRouter()
 PLAID_CLIENT_ID = os.getenv("PLAID_CLIENT_ID")
 PLAID_SECRET_PRODUCTION = os.getenv("PLAID_SECRET_PRODUCTION")
 PLAID_SECRET_SANDBOX = os.getenv("PLAID_SECRET_SANDBOX")
+# Public URL of /plaid/webhook, items linked while this is unset only sync on demand
+PLAID_WEBHOOK_URL = os.getenv("PLAID_WEBHOOK_URL")
 CLIENT_NAME = 'Budgeting App'
 
 # Create logger
@@ -62,19 +70,23 @@ class ExchangePublicTokenRequest(BaseModel):
     institution_name: str
 
 class ExchangePublicTokenResponse(BaseModel):
-    access_token: str
     item_id: str
+    plaid_item_id: str
 
 @router.get("/get-link-token", response_model=LinkTokenResponse)
 async def get_link_token():
     try:
         # Create a link token request
+        link_token_args = {}
+        if PLAID_WEBHOOK_URL:
+            link_token_args["webhook"] = PLAID_WEBHOOK_URL
         request = LinkTokenCreateRequest(
             products=[Products("transactions")],
             client_name=CLIENT_NAME,
             country_codes=[CountryCode("US")],
             language="en",
             user=LinkTokenCreateRequestUser(client_user_id=str(time.time())),
+            **link_token_args
         )
         # Create link token
         response = client.link_token_create(request)
@@ -111,7 +123,7 @@ async def create_account(account: Account, user_id: str, access_token: str):
         # If something goes wrong, raise an HTTPException
         raise HTTPException(status_code=500, detail=f"Failed to create account: {str(e)}")
     
-async def create_plaid_item(request: ExchangePublicTokenRequest, access_token: str, item_id: str):
+async def create_plaid_item(request: ExchangePublicTokenRequest, access_token: str, item_id: str, idempotency_ref=None):
     try:
         # Ensure the user exists
         user_ref = db.collection("users").document(request.user_id)
@@ -132,9 +144,19 @@ async def create_plaid_item(request: ExchangePublicTokenRequest, access_token: s
         
         # Create a new plaid item document in the 'plaid_items' collection
         plaid_item_ref = db.collection("plaid_items").document()
-        plaid_item_ref.set(plaid_item_schema.to_dict())
+        batch = new_batch()
+        batch.set(plaid_item_ref, plaid_item_schema.to_dict())
+        bump_data_version(request.user_id, batch)
+        # Record the exchange response with the item so a retried exchange replays it.
+        # The access token stays on the plaid item only.
+        record_idempotent_response(batch, idempotency_ref, request.user_id, "exchange-public-token", request, {"item_id": item_id, "plaid_item_id": plaid_item_ref.id})
+        replayed_response = commit_idempotent(batch, idempotency_ref, request)
+        if replayed_response is not None:
+            return {"message": "Plaid item already created.", "plaid_item_id": replayed_response["plaid_item_id"]}
 
         return {"message": "Plaid item created successfully.", "plaid_item_id": plaid_item_ref.id}
+    except HTTPException as e:
+        raise e
     
     except ValueError as e:
         # Catch validation errors from the schema
@@ -146,8 +168,14 @@ async def create_plaid_item(request: ExchangePublicTokenRequest, access_token: s
 # Endpoint to exchange the public token for an access token and then store it and 
 # create a plaid item and accounts in the database
 @router.post("/exchange-public-token", response_model=ExchangePublicTokenResponse)
-async def exchange_public_token(request: ExchangePublicTokenRequest):
+async def exchange_public_token(request: ExchangePublicTokenRequest, idempotency_key: Optional[str] = Header(None)):
     try:
+        # Replay the stored response if this is a retry of an exchange that already committed
+        idempotency_ref = get_idempotency_ref(request.user_id, "exchange-public-token", idempotency_key)
+        cached_response = lookup_idempotent_response(idempotency_ref, request)
+        if cached_response is not None:
+            return cached_response
+
         # Create the request object for Plaid
         exchange_request = ItemPublicTokenExchangeRequest(public_token=request.public_token)
         
@@ -159,10 +187,55 @@ async def exchange_public_token(request: ExchangePublicTokenRequest):
         logger.info(f"Access token received: {access_token}")
 
 
-        await create_plaid_item(request, access_token, item_id)
+        plaid_item = await create_plaid_item(request, access_token, item_id, idempotency_ref)
 
-        return {"access_token": access_token, "item_id": item_id}
+        return {"item_id": item_id, "plaid_item_id": plaid_item["plaid_item_id"]}
     
+    except HTTPException as e:
+        # An Idempotency-Key reused with another body is the client's error, not a failed exchange
+        if e.status_code == 422:
+            raise e
+        logger.error(f"Error exchanging public token: {str(e)}")
+        raise HTTPException(status_code=400, detail=str(e))
     except Exception as e:
         logger.error(f"Error exchanging public token: {str(e)}")
         raise HTTPException(status_code=400, detail=str(e))
+
+
+# Endpoint Plaid calls when an item has new transaction updates. The sync itself is
+# scheduled in the background so Plaid gets its 200 right away.
+@router.post("/webhook")
+async def plaid_webhook(request: Request):
+    body = await request.body()
+    try:
+        verify_plaid_webhook(body, request.headers.get("plaid-verification"))
+    except WebhookVerificationError as e:
+        logger.warning(f"Rejected Plaid webhook: {str(e)}")
+        raise HTTPException(status_code=401, detail="Webhook verification failed")
+    except Exception as e:
+        logger.error(f"Error verifying Plaid webhook: {str(e)}")
+        raise HTTPException(status_code=500, detail="Failed to verify webhook")
+
+    try:
+        payload = json.loads(body)
+    except ValueError:
+        raise HTTPException(status_code=400, detail="Webhook body is not valid JSON")
+
+    webhook_type = payload.get("webhook_type")
+    webhook_code = payload.get("webhook_code")
+    if webhook_type != "TRANSACTIONS" or webhook_code != "SYNC_UPDATES_AVAILABLE":
+        logger.info(f"Ignoring Plaid webhook {webhook_type}/{webhook_code}")
+        return {"received": True, "scheduled": 0}
+
+    try:
+        # plaid_items documents are keyed by our own ids, so look them up by Plaid's item_id
+        items_query = db.collection("plaid_items").where("item_id", "==", payload.get("item_id"))
+        scheduled = 0
+        for item_doc in items_query.stream():
+            if schedule_item_sync(item_doc.id):
+                scheduled += 1
+
+        return {"received": True, "scheduled": scheduled}
+    except Exception as e:
+        logger.error(f"Failed to schedule sync for Plaid item {payload.get('item_id')}: {str(e)}")
+        raise HTTPException(status_code=500, detail=f"Failed to schedule sync: {str(e)}")
@@ -0,0 +1,337 @@
+from fastapi import HTTPException
+from .db import db, Batch, DELETE_FIELD
+from .data_version import bump_data_version
+from .plaid_utils import get_plaid_transactions
+from .period_snapshots import invalidate_closed_snapshots
+from .period_keys import get_pay_start
+from .bulk_writer import BulkWriter, plaid_transaction_ref
+from .sharded_counters import get_shard_counts, available_write
+from .categorization_rules import load_rule_matcher
+from .recurring_detection import update_recurring_series, IN_QUERY_LIMIT
+from .plaid_normalize import NormalizedPage, build_account_index, new_transaction_document, modified_transaction_fields
+import plaid
+import json
+import logging
+
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+class LeaseLostError(Exception):
+    """Another sync took over the user's sync lease; this one has to stop writing"""
+
+def find_transaction_docs(user_id: str, plaid_transaction_ids: list) -> dict:
+    """
+    Map Plaid transaction ids to their Firestore documents. Documents stored under the
+    deterministic id are fetched in one get_all, older ones with random ids (and pending
+    documents a posted transaction took over) by `in` queries of up to 30 ids.
+    """
+    found = {}
+    if not plaid_transaction_ids:
+        return found
+    for doc in db.get_all([plaid_transaction_ref(plaid_id) for plaid_id in plaid_transaction_ids]):
+        if doc.exists:
+            found[doc.to_dict()["plaid_transaction_id"]] = [doc]
+
+    remaining = [plaid_id for plaid_id in dict.fromkeys(plaid_transaction_ids) if plaid_id not in found]
+    for index in range(0, len(remaining), IN_QUERY_LIMIT):
+        chunk = remaining[index:index + IN_QUERY_LIMIT]
+        query = db.collection("transactions").where("user_id", "==", user_id).where("plaid_transaction_id", "in", chunk)
+        for doc in query.stream():
+            found.setdefault(doc.to_dict()["plaid_transaction_id"], []).append(doc)
+    for plaid_id in remaining:
+        found.setdefault(plaid_id, [])
+    return found
+
+def persist_sync_page(user_id: str, item_ref, item_data: dict, page, pay_start=None, matcher=None, shard_counts=None, account_index=None, fence=None) -> dict:
+    """
+    Write one transactions_sync page and checkpoint the item's cursor.
+    The page's writes are committed in parallel batches and the cursor only advances
+    once all of them are in, so a retry resumes from this page. Plaid transactions are
+    written under deterministic ids, so a replayed page updates the documents it wrote
+    before instead of duplicating them, leaving their category alone.
+    New transactions matching one of the user's rules are categorized in the same
+    commit as the `available` increment of their category, and a modified amount moves
+    its category's balance in the same commit as the update.
+    `fence` (see sync_lease.lease_fence) raises LeaseLostError once the sync no longer
+    holds its lease; it is checked before the page is written and again in the checkpoint.
+    """
+    if fence is not None:
+        fence()
+    normalized = NormalizedPage(page, item_data, pay_start, account_index)
+    next_cursor = normalized.next_cursor
+    has_more = normalized.has_more
+    writer = BulkWriter()
+    shard_counts = shard_counts or {}
+    # Dates this page touches, to drop any closed-period snapshot it makes stale
+    touched_dates = set()
+
+    new_transactions = {
+        plaid_id: new_transaction_document(record, user_id, item_ref.id, item_data)
+        for plaid_id, record in normalized.added.items()
+    }
+    touched_dates.update(record["date"] for record in normalized.added.values())
+
+    # Posted transactions replacing a pending one in this page. The posted ids are looked
+    # up too: a replayed page finds the pending document already carrying the posted id.
+    pending_pairs = normalized.pending_pairs()
+    lookup_ids = [plaid_id for plaid_id in list(normalized.modified) + normalized.removed if plaid_id not in new_transactions]
+    existing = find_transaction_docs(user_id, lookup_ids + list(pending_pairs))
+
+    modified_docs = []
+    for plaid_id, record in normalized.modified.items():
+        touched_dates.add(record["date"])
+        if plaid_id in new_transactions:
+            # Added and modified in the same page, write it once
+            new_transactions[plaid_id].update(modified_transaction_fields(record))
+        elif existing.get(plaid_id):
+            modified_docs.append((existing[plaid_id][0], record))
+        else:
+            print(f"Creating new transaction for modified transaction: {plaid_id}")
+            new_transactions[plaid_id] = new_transaction_document(record, user_id, item_ref.id, item_data)
+
+    # A posted transaction takes over its pending document in place, keeping the category
+    # the user gave it, instead of a delete, an insert and two balance updates
+    reconciled_docs = []
+    reconciled_pending_ids = set()
+    for posted_id, pending_id in pending_pairs.items():
+        pending_docs = existing.get(posted_id) or existing.get(pending_id)
+        if not pending_docs:
+            continue
+        reconciled_docs.append((pending_docs[0], new_transactions.pop(posted_id)))
+        reconciled_pending_ids.add(pending_id)
+
+    # Removed transactions give back their amount to the category they were in
+    removed_docs = []
+    for plaid_id in normalized.removed:
+        new_transactions.pop(plaid_id, None)
+        if plaid_id not in reconciled_pending_ids:
+            removed_docs.extend(existing.get(plaid_id, []))
+
+    category_ids = {doc.to_dict().get("category_id") for doc in removed_docs}
+    category_ids.update(doc.to_dict().get("category_id") for doc, _ in modified_docs + reconciled_docs)
+    category_ids.discard(None)
+    existing_category_ids = set()
+    if category_ids:
+        for category_doc in db.get_all([db.collection("categories").document(category_id) for category_id in category_ids], field_paths=["user_id"]):
+            if category_doc.exists:
+                existing_category_ids.add(category_doc.id)
+            else:
+                print(f"Warning: Category {category_doc.id} not found for modified or removed transactions")
+
+    for doc, record in modified_docs:
+        transaction_data = doc.to_dict()
+        touched_dates.add(transaction_data.get("date"))
+        update = ("update", doc.reference, modified_transaction_fields(record))
+        category_id = transaction_data.get("category_id")
+        amount_change = record["amount"] - transaction_data.get("amount", 0.0)
+        if category_id in existing_category_ids and amount_change != 0:
+            # A changed amount moves the category balance by the difference. Replaying the
+            # page finds the new amount already stored, so the change is never applied twice.
+            writer.add_group([
+                update,
+                available_write(db.collection("categories").document(category_id), amount_change, shard_counts.get(category_id, 0))
+            ], retry=False)
+        else:
+            writer.add_group([update])
+
+    categorized = 0
+    reconciled = 0
+    for doc, transaction_dict in reconciled_docs:
+        transaction_data = doc.to_dict()
+        touched_dates.add(transaction_data.get("date"))
+        posted_fields = {key: value for key, value in transaction_dict.items() if key not in ("category_id", "created_at")}
+        category_id = transaction_data.get("category_id")
+        if category_id in existing_category_ids:
+            amount_change = transaction_dict["amount"] - transaction_data.get("amount", 0.0)
+        else:
+            amount_change = 0.0
+            if not category_id and matcher is not None and matcher.rules:
+                # Nobody categorized the pending transaction, the rules get a go at the posted one
+                category_id = matcher.match(transaction_dict)
+                if category_id is not None:
+                    posted_fields["category_id"] = category_id
+                    amount_change = transaction_dict["amount"]
+                    categorized += 1
+        update = ("update", doc.reference, posted_fields)
+        if amount_change != 0:
+            # Tips and holds make the posted amount differ; only the difference moves the balance
+            writer.add_group([
+                update,
+                available_write(db.collection("categories").document(category_id), amount_change, shard_counts.get(category_id, 0))
+            ], retry=False)
+        else:
+            writer.add_group([update])
+        reconciled += 1
+
+    for doc in removed_docs:
+        transaction_data = doc.to_dict()
+        touched_dates.add(transaction_data.get("date"))
+        category_id = transaction_data.get("category_id")
+        if category_id in existing_category_ids:
+            # The delete and the balance update commit together and are never replayed
+            writer.add_group([
+                ("delete", doc.reference, None),
+                available_write(db.collection("categories").document(category_id), -transaction_data["amount"], shard_counts.get(category_id, 0))
+            ], retry=False)
+        else:
+            writer.delete(doc.reference)
+
+    rule_categories = {}
+    if matcher is not None and matcher.rules:
+        for plaid_id, transaction_dict in new_transactions.items():
+            category_id = matcher.match(transaction_dict)
+            if category_id is not None:
+                rule_categories[plaid_id] = category_id
+    # A page is replayed after a failed write and when Plaid restarts the pagination loop.
+    # Documents that already exist keep the category (and created_at) they have by then,
+    # which the user may have set since; overwriting it would leave the balance of that
+    # category holding an amount no transaction accounts for, and a rule match must not
+    # be incremented a second time.
+    already_written = set()
+    if new_transactions:
+        for doc in db.get_all([plaid_transaction_ref(plaid_id) for plaid_id in new_transactions], field_paths=["plaid_transaction_id"]):
+            if doc.exists:
+                already_written.add(doc.to_dict()["plaid_transaction_id"])
+
+    for plaid_id, transaction_dict in new_transactions.items():
+        transaction_ref = plaid_transaction_ref(plaid_id)
+        if plaid_id in already_written:
+            writer.update(transaction_ref, {key: value for key, value in transaction_dict.items() if key not in ("category_id", "created_at")})
+        elif plaid_id in rule_categories:
+            category_id = rule_categories[plaid_id]
+            writer.add_group([
+                ("set", transaction_ref, {**transaction_dict, "category_id": category_id}),
+                available_write(db.collection("categories").document(category_id), transaction_dict["amount"], shard_counts.get(category_id, 0))
+            ], retry=False)
+            categorized += 1
+        else:
+            writer.set(transaction_ref, transaction_dict)
+
+    write_stats = writer.flush()
+
+    # The cursor (and the data version) only advance once every write of the page is in
+    checkpoint = Batch()
+    checkpoint_update = {"cursor": next_cursor}
+    if not has_more:
+        # The pagination loop is complete, there is nothing left to restart
+        checkpoint_update["pagination_start_cursor"] = DELETE_FIELD
+    checkpoint.update(item_ref, checkpoint_update)
+    if write_stats["writes"]:
+        bump_data_version(user_id, checkpoint)
+    if fence is not None:
+        fence(checkpoint)
+    checkpoint.commit()
+    invalidate_closed_snapshots(user_id, touched_dates)
+
+    # Merchants whose recurring series this page may have changed
+    merchant_keys = {transaction_dict.get("merchant_key") for transaction_dict in new_transactions.values()}
+    merchant_keys.update(doc.to_dict().get("merchant_key") for doc in removed_docs)
+    merchant_keys.update(record["merchant_key"] for record in normalized.modified.values())
+    merchant_keys.update(doc.to_dict().get("merchant_key") for doc, _ in modified_docs + reconciled_docs)
+    merchant_keys.update(transaction_dict.get("merchant_key") for _, transaction_dict in reconciled_docs)
+    merchant_keys.discard(None)
+
+    return {"added": len(normalized.added), "modified": len(normalized.modified), "removed": len(normalized.removed), "reconciled": reconciled, "categorized": categorized, "merchant_keys": merchant_keys, "writes_per_second": write_stats.get("writes_per_second")}
+
+def is_mutation_during_pagination(error: Exception) -> bool:
+    if not isinstance(error, plaid.ApiException):
+        return False
+    try:
+        return json.loads(error.body).get("error_code") == "TRANSACTIONS_SYNC_MUTATION_DURING_PAGINATION"
+    except (TypeError, ValueError):
+        return False
+
+def sync_plaid_item(user_id: str, item_doc, pay_start=None, matcher=None, shard_counts=None, fence=None) -> dict:
+    """
+    Stream one item's transactions_sync pages into Firestore. Only the current page
+    is held in memory and each page checkpoints the cursor it ends on.
+    """
+    item_data = item_doc.to_dict()
+    item_ref = item_doc.reference
+    account_index = build_account_index(item_data)
+    cursor = item_data.get("cursor")
+    totals = {"pages": 0, "added": 0, "modified": 0, "removed": 0, "reconciled": 0, "categorized": 0, "merchant_keys": set()}
+
+    # Plaid requires restarting from the cursor the pagination loop began with when the
+    # data changes mid-loop, so remember it until the loop completes
+    pagination_start_cursor = item_data.get("pagination_start_cursor", cursor)
+    if "pagination_start_cursor" not in item_data:
+        item_ref.update({"pagination_start_cursor": cursor})
+
+    restarted = False
+    has_more = True
+    while has_more:
+        try:
+            page = get_plaid_transactions(item_data["access_token"], cursor=cursor)
+        except Exception as e:
+            if is_mutation_during_pagination(e) and not restarted:
+                print(f"Transactions changed during pagination for {item_data['institution_name']}, restarting from the loop's first cursor")
+                cursor = pagination_start_cursor
+                restarted = True
+                continue
+            raise
+
+        counts = persist_sync_page(user_id, item_ref, item_data, page, pay_start, matcher, shard_counts, account_index, fence)
+        totals["pages"] += 1
+        for key in ("added", "modified", "removed", "reconciled", "categorized"):
+            totals[key] += counts[key]
+        totals["merchant_keys"].update(counts["merchant_keys"])
+        print(f"Committed page {totals['pages']} for {item_data['institution_name']}: added {counts['added']}, modified {counts['modified']}, removed {counts['removed']}")
+
+        cursor = page.get("next_cursor")
+        has_more = page.get("has_more", False)
+
+    return totals
+
+def run_plaid_sync(user_id: str, plaid_items_docs: list, fence=None) -> dict:
+    """
+    Pull new, modified and removed transactions from Plaid for the given plaid_items
+    documents, writing each page as it arrives. A failure leaves every committed page
+    and its cursor in place, so the next sync resumes where this one stopped.
+    """
+    summary = {}
+    failures = {}
+    user_doc = db.collection("users").document(user_id).get()
+    pay_start = get_pay_start(user_doc.to_dict() if user_doc.exists else None)
+    matcher = load_rule_matcher(user_id)
+    # Balance changes to Unallocated Funds go to its shards
+    shard_counts = get_shard_counts(user_id)
+
+    for item_doc in plaid_items_docs:
+        institution_name = item_doc.to_dict().get("institution_name", item_doc.id)
+        print(f"Processing Plaid item: {institution_name}")
+        try:
+            summary[item_doc.id] = sync_plaid_item(user_id, item_doc, pay_start, matcher, shard_counts, fence)
+        except LeaseLostError:
+            # The new holder syncs these items, nothing more may be written here
+            raise
+        except Exception as e:
+            print(f"❌ Failed to sync Plaid item {institution_name}: {e}")
+            failures[item_doc.id] = str(e)
+
+    # Refresh the recurring series of the merchants this sync touched, even if some items
+    # failed, since their committed pages are kept. The sync itself has succeeded by now.
+    merchant_keys = set()
+    for item in summary.values():
+        merchant_keys.update(item.pop("merchant_keys"))
+    try:
+        update_recurring_series(user_id, merchant_keys)
+    except Exception as e:
+        logger.error(f"Failed to update recurring series for user {user_id}: {str(e)}")
+
+    if failures:
+        raise HTTPException(status_code=500, detail=f"Failed to sync {len(failures)}/{len(plaid_items_docs)} Plaid items, committed pages were kept: {failures}")
+
+    print("🎉 Sync completed successfully")
+    return {
+        "message": "Transactions synced successfully.",
+        "summary": {
+            "added": sum(item["added"] for item in summary.values()),
+            "modified": sum(item["modified"] for item in summary.values()),
+            "deleted": sum(item["removed"] for item in summary.values()),
+            "reconciled": sum(item["reconciled"] for item in summary.values()),
+            "categorized": sum(item["categorized"] for item in summary.values()),
+            "pages": sum(item["pages"] for item in summary.values()),
+            "cursors_updated": len(summary)
+        }
+    }
@@ -1,18 +1,26 @@
 import plaid
 from plaid.model.transactions_sync_request import TransactionsSyncRequest
+from plaid.model.item_remove_request import ItemRemoveRequest
+from plaid.model.webhook_verification_key_get_request import WebhookVerificationKeyGetRequest
 from plaid.api import plaid_api
+from collections import deque
 import os
 from dotenv import load_dotenv
 import json
 import datetime
+import hashlib
+import hmac
+import time
+import jwt
 
 load_dotenv()
 
 # Available environments are
 # 'Production'
 # 'Sandbox'
+# PLAID_HOST points the client somewhere else, e.g. the load-test harness's fake Plaid server
 configuration = plaid.Configuration(
-    host=plaid.Environment.Production,
+    host=os.getenv("PLAID_HOST", plaid.Environment.Production),
     api_key={
         'clientId': os.getenv("PLAID_CLIENT_ID"),
         'secret': os.getenv("PLAID_SECRET_PRODUCTION"),
@@ -34,10 +42,108 @@ def get_plaid_transactions(access_token: str, cursor=None):
     # Return the full response as is
     return response
 
+# Errors item_remove answers with when the access token no longer works, i.e. there is
+# nothing left to remove at Plaid
+ITEM_ALREADY_REMOVED_ERRORS = ("ITEM_NOT_FOUND", "INVALID_ACCESS_TOKEN")
+
+def remove_plaid_item(access_token: str) -> None:
+    """
+    Invalidate an item's access token at Plaid, which stops its billing and webhooks.
+    Deleting the plaid_items document alone leaves the item live at Plaid.
+    """
+    try:
+        client.item_remove(ItemRemoveRequest(access_token=access_token))
+    except plaid.ApiException as e:
+        try:
+            error_code = json.loads(e.body).get("error_code")
+        except (TypeError, ValueError):
+            error_code = None
+        if error_code not in ITEM_ALREADY_REMOVED_ERRORS:
+            raise
+
 def save_cursor(access_token: str, cursor: str):
     # Implement logic to save the cursor, e.g., in a database or file
     pass
 
 def get_saved_cursor(access_token: str) -> str:
     # Implement logic to retrieve the saved cursor, e.g., from a database or file
-    return None
\ No newline at end of file
+    return None
+
+# Webhook verification keys by key id: {"key", "expiration_time"}. A key id Plaid does
+# not know is cached as None for a short while, so repeating a forged key id does not
+# make a Plaid call each time; lookups of uncached key ids are also capped per minute,
+# so random key ids cannot either.
+webhook_key_cache = {}
+WEBHOOK_KEY_TTL_SECONDS = 24 * 60 * 60
+WEBHOOK_KEY_FAILURE_TTL_SECONDS = 60
+WEBHOOK_KEY_LOOKUPS_PER_MINUTE = 10
+webhook_key_lookups = deque()
+# Plaid signs every webhook at send time, anything older than this is treated as a replay
+WEBHOOK_MAX_AGE_SECONDS = 5 * 60
+
+class WebhookVerificationError(Exception):
+    pass
+
+def get_webhook_verification_key(key_id: str) -> dict:
+    now = time.perf_counter()
+    entry = webhook_key_cache.get(key_id)
+    if entry and now < entry["expiration_time"]:
+        if entry["key"] is None:
+            raise WebhookVerificationError(f"Unknown verification key {key_id}")
+        return entry["key"]
+
+    while webhook_key_lookups and now - webhook_key_lookups[0] > 60:
+        webhook_key_lookups.popleft()
+    if len(webhook_key_lookups) >= WEBHOOK_KEY_LOOKUPS_PER_MINUTE:
+        raise WebhookVerificationError("Too many verification key lookups")
+    webhook_key_lookups.append(now)
+
+    # Drop expired entries so forged key ids do not pile up
+    for cached_id in [cached_id for cached_id, cached in webhook_key_cache.items() if now >= cached["expiration_time"]]:
+        del webhook_key_cache[cached_id]
+
+    try:
+        response = client.webhook_verification_key_get(WebhookVerificationKeyGetRequest(key_id=key_id))
+    except plaid.ApiException as e:
+        webhook_key_cache[key_id] = {"key": None, "expiration_time": now + WEBHOOK_KEY_FAILURE_TTL_SECONDS}
+        raise WebhookVerificationError(f"Could not get verification key {key_id}: {e.status}")
+    key = response.key.to_dict()
+    webhook_key_cache[key_id] = {"key": key, "expiration_time": now + WEBHOOK_KEY_TTL_SECONDS}
+    return key
+
+def verify_plaid_webhook(body: bytes, signed_jwt: str) -> None:
+    """
+    Verify the Plaid-Verification header of a webhook as described in
+    https://plaid.com/docs/api/webhooks/webhook-verification/
+    Raises WebhookVerificationError if the webhook did not come from Plaid.
+    """
+    if not signed_jwt:
+        raise WebhookVerificationError("Missing Plaid-Verification header")
+
+    try:
+        header = jwt.get_unverified_header(signed_jwt)
+    except jwt.PyJWTError as e:
+        raise WebhookVerificationError(f"Malformed verification token: {e}")
+
+    if header.get("alg") != "ES256":
+        raise WebhookVerificationError(f"Unexpected signing algorithm {header.get('alg')}")
+
+    key_id = header.get("kid")
+    if not key_id:
+        raise WebhookVerificationError("Verification token has no key id")
+    key = get_webhook_verification_key(key_id)
+    if key.get("expired_at"):
+        raise WebhookVerificationError("Verification key has expired")
+
+    try:
+        public_key = jwt.algorithms.ECAlgorithm.from_jwk(json.dumps(key))
+        claims = jwt.decode(signed_jwt, key=public_key, algorithms=["ES256"])
+    except jwt.PyJWTError as e:
+        raise WebhookVerificationError(f"Invalid verification token: {e}")
+
+    if not isinstance(claims.get("iat"), (int, float)) or time.time() - claims["iat"] > WEBHOOK_MAX_AGE_SECONDS:
+        raise WebhookVerificationError("Webhook is too old")
+
+    body_hash = hashlib.sha256(body).hexdigest()
+    if not hmac.compare_digest(body_hash, str(claims.get("request_body_sha256", ""))):
+        raise WebhookVerificationError("Webhook body does not match its signature")
@@ -0,0 +1,191 @@
+from datetime import date, datetime, timedelta, timezone
+from typing import Iterable, Optional
+from .db import db
+from .budget_periods import parse_date, format_date
+import re
+import statistics
+import logging
+
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+# Detected recurring series (subscriptions, bills, paychecks) are stored in one
+# document per user, so serving them is a single read. The analysis runs after every
+# Plaid sync, only for the merchants that sync touched.
+RECURRING_COLLECTION = "recurring_series"
+BACKFILL_BATCH_SIZE = 400
+# Firestore `in` filters take at most 30 values
+IN_QUERY_LIMIT = 30
+
+MIN_OCCURRENCES = 3
+# Share of intervals that must be within tolerance of the typical interval
+MIN_REGULARITY = 0.75
+# Coefficient of variation of the amounts above which a series is not considered recurring
+MAX_AMOUNT_VARIATION = 0.35
+STABLE_AMOUNT_VARIATION = 0.05
+
+# (name, typical interval in days, tolerance in days)
+PERIODS = [
+    ("weekly", 7, 1),
+    ("bi-weekly", 14, 2),
+    ("monthly", 30.4, 3.5),
+    ("quarterly", 91, 7),
+    ("yearly", 365, 10),
+]
+
+MERCHANT_PREFIXES = re.compile(r"^(sq \*|sq\*|tst\* ?|pp\*|paypal \*|sp \*|dd \*|pos |ach |debit card purchase )")
+NOISE = re.compile(r"[^a-z ]+")
+
+def normalize_merchant(merchant_name: Optional[str], name: Optional[str]) -> Optional[str]:
+    """
+    Grouping key for a merchant: lower case, processor prefixes, digits (store numbers,
+    dates, reference codes) and punctuation removed, e.g. "SQ *BLUE BOTTLE #1234" -> "blue bottle"
+    """
+    raw = (merchant_name or name or "").lower().strip()
+    raw = MERCHANT_PREFIXES.sub("", raw)
+    key = " ".join(NOISE.sub(" ", raw).split())
+    return key or None
+
+def classify_period(interval_days: float):
+    for period, typical, tolerance in PERIODS:
+        if abs(interval_days - typical) <= tolerance:
+            return period, typical, tolerance
+    return None
+
+def analyze_series(merchant_key: str, transactions: list, today: Optional[date] = None) -> Optional[dict]:
+    """Return the recurring series described by one merchant's transactions, or None"""
+    today = today or date.today()
+    posted = sorted((t for t in transactions if not t.get("pending") and t.get("date")), key=lambda t: t["date"])
+    # Several charges on one day (split payments, refunds) count as one occurrence
+    by_day = {}
+    for transaction in posted:
+        by_day.setdefault(transaction["date"], []).append(transaction)
+    days = sorted(by_day)
+    if len(days) < MIN_OCCURRENCES:
+        return None
+
+    dates = [parse_date(day) for day in days]
+    amounts = [sum(t.get("amount", 0.0) for t in by_day[day]) for day in days]
+    intervals = [(later - earlier).days for earlier, later in zip(dates, dates[1:])]
+
+    interval = statistics.median(intervals)
+    classified = classify_period(interval)
+    if classified is None:
+        return None
+    period, typical, tolerance = classified
+    regularity = sum(1 for value in intervals if abs(value - interval) <= tolerance) / len(intervals)
+    if regularity < MIN_REGULARITY:
+        return None
+
+    magnitudes = [abs(amount) for amount in amounts]
+    mean_amount = statistics.fmean(magnitudes)
+    variation = statistics.pstdev(magnitudes) / mean_amount if mean_amount else 0.0
+    if variation > MAX_AMOUNT_VARIATION:
+        return None
+
+    last_date = dates[-1]
+    next_expected = last_date + timedelta(days=round(interval))
+    latest = by_day[days[-1]][-1]
+    return {
+        "merchant_key": merchant_key,
+        "display_name": latest.get("merchant_name") or latest.get("name"),
+        "type": "income" if statistics.fmean(amounts) > 0 else "expense",
+        "period": period,
+        "interval_days": round(interval, 1),
+        "average_amount": round(statistics.fmean(amounts), 2),
+        "last_amount": round(amounts[-1], 2),
+        "amount_stable": variation <= STABLE_AMOUNT_VARIATION,
+        "occurrences": len(days),
+        "first_date": days[0],
+        "last_date": days[-1],
+        "next_expected_date": format_date(next_expected),
+        # Still active unless more than one and a half periods went by without a charge
+        "active": (today - last_date).days <= typical * 1.5,
+        "category_id": latest.get("category_id"),
+        "confidence": round(regularity * (1 - variation), 2)
+    }
+
+def get_recurring_ref(user_id: str):
+    return db.collection(RECURRING_COLLECTION).document(user_id)
+
+TRANSACTION_FIELDS = ["date", "amount", "name", "merchant_name", "merchant_key", "category_id", "pending"]
+
+def rebuild_recurring_series(user_id: str) -> dict:
+    """
+    Analyze the user's whole history in one pass. Transactions stored before
+    merchant_key existed get it written back, so later runs can query by merchant.
+    """
+    groups = {}
+    batch = db.batch()
+    pending_writes = 0
+    query = db.collection("transactions").where("user_id", "==", user_id).select(TRANSACTION_FIELDS)
+    for doc in query.stream():
+        transaction_data = doc.to_dict()
+        merchant_key = transaction_data.get("merchant_key") or normalize_merchant(transaction_data.get("merchant_name"), transaction_data.get("name"))
+        if merchant_key is None:
+            continue
+        groups.setdefault(merchant_key, []).append(transaction_data)
+        if not transaction_data.get("merchant_key"):
+            batch.update(doc.reference, {"merchant_key": merchant_key})
+            pending_writes += 1
+            if pending_writes == BACKFILL_BATCH_SIZE:
+                batch.commit()
+                batch = db.batch()
+                pending_writes = 0
+    if pending_writes:
+        batch.commit()
+
+    series = {}
+    for merchant_key, transactions in groups.items():
+        result = analyze_series(merchant_key, transactions)
+        if result is not None:
+            series[merchant_key] = result
+    return series
+
+def update_recurring_series(user_id: str, merchant_keys: Iterable[str]) -> dict:
+    """Re-analyze the given merchants and store the user's recurring series"""
+    recurring_ref = get_recurring_ref(user_id)
+    recurring_doc = recurring_ref.get()
+    recurring_data = recurring_doc.to_dict() if recurring_doc.exists else {}
+
+    if not recurring_data.get("complete"):
+        series = rebuild_recurring_series(user_id)
+    else:
+        series = dict(recurring_data.get("series", {}))
+        merchant_keys = sorted({key for key in merchant_keys if key})
+        if not merchant_keys:
+            return series
+        groups = {key: [] for key in merchant_keys}
+        for index in range(0, len(merchant_keys), IN_QUERY_LIMIT):
+            chunk = merchant_keys[index:index + IN_QUERY_LIMIT]
+            query = db.collection("transactions").where("user_id", "==", user_id).where("merchant_key", "in", chunk).select(TRANSACTION_FIELDS)
+            for doc in query.stream():
+                transaction_data = doc.to_dict()
+                groups[transaction_data["merchant_key"]].append(transaction_data)
+        for merchant_key, transactions in groups.items():
+            result = analyze_series(merchant_key, transactions)
+            if result is None:
+                series.pop(merchant_key, None)
+            else:
+                series[merchant_key] = result
+
+    recurring_ref.set({
+        "user_id": user_id,
+        "series": series,
+        "complete": True,
+        "updated_at": datetime.now(timezone.utc)
+    })
+    return series
+
+def get_recurring_series(user_id: str) -> list:
+    recurring_doc = get_recurring_ref(user_id).get()
+    if not recurring_doc.exists:
+        return []
+    series = list(recurring_doc.to_dict().get("series", {}).values())
+    # `active` is stored as of the last sync, refresh it for today
+    typical_days = {period: typical for period, typical, _ in PERIODS}
+    today = date.today()
+    for item in series:
+        item["active"] = (today - parse_date(item["last_date"])).days <= typical_days[item["period"]] * 1.5
+    series.sort(key=lambda item: (not item["active"], item["next_expected_date"]))
+    return series
@@ -0,0 +1,246 @@
+from collections import Counter
+from datetime import datetime, timezone, timedelta
+from dotenv import load_dotenv
+from google.cloud import firestore
+from typing import Optional
+from .db import db
+import asyncio
+import hmac
+import json
+import os
+import random
+import sys
+import threading
+import time
+import uuid
+import logging
+
+load_dotenv()
+
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+# Opt-in sampling profiler around individual requests. A request is profiled when it
+# carries X-Debug-Profile matching PROFILE_DEBUG_TOKEN, or when it falls in the
+# PROFILE_SAMPLE_RATE fraction of traffic. While it runs, a background thread samples
+# the Python stacks every PROFILE_INTERVAL_MS; time spent in the Firestore client is
+# attributed from those samples.
+#
+# Profiles are written to the request_profiles collection, so the /admin/profiles
+# routes see the profiles of every worker and instance, not only the one they hit.
+# Firestore deletes them through a TTL policy on `expires_at`
+# (gcloud firestore fields ttls update expires_at --collection-group=request_profiles).
+PROFILE_DEBUG_TOKEN = os.getenv("PROFILE_DEBUG_TOKEN")
+PROFILE_SAMPLE_RATE = float(os.getenv("PROFILE_SAMPLE_RATE", "0"))
+PROFILE_INTERVAL_MS = float(os.getenv("PROFILE_INTERVAL_MS", "5"))
+PROFILES_COLLECTION = "request_profiles"
+profile_ttl = timedelta(days=3)
+# Profiles listed by /admin/profiles
+MAX_PROFILES = 50
+# Keeps a profile document well under Firestore's 1 MiB limit; the dropped stacks
+# and calls are the least sampled ones
+MAX_FOLDED_STACKS = 500
+MAX_FIRESTORE_CALLS = 500
+DEBUG_HEADER = b"x-debug-profile"
+# Fields left out when profiles are listed
+DETAIL_FIELDS = ("folded", "firestore_calls", "top_functions")
+
+# Frames from these files count as Firestore time (the in-memory client is included
+# so profiles taken under the load-test harness look like production ones)
+FIRESTORE_PATH_MARKERS = (
+    os.path.join("google", "cloud", "firestore"),
+    os.path.join("google", "api_core"),
+    "grpc",
+    "memory_firestore.py",
+)
+
+def is_firestore_frame(filename: str) -> bool:
+    return any(marker in filename for marker in FIRESTORE_PATH_MARKERS)
+
+def frame_label(frame) -> str:
+    code = frame.f_code
+    return f"{code.co_name} ({os.path.basename(code.co_filename)}:{frame.f_lineno})"
+
+class SamplingProfiler:
+    """
+    Samples the stacks of every thread but its own. Handlers run partly on the event
+    loop thread and partly in worker threads, so all of them are sampled; requests
+    running concurrently in the same worker can show up in the profile too.
+    """
+
+    def __init__(self, interval_ms: float = PROFILE_INTERVAL_MS):
+        self.interval = interval_ms / 1000
+        self.samples = 0
+        self.stacks = Counter()
+        self.firestore_samples = 0
+        # (caller, start sample, last sample) for each contiguous run of Firestore samples per thread
+        self.firestore_calls = []
+        self._open_calls = {}
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, name="request-profiler", daemon=True)
+
+    def start(self) -> "SamplingProfiler":
+        self._thread.start()
+        return self
+
+    def stop(self) -> None:
+        self._stop.set()
+        self._thread.join()
+        for caller, first, last in self._open_calls.values():
+            self.firestore_calls.append((caller, first, last))
+        self._open_calls = {}
+
+    def _run(self) -> None:
+        own_id = threading.get_ident()
+        while not self._stop.wait(self.interval):
+            self.samples += 1
+            in_firestore = set()
+            for thread_id, frame in sys._current_frames().items():
+                if thread_id == own_id:
+                    continue
+                frames = []
+                while frame is not None:
+                    frames.append(frame)
+                    frame = frame.f_back
+                labels = [frame_label(f) for f in frames]
+                # Idle threads sit in the selector or a queue wait, they are not request work
+                if labels[0].startswith(("select ", "wait ", "_worker ", "poll ", "accept ")):
+                    continue
+                self.stacks[";".join(reversed(labels))] += 1
+
+                # A thread is waiting on Firestore when application code called into the
+                # client: take the first application frame above the innermost client frames.
+                # grpc's own background threads have no such caller and are ignored.
+                caller = None
+                for index, f in enumerate(frames):
+                    if not is_firestore_frame(f.f_code.co_filename):
+                        if index > 0:
+                            caller = labels[index]
+                        break
+                if caller is None:
+                    continue
+                in_firestore.add(thread_id)
+                open_call = self._open_calls.get(thread_id)
+                if open_call and open_call[0] == caller:
+                    self._open_calls[thread_id] = (caller, open_call[1], self.samples)
+                else:
+                    if open_call:
+                        self.firestore_calls.append(open_call)
+                    self._open_calls[thread_id] = (caller, self.samples, self.samples)
+            if in_firestore:
+                self.firestore_samples += 1
+            for thread_id in list(self._open_calls):
+                if thread_id not in in_firestore:
+                    self.firestore_calls.append(self._open_calls.pop(thread_id))
+
+    def summary(self) -> dict:
+        interval_ms = self.interval * 1000
+        function_samples = Counter()
+        for stack, count in self.stacks.items():
+            function_samples[stack.rsplit(";", 1)[-1]] += count
+        return {
+            "interval_ms": interval_ms,
+            "samples": self.samples,
+            "firestore_ms": round(self.firestore_samples * interval_ms, 1),
+            "firestore_calls": [
+                {"caller": caller, "ms": round((last - first + 1) * interval_ms, 1)}
+                for caller, first, last in self.firestore_calls[:MAX_FIRESTORE_CALLS]
+            ],
+            "top_functions": [
+                {"function": function, "samples": count, "ms": round(count * interval_ms, 1)}
+                for function, count in function_samples.most_common(20)
+            ],
+            # Folded stacks, loadable in speedscope or flamegraph.pl
+            "folded": "\n".join(f"{stack} {count}" for stack, count in self.stacks.most_common(MAX_FOLDED_STACKS))
+        }
+
+def should_profile(headers: list) -> bool:
+    for name, value in headers:
+        if name == DEBUG_HEADER:
+            return bool(PROFILE_DEBUG_TOKEN) and hmac.compare_digest(value.decode(errors="replace"), PROFILE_DEBUG_TOKEN)
+    return PROFILE_SAMPLE_RATE > 0 and random.random() < PROFILE_SAMPLE_RATE
+
+def get_body_user_id(body: bytes) -> Optional[str]:
+    try:
+        user_id = json.loads(body).get("user_id")
+        return user_id if isinstance(user_id, str) else None
+    except (ValueError, AttributeError):
+        return None
+
+def save_profile(profile: dict) -> None:
+    try:
+        db.collection(PROFILES_COLLECTION).document(profile["id"]).set({
+            **profile,
+            "expires_at": datetime.now(timezone.utc) + profile_ttl
+        })
+    except Exception as e:
+        # Losing a profile must never fail the request it was taken of
+        logger.error(f"Failed to save request profile {profile['id']}: {str(e)}")
+
+def list_profiles(route: Optional[str] = None, user_id: Optional[str] = None) -> list:
+    """The latest profiles, newest first, without their stacks"""
+    query = db.collection(PROFILES_COLLECTION)
+    if route:
+        query = query.where("route", "==", route)
+    if user_id:
+        query = query.where("user_id", "==", user_id)
+    query = query.order_by("started_at", direction=firestore.Query.DESCENDING).limit(MAX_PROFILES)
+    profiles = []
+    for doc in query.stream():
+        profile = doc.to_dict()
+        profiles.append({key: value for key, value in profile.items() if key not in DETAIL_FIELDS and key != "expires_at"})
+    return profiles
+
+def get_profile(profile_id: str) -> Optional[dict]:
+    profile_doc = db.collection(PROFILES_COLLECTION).document(profile_id).get()
+    if not profile_doc.exists:
+        return None
+    profile = profile_doc.to_dict()
+    profile.pop("expires_at", None)
+    return profile
+
+class RequestProfilerMiddleware:
+    """Pure ASGI middleware, so streaming responses and the request body pass through untouched"""
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or not should_profile(scope.get("headers", [])):
+            await self.app(scope, receive, send)
+            return
+
+        body_chunks = []
+        status = None
+
+        async def receive_and_capture():
+            message = await receive()
+            if message["type"] == "http.request":
+                body_chunks.append(message.get("body", b""))
+            return message
+
+        async def send_and_capture(message):
+            nonlocal status
+            if message["type"] == "http.response.start":
+                status = message["status"]
+            await send(message)
+
+        started_at = datetime.now(timezone.utc)
+        start = time.perf_counter()
+        profiler = SamplingProfiler().start()
+        try:
+            await self.app(scope, receive_and_capture, send_and_capture)
+        finally:
+            profiler.stop()
+            profile = {
+                "id": uuid.uuid4().hex,
+                "method": scope["method"],
+                "route": scope["path"],
+                "status": status,
+                "user_id": get_body_user_id(b"".join(body_chunks)),
+                "started_at": started_at.isoformat(),
+                "duration_ms": round((time.perf_counter() - start) * 1000, 1),
+                **profiler.summary()
+            }
+            # Off the event loop, after the response has been sent
+            await asyncio.to_thread(save_profile, profile)
@@ -0,0 +1,82 @@
+from google.cloud import firestore
+from typing import Optional
+from .db import db
+from .data_version import get_data_version
+import random
+
+# Hot categories (Unallocated Funds, written by every assignment and every income
+# transaction) keep their balance as a sharded counter, so writes spread over several
+# documents instead of queueing on one. The category's own `available` stays the base
+# value and each shard holds a delta:
+#
+#     balance = categories/{id}.available + sum(categories/{id}/available_shards/*.available)
+#
+# An Increment on the category doc itself is therefore still correct, it is just slower
+# under load; the hot write paths go through available_write / stage_available_change.
+SHARDS_SUBCOLLECTION = "available_shards"
+UNALLOCATED_SHARD_COUNT = 10
+
+# category_id -> (data_version, balance). Every write to a balance bumps the user's
+# data version, so a cached sum is valid until the version moves.
+balance_cache = {}
+
+def get_shard_ref(category_ref, index: int):
+    return category_ref.collection(SHARDS_SUBCOLLECTION).document(str(index))
+
+def get_shard_refs(category_ref, shard_count: int) -> list:
+    return [get_shard_ref(category_ref, index) for index in range(shard_count)]
+
+def available_write(category_ref, amount: float, shard_count: int = 0) -> tuple:
+    """The (op, ref, data) write adding `amount` to a category's balance, on a random shard if it is sharded"""
+    if shard_count:
+        shard_ref = get_shard_ref(category_ref, random.randrange(shard_count))
+        # Shards are created by their first increment
+        return ("merge", shard_ref, {"available": firestore.Increment(amount)})
+    return ("update", category_ref, {"available": firestore.Increment(amount)})
+
+def stage_available_change(batch, category_ref, amount: float, shard_count: int = 0) -> None:
+    op, ref, data = available_write(category_ref, amount, shard_count)
+    if op == "merge":
+        batch.set(ref, data, merge=True)
+    else:
+        batch.update(ref, data)
+
+def get_shard_counts(user_id: str, batch=None) -> dict:
+    """
+    category_id -> shard count of the user's Unallocated Funds category, 0 while it is
+    not sharded yet. Users created before sharding have an unsharded one; when the
+    caller passes the batch of a write that bumps the data version, the switch to a
+    sharded counter is staged in it, so it commits with the first writes to the shards
+    and balance caches keyed on the version see it. Nothing has to move, the current
+    balance simply becomes the base.
+    """
+    shard_counts = {}
+    query = db.collection("categories").where("user_id", "==", user_id).where("is_unallocated_funds", "==", True)
+    for doc in query.select(["shard_count"]).stream():
+        shard_count = doc.to_dict().get("shard_count") or 0
+        if not shard_count and batch is not None:
+            shard_count = UNALLOCATED_SHARD_COUNT
+            batch.update(doc.reference, {"shard_count": shard_count})
+        shard_counts[doc.id] = shard_count
+    return shard_counts
+
+def read_balance(category_id: str, category_data: dict, data_version: Optional[int] = None) -> float:
+    """Balance of a category: its `available` plus all its shards, cached per data version"""
+    shard_count = category_data.get("shard_count")
+    if not shard_count:
+        return category_data.get("available", 0.0)
+
+    if data_version is None:
+        data_version = get_data_version(category_data["user_id"])
+    cached = balance_cache.get(category_id)
+    if cached and cached[0] == data_version:
+        return cached[1]
+
+    category_ref = db.collection("categories").document(category_id)
+    balance = category_data.get("available", 0.0)
+    for shard_doc in db.get_all(get_shard_refs(category_ref, shard_count), field_paths=["available"]):
+        if shard_doc.exists:
+            balance += shard_doc.to_dict().get("available", 0.0)
+    balance = round(balance, 2)
+    balance_cache[category_id] = (data_version, balance)
+    return balance
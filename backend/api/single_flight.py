@@ -0,0 +1,30 @@
+import asyncio
+from typing import Callable, Hashable
+
+# In-process request coalescing: concurrent calls with the same key share one
+# computation, run in a worker thread so the event loop keeps serving requests
+# while Firestore is queried. Keys should carry the user's data version so a
+# request made after a write never receives a result computed before it.
+in_flight = {}
+single_flight_stats = {"computed": 0, "coalesced": 0}
+
+def forget(key: Hashable, task: asyncio.Future) -> None:
+    if in_flight.get(key) is task:
+        del in_flight[key]
+
+async def single_flight(key: Hashable, compute: Callable, *args):
+    """Return compute(*args), joining the in-flight computation for `key` if there is one"""
+    loop = asyncio.get_running_loop()
+    # Reads dispatched by /batch run on their own event loops and cannot await a task
+    # from another loop, so flights are keyed per loop
+    key = (id(loop), key)
+    task = in_flight.get(key)
+    if task is None:
+        single_flight_stats["computed"] += 1
+        task = asyncio.ensure_future(asyncio.to_thread(compute, *args))
+        in_flight[key] = task
+        task.add_done_callback(lambda done: forget(key, done))
+    else:
+        single_flight_stats["coalesced"] += 1
+    # Shielded so a caller that disconnects does not cancel the work the others are waiting on
+    return await asyncio.shield(task)
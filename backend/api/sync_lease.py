@@ -0,0 +1,195 @@
+from fastapi import HTTPException
+from datetime import datetime, timezone, timedelta
+from google.api_core.exceptions import AlreadyExists, FailedPrecondition, NotFound
+from typing import Optional
+from .db import db
+from .plaid_sync import run_plaid_sync, LeaseLostError
+import threading
+import time
+import uuid
+import logging
+
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+# Only one Plaid sync runs per user at a time, across every instance of the API. The
+# sync holds a lease in sync_leases/{user_id} that a heartbeat keeps extending; a lease
+# whose holder died simply expires. A caller that finds the lease held waits for that
+# sync and returns its result when it covered the caller's items, instead of fetching
+# the same pages and inserting the same transactions a second time.
+#
+# Each page checkpoint is fenced on the lease: a sync that stalled past LEASE_SECONDS
+# and lost its lease to another one stops at its next page instead of writing on.
+LEASES_COLLECTION = "sync_leases"
+LEASE_SECONDS = 90
+HEARTBEAT_SECONDS = 30
+POLL_SECONDS = 1.0
+# Upper bound on waiting for someone else's sync. Callers are HTTP requests; past this
+# they are told the sync is still running (a 202) instead of holding the connection.
+MAX_WAIT_SECONDS = 25
+SYNC_RUNNING_RESPONSE = {"message": "Sync already running.", "status": "running"}
+
+def get_lease_ref(user_id: str):
+    return db.collection(LEASES_COLLECTION).document(user_id)
+
+def try_acquire_lease(user_id: str, owner: str, item_ids: list) -> Optional[dict]:
+    """
+    Take the user's sync lease. Returns None on success, otherwise the lease currently
+    held. Taking over a finished or expired lease is conditional on the document not
+    having changed since it was read, so two callers can never both win it.
+    """
+    lease_ref = get_lease_ref(user_id)
+    now = datetime.now(timezone.utc)
+    lease_data = {
+        "user_id": user_id,
+        "owner": owner,
+        "item_ids": item_ids,
+        "status": "running",
+        "started_at": now,
+        "heartbeat_at": now,
+        "expires_at": now + timedelta(seconds=LEASE_SECONDS),
+        "result": None,
+        "error": None
+    }
+
+    lease_doc = lease_ref.get()
+    if not lease_doc.exists:
+        try:
+            lease_ref.create(lease_data)
+            return None
+        except AlreadyExists:
+            return lease_ref.get().to_dict()
+
+    lease = lease_doc.to_dict()
+    if lease["status"] == "running" and lease["expires_at"] > now:
+        return lease
+    try:
+        lease_ref.update(lease_data, option=db.write_option(last_update_time=lease_doc.update_time))
+        return None
+    except (FailedPrecondition, NotFound):
+        return lease_ref.get().to_dict() or lease
+
+class LeaseHeartbeat:
+    """Keeps extending a held lease from a background thread until stopped"""
+
+    def __init__(self, user_id: str, owner: str):
+        self.user_id = user_id
+        self.owner = owner
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, name=f"sync-lease-{user_id}", daemon=True)
+
+    def start(self) -> "LeaseHeartbeat":
+        self._thread.start()
+        return self
+
+    def stop(self) -> None:
+        self._stop.set()
+        self._thread.join()
+
+    def _run(self) -> None:
+        lease_ref = get_lease_ref(self.user_id)
+        while not self._stop.wait(HEARTBEAT_SECONDS):
+            try:
+                lease_doc = lease_ref.get()
+                if not lease_doc.exists or lease_doc.to_dict().get("owner") != self.owner:
+                    logger.warning(f"Lost the sync lease of user {self.user_id}")
+                    return
+                now = datetime.now(timezone.utc)
+                lease_ref.update(
+                    {"heartbeat_at": now, "expires_at": now + timedelta(seconds=LEASE_SECONDS)},
+                    option=db.write_option(last_update_time=lease_doc.update_time)
+                )
+            except Exception as e:
+                # The next beat tries again; the lease only lapses after LEASE_SECONDS
+                logger.warning(f"Sync lease heartbeat for user {self.user_id} failed: {str(e)}")
+
+def lease_fence(user_id: str, owner: str):
+    """
+    The fence a leased sync passes to run_plaid_sync. Called before a page is written it
+    checks that `owner` still holds the lease; called with the page's checkpoint batch it
+    also makes that commit conditional on the lease doc being unchanged since, so a sync
+    that lost the lease cannot advance the cursor under the new holder. (A heartbeat
+    landing in that window fails the checkpoint too; the next sync replays the page.)
+    """
+    lease_ref = get_lease_ref(user_id)
+
+    def fence(checkpoint=None) -> None:
+        lease_doc = lease_ref.get()
+        if not lease_doc.exists or lease_doc.to_dict().get("owner") != owner:
+            raise LeaseLostError(f"Lost the sync lease of user {user_id}")
+        if checkpoint is not None:
+            checkpoint.update(lease_ref, {"checkpoint_at": datetime.now(timezone.utc)}, option=db.write_option(last_update_time=lease_doc.update_time))
+    return fence
+
+def release_lease(user_id: str, owner: str, result: Optional[dict] = None, error: Optional[str] = None) -> None:
+    """Mark the sync finished and publish its outcome to anyone waiting on it"""
+    lease_ref = get_lease_ref(user_id)
+    lease_doc = lease_ref.get()
+    if not lease_doc.exists or lease_doc.to_dict().get("owner") != owner:
+        return
+    now = datetime.now(timezone.utc)
+    lease_ref.update({
+        "status": "failed" if error else "completed",
+        "result": result,
+        "error": error,
+        "finished_at": now,
+        "expires_at": now
+    })
+
+def wait_for_lease(user_id: str, owner: str, deadline: float) -> dict:
+    """Poll a lease held by `owner` until that sync finishes or the lease expires"""
+    lease_ref = get_lease_ref(user_id)
+    while time.monotonic() < deadline:
+        time.sleep(POLL_SECONDS)
+        lease = lease_ref.get().to_dict()
+        if lease is None or lease.get("owner") != owner:
+            return {"status": "replaced"}
+        if lease["status"] != "running" or lease["expires_at"] <= datetime.now(timezone.utc):
+            return lease
+    return {"status": "running"}
+
+def run_leased_plaid_sync(user_id: str, plaid_items_docs: list) -> dict:
+    """
+    Run run_plaid_sync for the given items under the user's sync lease. If another sync
+    holds the lease, wait for it: when it covered all of these items its result is
+    returned, otherwise this sync runs once it is done. If it is still running after
+    MAX_WAIT_SECONDS, SYNC_RUNNING_RESPONSE is returned.
+    """
+    owner = uuid.uuid4().hex
+    item_ids = sorted(item_doc.id for item_doc in plaid_items_docs)
+    deadline = time.monotonic() + MAX_WAIT_SECONDS
+    while True:
+        lease = try_acquire_lease(user_id, owner, item_ids)
+        if lease is None:
+            break
+        logger.info(f"Sync for user {user_id} is already running ({lease['owner']}), waiting for it")
+        finished = wait_for_lease(user_id, lease["owner"], deadline)
+        if finished.get("status") == "running":
+            return dict(SYNC_RUNNING_RESPONSE)
+        covered = set(item_ids) <= set(lease.get("item_ids") or [])
+        if covered and finished.get("status") == "completed":
+            return {**finished["result"], "attached": True}
+        if covered and finished.get("status") == "failed":
+            raise HTTPException(status_code=500, detail=f"Failed to sync transactions: {finished.get('error')}")
+        # Expired, replaced, or it synced other items: try to take the lease ourselves
+
+    heartbeat = LeaseHeartbeat(user_id, owner).start()
+    try:
+        # Re-read the items so the sync starts from the cursors the last holder saved
+        fresh_docs = [doc for doc in db.get_all([item_doc.reference for item_doc in plaid_items_docs]) if doc.exists]
+        result = run_plaid_sync(user_id, fresh_docs, fence=lease_fence(user_id, owner))
+    except LeaseLostError as e:
+        heartbeat.stop()
+        logger.warning(f"Sync for user {user_id} stopped: {str(e)}")
+        raise HTTPException(status_code=409, detail="The sync was taken over by another one, which continues from the last committed page")
+    except HTTPException as e:
+        heartbeat.stop()
+        release_lease(user_id, owner, error=str(e.detail))
+        raise
+    except Exception as e:
+        heartbeat.stop()
+        release_lease(user_id, owner, error=str(e))
+        raise
+    heartbeat.stop()
+    release_lease(user_id, owner, result=result)
+    return result
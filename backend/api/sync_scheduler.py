@@ -0,0 +1,65 @@
+from .db import db
+from .sync_lease import run_leased_plaid_sync
+import asyncio
+import logging
+
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+# Plaid tends to send SYNC_UPDATES_AVAILABLE in bursts (initial, historical and
+# then incremental updates), so each item waits this long before syncing and
+# every webhook that arrives in the meantime is folded into the same run.
+sync_delay_seconds = 30
+
+# plaid_items doc id -> "pending" (timer armed), "running" or "rerun"
+# (a webhook arrived mid-sync, so sync again once the current run finishes)
+item_sync_state = {}
+# The event loop only keeps weak references to tasks, so running syncs are held here
+# until they finish, or they could be garbage collected mid-run
+sync_tasks = set()
+
+def schedule_item_sync(item_doc_id: str) -> bool:
+    """
+    Schedule an incremental sync of one plaid_items document.
+    Returns False when the webhook was coalesced into an already scheduled sync.
+    """
+    state = item_sync_state.get(item_doc_id)
+    if state == "pending" or state == "rerun":
+        return False
+    if state == "running":
+        item_sync_state[item_doc_id] = "rerun"
+        return False
+
+    item_sync_state[item_doc_id] = "pending"
+    loop = asyncio.get_running_loop()
+    loop.call_later(sync_delay_seconds, start_item_sync, item_doc_id)
+    return True
+
+def start_item_sync(item_doc_id: str) -> None:
+    task = asyncio.create_task(run_item_sync(item_doc_id))
+    sync_tasks.add(task)
+    task.add_done_callback(sync_tasks.discard)
+
+async def run_item_sync(item_doc_id: str) -> None:
+    item_sync_state[item_doc_id] = "running"
+    try:
+        # Re-read the item so the sync starts from the latest saved cursor
+        item_doc = db.collection("plaid_items").document(item_doc_id).get()
+        if not item_doc.exists:
+            logger.info(f"Plaid item {item_doc_id} was deleted before its scheduled sync")
+            return
+        item_data = item_doc.to_dict()
+        # The sync blocks on Plaid and Firestore, keep it off the event loop
+        summary = await asyncio.to_thread(run_leased_plaid_sync, item_data["user_id"], [item_doc])
+        if summary.get("status") == "running":
+            # Another sync held the lease past the wait, and it may not cover this item
+            logger.info(f"Sync of plaid item {item_doc_id} is waiting on a running sync, rescheduling")
+            item_sync_state[item_doc_id] = "rerun"
+            return
+        logger.info(f"Webhook sync finished for plaid item {item_doc_id}: {summary}")
+    except Exception as e:
+        logger.error(f"Webhook sync failed for plaid item {item_doc_id}: {str(e)}")
+    finally:
+        state = item_sync_state.pop(item_doc_id, None)
+        if state == "rerun":
+            schedule_item_sync(item_doc_id)
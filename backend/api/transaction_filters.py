@@ -0,0 +1,57 @@
+from google.cloud import firestore
+from .db import NULL_VALUE
+from .budget_aggregates import get_next_day_str
+
+# Server-side filters of the transactions feed. Every supported filter combination is
+# one Firestore query served by one composite index: the user_id and equality filters
+# first, then the feed order (date, newest first), then amount for amount ranges. A
+# date range filters on the order field itself, so it uses the same index.
+#
+# firestore_indexes.py generates the manifest from these constants, so adding a filter
+# here and regenerating firestore.indexes.json keeps every combination indexed.
+
+# Equality filters, in the order their fields appear in the composite indexes
+EQUALITY_FILTERS = ("category_id", "institution_name", "account_name", "pending", "type")
+TRANSACTION_TYPES = ("debit", "credit")
+
+def normalize_filter(filter_spec: dict) -> dict:
+    """
+    Drop unset filters and validate the rest. Raises ValueError on an invalid spec.
+    `uncategorized` is the category_id == null filter.
+    """
+    spec = {key: value for key, value in filter_spec.items() if value is not None}
+    if spec.pop("uncategorized", False):
+        if "category_id" in spec:
+            raise ValueError("category_id and uncategorized cannot be combined")
+        spec["category_id"] = NULL_VALUE
+
+    if spec.get("type") is not None and spec["type"] not in TRANSACTION_TYPES:
+        raise ValueError(f"type must be one of: {', '.join(TRANSACTION_TYPES)}")
+    if spec.get("start_date") and spec.get("end_date") and spec["start_date"] > spec["end_date"]:
+        raise ValueError("start_date is after end_date")
+    if spec.get("min_amount") is not None and spec.get("max_amount") is not None and spec["min_amount"] > spec["max_amount"]:
+        raise ValueError("min_amount is greater than max_amount")
+    return spec
+
+def apply_filter(query, spec: dict):
+    """Add a normalized filter spec and the feed order to a query already filtered on user_id"""
+    for field in EQUALITY_FILTERS:
+        if field in spec:
+            query = query.where(field, "==", spec[field])
+    if spec.get("start_date"):
+        query = query.where("date", ">=", spec["start_date"])
+    if spec.get("end_date"):
+        query = query.where("date", "<", get_next_day_str(spec["end_date"]))
+    if spec.get("min_amount") is not None:
+        query = query.where("amount", ">=", spec["min_amount"])
+    if spec.get("max_amount") is not None:
+        query = query.where("amount", "<=", spec["max_amount"])
+    return query.order_by("date", direction=firestore.Query.DESCENDING)
+
+def index_fields(equality_fields: tuple, amount_range: bool) -> list:
+    fields = [{"fieldPath": "user_id", "order": "ASCENDING"}]
+    fields += [{"fieldPath": field, "order": "ASCENDING"} for field in equality_fields]
+    fields.append({"fieldPath": "date", "order": "DESCENDING"})
+    if amount_range:
+        fields.append({"fieldPath": "amount", "order": "ASCENDING"})
+    return fields
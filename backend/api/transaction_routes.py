@@ -1,10 +1,20 @@
-from fastapi import APIRouter, HTTPException
+from fastapi import APIRouter, HTTPException, Request, Response, Header
 from pydantic import BaseModel
 from datetime import datetime, timezone
 from decimal import Decimal
+from typing import Optional, List
 from google.cloud import firestore
-from .db import db, NULL_VALUE
-from .plaid_utils import get_plaid_transactions, get_saved_cursor  # Assuming helper functions exist for Plaid API calls
+from .db import db, new_batch
+from .data_version import get_etag, etag_matches, not_modified, bump_data_version, get_data_version
+from .single_flight import single_flight
+from .period_snapshots import invalidate_closed_snapshots
+from .period_keys import get_pay_start
+from .budget_periods import get_period_keys
+from .idempotency import get_idempotency_ref, lookup_idempotent_response, record_idempotent_response, commit_idempotent
+from .sync_lease import run_leased_plaid_sync
+from .recurring_detection import normalize_merchant, get_recurring_series
+from .sharded_counters import stage_available_change, read_balance
+from .transaction_filters import normalize_filter, apply_filter
 from backend.db.schemas import Transaction as TransactionSchema
 import logging
 import os
@@ -25,38 +35,42 @@ logger = logging.getLogger(__name__)
 
 router = APIRouter()
 
-def convert_plaid_personal_finance_category(pfc):
-    """Convert Plaid PersonalFinanceCategory object to a dictionary for Firestore storage"""
-    if not pfc:
-        return None
-    
-    if hasattr(pfc, 'to_dict'):
-        return pfc.to_dict()
-    elif hasattr(pfc, '__dict__'):
-        return pfc.__dict__
-    elif isinstance(pfc, dict):
-        return pfc
-    else:
-        # Fallback - try to extract common fields manually
-        try:
-            return {
-                'confidence_level': getattr(pfc, 'confidence_level', None),
-                'detailed': getattr(pfc, 'detailed', None),
-                'primary': getattr(pfc, 'primary', None)
-            }
-        except:
-            return None
+# Fields the transaction lists render. Lists fetch only these through a Firestore
+# projection; the full document (personal_finance_category, created_at, ...) comes
+# from /get-transaction when a transaction is opened.
+LIST_FIELDS = ["amount", "category_id", "date", "name", "pending", "type", "user_id"]
+TRANSACTION_FIELDS = set(TransactionSchema.model_fields) | {"pending_transaction_id"}
 
 class User(BaseModel):
     email: str
     user_id: str
 
+# Filters of the transactions feed; each combination runs as one indexed query
+# (see transaction_filters.py)
+class TransactionFilter(BaseModel):
+    category_id: Optional[str] = None
+    uncategorized: bool = False  # Only transactions without a category
+    institution_name: Optional[str] = None
+    account_name: Optional[str] = None
+    pending: Optional[bool] = None  # Manual transactions have no pending state and match neither
+    type: Optional[str] = None  # 'debit' or 'credit'
+    start_date: Optional[str] = None  # YYYY-MM-DD, inclusive
+    end_date: Optional[str] = None  # YYYY-MM-DD, inclusive
+    min_amount: Optional[float] = None  # Signed, spending is negative
+    max_amount: Optional[float] = None
+
 # Request model for the POST request
 class UserIDRequest(BaseModel):
     user_id: str
-    category_id: str = None
+    category_id: str = None  # Kept for older clients, same as filter.category_id ("null" for uncategorized)
+    filter: Optional[TransactionFilter] = None
     limit: int = 20  # Default number of transactions per page
     cursor_id: str = None  # Document ID to start after for pagination
+    fields: Optional[List[str]] = None  # Fields to return, LIST_FIELDS by default, ["*"] for whole documents
+
+class TransactionDetailRequest(BaseModel):
+    user_id: str
+    transaction_id: str
 
 class Category(BaseModel):
     name: str
@@ -86,89 +100,146 @@ class UpdateTransactionDateRequest(BaseModel):
 class SyncPlaidTransactionsRequest(BaseModel):
     user_id: str
 
+class RecurringSeriesRequest(BaseModel):
+    user_id: str
+
+def resolve_fields(fields: Optional[List[str]]) -> Optional[tuple]:
+    """The fields to project, or None for whole documents"""
+    if fields is None:
+        return tuple(LIST_FIELDS)
+    if fields == ["*"]:
+        return None
+    unknown = set(fields) - TRANSACTION_FIELDS
+    if unknown:
+        raise HTTPException(status_code=400, detail=f"Unknown transaction fields: {', '.join(sorted(unknown))}")
+    return tuple(sorted(set(fields)))
+
+def resolve_filter(request: UserIDRequest) -> dict:
+    """The normalized filter spec of a get-transactions request"""
+    filter_spec = request.filter.model_dump() if request.filter else {}
+    # The legacy category_id parameter, with "null" meaning uncategorized
+    if request.category_id == "null":
+        filter_spec["uncategorized"] = True
+    elif request.category_id:
+        filter_spec["category_id"] = request.category_id
+    try:
+        return normalize_filter(filter_spec)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+def query_transactions(user_id: str, filter_spec: dict, limit: int, cursor_id: Optional[str], fields: Optional[tuple] = None) -> dict:
+    # Filter and sort by date in descending order (most recent first), one indexed query
+    transactions_query = apply_filter(db.collection("transactions").where("user_id", "==", user_id), filter_spec)
+    
+    # If cursor_id is provided, start after that document for pagination
+    if cursor_id:
+        # Get the document to use as cursor
+        cursor_doc = db.collection("transactions").document(cursor_id).get()
+        if cursor_doc.exists:
+            transactions_query = transactions_query.start_after(cursor_doc)
+            print(f"Starting after document with ID: {cursor_id}")
+        else:
+            print(f"Cursor document with ID {cursor_id} not found")
+    
+    # Limit the number of results
+    transactions_query = transactions_query.limit(limit)
+
+    # Transfer and deserialize only the fields asked for
+    if fields is not None:
+        transactions_query = transactions_query.select(list(fields))
+    
+    # Execute the query
+    transactions_docs = transactions_query.stream()
+
+    # Collect transactions into a list, converting each document to a dictionary
+    transactions = []
+    last_doc_id = None
+    
+    for doc in transactions_docs:
+        transaction_data = doc.to_dict()
+        transaction_data["id"] = doc.id  # Add the transaction ID to the response
+        
+        # Store the last document ID for pagination
+        last_doc_id = doc.id
+        
+        # Debug the category ID situation
+        # print(f"Transaction {doc.id} category_id = {transaction_data.get('category_id')}")
+        
+        # Remove or handle any unserializable fields here, if necessary
+        transactions.append(transaction_data)
+
+    # Sort transactions by date (most to least recent)
+    # Note: This should be unnecessary since we're already sorting in the query
+    # transactions.sort(key=lambda x: x["date"], reverse=True)
+
+    # Determine if there are more results
+    has_more = len(transactions) == limit
+    
+    # Return the transactions along with pagination metadata
+    return {
+        "transactions": transactions,
+        "pagination": {
+            "has_more": has_more,
+            "next_cursor": last_doc_id if has_more else None
+        }
+    }
+
 @router.post("/get-transactions")
-async def get_transactions(request: UserIDRequest):
+async def get_transactions(request: UserIDRequest, http_request: Request, response: Response):
     try:
         # print(f"Request received: user_id={request.user_id}, category_id={request.category_id}, limit={request.limit}, cursor_id={request.cursor_id}")
         
-        # Start with the basic user_id filter
-        transactions_query = db.collection("transactions").where("user_id", "==", request.user_id)
+        fields = resolve_fields(request.fields)
+        filter_spec = resolve_filter(request)
+        filter_key = tuple(sorted(filter_spec.items()))
+
+        # The first page is refetched on every focus, so answer it conditionally
+        if not request.cursor_id:
+            etag = get_etag(request.user_id, "transactions", filter_key, request.limit, fields)
+            if etag_matches(http_request, etag):
+                return not_modified(etag)
+            response.headers["ETag"] = etag
         
-        # If a category_id is provided, add that filter
-        if request.category_id:
-            # logger.info(f"Filtering transactions by category_id: {request.category_id}")
-            
-            # Special case for handling "null" category - find transactions with no category
-            if request.category_id == "null":
-                print("Filtering for null category_id")
-                # Use NULL_VALUE (None) for consistent null value handling
-                transactions_query = db.collection("transactions").where("user_id", "==", request.user_id).where("category_id", "==", NULL_VALUE)
-                
-                print(f"Using NULL_VALUE to query for transactions with null category_id")
-            else:
-                transactions_query = db.collection("transactions").where("user_id", "==", request.user_id).where("category_id", "==", request.category_id)
-        
-        # Sort by date in descending order (most recent first)
-        transactions_query = transactions_query.order_by("date", direction=firestore.Query.DESCENDING)
-        
-        # If cursor_id is provided, start after that document for pagination
-        if request.cursor_id:
-            # Get the document to use as cursor
-            cursor_doc = db.collection("transactions").document(request.cursor_id).get()
-            if cursor_doc.exists:
-                transactions_query = transactions_query.start_after(cursor_doc)
-                print(f"Starting after document with ID: {request.cursor_id}")
-            else:
-                print(f"Cursor document with ID {request.cursor_id} not found")
-        
-        # Limit the number of results
-        transactions_query = transactions_query.limit(request.limit)
-        
-        # Execute the query
-        transactions_docs = transactions_query.stream()
-
-        # Collect transactions into a list, converting each document to a dictionary
-        transactions = []
-        last_doc_id = None
-        
-        for doc in transactions_docs:
-            transaction_data = doc.to_dict()
-            transaction_data["id"] = doc.id  # Add the transaction ID to the response
-            
-            # Store the last document ID for pagination
-            last_doc_id = doc.id
-            
-            # Debug the category ID situation
-            # print(f"Transaction {doc.id} category_id = {transaction_data.get('category_id')}")
-            
-            # Remove or handle any unserializable fields here, if necessary
-            transactions.append(transaction_data)
-
-        # Sort transactions by date (most to least recent)
-        # Note: This should be unnecessary since we're already sorting in the query
-        # transactions.sort(key=lambda x: x["date"], reverse=True)
-
-        # Determine if there are more results
-        has_more = len(transactions) == request.limit
-        
-        # Return the transactions along with pagination metadata
-        return {
-            "transactions": transactions,
-            "pagination": {
-                "has_more": has_more,
-                "next_cursor": last_doc_id if has_more else None
-            }
-        }
+        # Identical concurrent requests share one Firestore query
+        flight_key = ("get-transactions", request.user_id, filter_key, request.limit, request.cursor_id, fields, get_data_version(request.user_id))
+        return await single_flight(flight_key, query_transactions, request.user_id, filter_spec, request.limit, request.cursor_id, fields)
     
+    except HTTPException as e:
+        raise e
     except Exception as e:
         logger.error(f"Failed to get transactions for user_id: {request.user_id}, error: {str(e)}")
         raise HTTPException(status_code=500, detail=f"Failed to get transactions: {str(e)}")
     
+# Whole document of one transaction, for the transaction details view
+@router.post("/get-transaction")
+async def get_transaction(request: TransactionDetailRequest):
+    try:
+        transaction_doc = db.collection("transactions").document(request.transaction_id).get()
+        if not transaction_doc.exists:
+            raise HTTPException(status_code=404, detail="Transaction not found")
+
+        transaction_data = transaction_doc.to_dict()
+        if transaction_data.get("user_id") != request.user_id:
+            raise HTTPException(status_code=403, detail="User ID does not match the transaction")
+
+        transaction_data["id"] = transaction_doc.id
+        return {"transaction": transaction_data}
+    except HTTPException as e:
+        raise e
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Failed to get transaction: {str(e)}")
+
 @router.post("/create-transaction")
-async def create_transaction(transaction: Transaction):
+async def create_transaction(transaction: Transaction, idempotency_key: Optional[str] = Header(None)):
     try:
         # logger.info("Creating a new transaction with name: %s for user_id: %s and category_id: %s", transaction.name, transaction.user_id, transaction.category_id)
         
+        # Replay the stored response if this is a retry of a request that already committed
+        idempotency_ref = get_idempotency_ref(transaction.user_id, "create-transaction", idempotency_key)
+        cached_response = lookup_idempotent_response(idempotency_ref, transaction)
+        if cached_response is not None:
+            return cached_response
+        
         user_ref = db.collection("users").document(transaction.user_id)
         category_ref = db.collection("categories").document(transaction.category_id)
 
@@ -187,26 +258,35 @@ async def create_transaction(transaction: Transaction):
             category_id=transaction.category_id,
             name=transaction.name,
             date=transaction.date,
-            type="debit" if transaction.amount < 0 else "credit"
+            merchant_key=normalize_merchant(None, transaction.name),
+            type="debit" if transaction.amount < 0 else "credit",
+            **get_period_keys(transaction.date, get_pay_start(user_doc.to_dict()))
         )
         
         # Calculate new available amount for the category
         category_data = category_doc.to_dict()
-        current_available = Decimal(str(category_data.get("available", 0.0)))
+        current_available = Decimal(str(read_balance(transaction.category_id, category_data)))
         new_available = current_available + transaction.amount
         
         # Use batch write for atomicity
-        batch = db.batch()
+        batch = new_batch()
         
         # 1. Create the transaction
         transaction_ref = db.collection("transactions").document()
         batch.set(transaction_ref, transaction_schema.to_dict())
         
         # 2. Update category available amount
-        batch.update(category_ref, {"available": float(new_available)})
+        stage_available_change(batch, category_ref, float(transaction.amount), category_data.get("shard_count", 0))
+        bump_data_version(transaction.user_id, batch)
+        invalidate_closed_snapshots(transaction.user_id, [transaction.date], batch)
+        
+        response = {"message": "Transaction created successfully.", "transaction_id": transaction_ref.id}
+        record_idempotent_response(batch, idempotency_ref, transaction.user_id, "create-transaction", transaction, response)
         
         # Execute all writes atomically
-        batch.commit()
+        replayed_response = commit_idempotent(batch, idempotency_ref, transaction)
+        if replayed_response is not None:
+            return replayed_response
         
         # Get user email for logging
         user_data = user_doc.to_dict()
@@ -216,7 +296,9 @@ async def create_transaction(transaction: Transaction):
         transaction_logger.info(f"Transaction created with category - Transaction: '{transaction.name}' (ID: {transaction_ref.id}), Amount: ${transaction.amount}, Category: '{category_data.get('name', 'Unknown')}' (ID: {transaction.category_id}), New category available: ${new_available}, User ID: {transaction.user_id}, User Email: {user_email}")
         
         # logger.info("Transaction created successfully with ID: %s", transaction_ref.id)
-        return {"message": "Transaction created successfully.", "transaction_id": transaction_ref.id}
+        return response
+    except HTTPException as e:
+        raise e
     except ValueError as e:
         # This will catch validation errors from the Pydantic model
         raise HTTPException(status_code=400, detail=str(e))
@@ -254,20 +336,22 @@ async def delete_transaction(request: DeleteTransactionRequest):
             # Calculate new available amount for the category
             category_data = category_doc.to_dict()
             transaction_amount = Decimal(str(transaction_data["amount"]))
-            current_available = Decimal(str(category_data.get("available", 0.0)))
+            current_available = Decimal(str(read_balance(category_id, category_data)))
             new_available = current_available - transaction_amount
         else:
             print("Transaction has no category - skipping category update")
 
         # Use batch write for atomicity
-        batch = db.batch()
+        batch = new_batch()
         
         # 1. Delete the transaction
         batch.delete(transaction_ref)
         
         # 2. Update category available amount if transaction had a category
         if category_id and new_available is not None:
-            batch.update(category_ref, {"available": float(new_available)})
+            stage_available_change(batch, category_ref, -float(transaction_amount), category_data.get("shard_count", 0))
+        bump_data_version(request.user_id, batch)
+        invalidate_closed_snapshots(request.user_id, [transaction_data.get("date")], batch)
         
         # Execute all writes atomically
         batch.commit()
@@ -353,15 +437,15 @@ async def update_transaction_category(request: UpdateTransactionCategoryRequest)
         new_new_available = None
         
         if old_category_data:
-            old_available = Decimal(str(old_category_data.get("available", 0.0)))
+            old_available = Decimal(str(read_balance(old_category_id, old_category_data)))
             new_old_available = old_available - Decimal(str(transaction_amount))
             
         if new_category_data:
-            new_available = Decimal(str(new_category_data.get("available", 0.0)))
+            new_available = Decimal(str(read_balance(request.category_id, new_category_data)))
             new_new_available = new_available + Decimal(str(transaction_amount))
 
         # Use batch write for atomicity
-        batch = db.batch()
+        batch = new_batch()
         
         # 1. Update the transaction's category_id
         if request.category_id == "null" or request.category_id is None:
@@ -371,11 +455,13 @@ async def update_transaction_category(request: UpdateTransactionCategoryRequest)
         
         # 2. Update old category available amount (subtract transaction amount)
         if old_category_data and old_category_ref:
-            batch.update(old_category_ref, {"available": float(new_old_available)})
+            stage_available_change(batch, old_category_ref, -float(transaction_amount), old_category_data.get("shard_count", 0))
         
         # 3. Update new category available amount (add transaction amount)
         if new_category_data and new_category_ref:
-            batch.update(new_category_ref, {"available": float(new_new_available)})
+            stage_available_change(batch, new_category_ref, float(transaction_amount), new_category_data.get("shard_count", 0))
+        bump_data_version(request.user_id, batch)
+        invalidate_closed_snapshots(request.user_id, [transaction_data.get("date")], batch)
         
         # Execute all writes atomically
         batch.commit()
@@ -426,17 +512,22 @@ async def update_transaction_date(request: UpdateTransactionDateRequest):
             print(f"Date is already the same ({request.date}), no update needed")
             return {"message": "Transaction date is already set to the requested date.", "transaction_id": request.transaction_id}
         
-        # Update the transaction date
-        transaction_ref.update({"date": request.date})
-        
-        # Get user email for logging
+        # Get user email for logging and the pay schedule for the period keys
         user_ref = db.collection("users").document(request.user_id)
         user_doc = user_ref.get()
         user_email = "Unknown"
+        user_data = None
         if user_doc.exists:
             user_data = user_doc.to_dict()
             user_email = user_data.get("email", "Unknown")
         
+        # Update the transaction date and the period keys derived from it
+        batch = new_batch()
+        batch.update(transaction_ref, {"date": request.date, **get_period_keys(request.date, get_pay_start(user_data))})
+        bump_data_version(request.user_id, batch)
+        invalidate_closed_snapshots(request.user_id, [transaction_data.get("date"), request.date], batch)
+        batch.commit()
+        
         # Log the transaction date update
         transaction_logger.info(f"Transaction date updated - User: {user_email}, Transaction ID: {request.transaction_id}, Old Date: {transaction_data.get('date')}, New Date: {request.date}")
         
@@ -447,308 +538,31 @@ async def update_transaction_date(request: UpdateTransactionDateRequest):
         raise HTTPException(status_code=500, detail=f"Failed to update transaction date: {e}")
 
 @router.post("/sync-plaid-transactions")
-async def sync_plaid_transactions(request: SyncPlaidTransactionsRequest):
+async def sync_plaid_transactions(request: SyncPlaidTransactionsRequest, response: Response):
     try:
         print(f"Starting sync for user_id: {request.user_id}")
         
-        user_id = request.user_id
-        plaid_items_query = db.collection("plaid_items").where("user_id", "==", user_id)
+        plaid_items_query = db.collection("plaid_items").where("user_id", "==", request.user_id)
         plaid_items_docs = list(plaid_items_query.stream())  # Convert to list so we can iterate twice
 
-        added_transactions = []
-        modified_transactions = []
-        deleted_transactions = []
-        
-        # Keep track of which item each transaction belongs to
-        transaction_item_map = {}
-        
-        # Store cursor updates to apply later
-        cursor_updates = {}
-
-        for item_doc in plaid_items_docs:
-            item_data = item_doc.to_dict()
-            item_id = item_doc.id
-            print(f"Processing Plaid item: {item_data['institution_name']}")
-            # print(f"Processing Plaid item with access_token: {item_data['access_token']}")
-            
-            saved_cursor = item_data.get("cursor")
-            has_more = True
-            last_cursor = None
-
-            while has_more:
-                plaid_response = get_plaid_transactions(item_data["access_token"], cursor=saved_cursor)
-                # print(f"Fetched transactions from Plaid: {plaid_response}")
-
-                # Save the new cursor value (but don't update the database yet)
-                new_cursor = plaid_response.get("next_cursor")
-                if new_cursor:
-                    last_cursor = new_cursor
-                    saved_cursor = new_cursor
-
-                # Associate each transaction with this Plaid item's data
-                for trans in plaid_response.get("added", []):
-                    transaction_item_map[trans["transaction_id"]] = item_data
-                
-                for trans in plaid_response.get("modified", []):
-                    transaction_item_map[trans["transaction_id"]] = item_data
-                
-                for trans in plaid_response.get("removed", []):
-                    transaction_item_map[trans["transaction_id"]] = item_data
-
-                added_transactions.extend(plaid_response.get("added", []))
-                modified_transactions.extend(plaid_response.get("modified", []))
-                deleted_transactions.extend(plaid_response.get("removed", []))
-
-                # Check if there are more transactions to sync
-                has_more = plaid_response.get("has_more", False)
-                print(f"Has more transactions: {has_more}")
-            
-            # Store the last cursor for this item to update later
-            if last_cursor:
-                cursor_updates[item_id] = last_cursor        # Process added transactions with batch operations
-        print(f"Processing {len(added_transactions)} added transactions")
-        print("Debug: Making sure category_id is explicitly set to None")
-        
-        # Process in batches of 500 (Firestore batch limit)
-        batch_size = 500
-        total_batches = (len(added_transactions) + batch_size - 1) // batch_size
-        successful_batches = 0
-        
-        for i in range(0, len(added_transactions), batch_size):
-            batch_num = (i // batch_size) + 1
-            print(f"Processing batch {batch_num}/{total_batches}")
-            
-            batch = db.batch()
-            batch_transactions = added_transactions[i:i + batch_size]
-            
-            try:
-                for transaction in batch_transactions:
-                    # Get the correct item_data for this transaction
-                    item_data = transaction_item_map.get(transaction["transaction_id"])
-                    if not item_data:
-                        print(f"Warning: No item data found for transaction {transaction['transaction_id']}")
-                        continue
-
-                    print(f"Adding transaction: {transaction['transaction_id']}")
-
-                    account_name = next(
-                        (account["name"] for account in item_data.get("accounts", []) if account["account_id"] == transaction["account_id"]),
-                        None
-                    )              
-                    
-                    # Create explicit transaction data dictionary
-                    transaction_dict = {
-                        "amount": -transaction["amount"],
-                        "name": transaction["name"],
-                        "date": transaction['date'].strftime("%Y-%m-%d"),
-                        "user_id": user_id,
-                        "plaid_transaction_id": transaction["transaction_id"],
-                        "institution_name": item_data["institution_name"],
-                        "account_name": account_name,
-                        "merchant_name": transaction.get("merchant_name"),
-                        "personal_finance_category": convert_plaid_personal_finance_category(transaction.get("personal_finance_category")),
-                        "pending": transaction.get("pending"),
-                        "category_id": NULL_VALUE,  # Use the explicit NULL_VALUE constant
-                        "created_at": datetime.now(timezone.utc),
-                        "type": "debit" if -transaction["amount"] < 0 else "credit"
-                    }
-                    
-                    transaction_ref = db.collection("transactions").document()
-                    batch.set(transaction_ref, transaction_dict)
-                
-                # Commit this batch of transactions
-                batch.commit()
-                successful_batches += 1
-                print(f"✅ Successfully created batch {batch_num}/{total_batches} with {len(batch_transactions)} transactions")
-                
-            except Exception as batch_error:
-                print(f"❌ Failed to process batch {batch_num}/{total_batches}: {batch_error}")
-                # Continue with next batch rather than failing entirely
-                continue
-        
-        print(f"Completed transaction creation: {successful_batches}/{total_batches} batches successful")
-        
-        # Check if all batches were successful before proceeding
-        if successful_batches < total_batches:
-            print(f"❌ Not all batches were successful ({successful_batches}/{total_batches}). Skipping cursor updates to allow retry.")
-            raise HTTPException(status_code=500, detail=f"Failed to process all transaction batches. Only {successful_batches}/{total_batches} batches were successful.")
-
-        # Process modified transactions
-        print(f"Processing {len(modified_transactions)} modified transactions")
-        modified_successful = 0
-        for transaction in modified_transactions:
-            try:
-                # Get the correct item_data for this transaction
-                item_data = transaction_item_map.get(transaction["transaction_id"])
-                if not item_data:
-                    print(f"Warning: No item data found for modified transaction {transaction['transaction_id']}")
-                    continue
-                    
-                print(f"Modifying transaction: {transaction['transaction_id']}")
-
-                account_name = next(
-                    (account["name"] for account in item_data.get("accounts", []) if account["account_id"] == transaction["account_id"]),
-                    None
-                )
-                existing_query = db.collection("transactions").where("plaid_transaction_id", "==", transaction["transaction_id"]).where("user_id", "==", user_id)
-                existing_docs = existing_query.stream()
-                existing_doc = next(existing_docs, None)
-
-                if existing_doc:
-                    print(f"Updating existing transaction with ID: {existing_doc.id}")
-                    existing_doc.reference.update({
-                        "amount": -transaction["amount"] if transaction["amount"] > 0 else transaction["amount"],
-                        "name": transaction["name"],
-                        "date": transaction['date'].strftime("%Y-%m-%d"),
-                        "merchant_name": transaction.get("merchant_name"),
-                        "personal_finance_category": convert_plaid_personal_finance_category(transaction.get("personal_finance_category")),
-                        "pending": transaction.get("pending")
-                    })
-                else:
-                    print(f"Creating new transaction for modified transaction: {transaction['transaction_id']}")
-                    # Create a validated transaction using our schema
-                    transaction_schema = TransactionSchema(
-                        amount=-transaction["amount"],
-                        name=transaction["name"],
-                        date=transaction['date'].strftime("%Y-%m-%d"),
-                        user_id=user_id,
-                        plaid_transaction_id=transaction["transaction_id"],
-                        institution_name=item_data["institution_name"],
-                        account_name=account_name,
-                        merchant_name=transaction.get("merchant_name"),
-                        personal_finance_category=convert_plaid_personal_finance_category(transaction.get("personal_finance_category")),
-                        pending=transaction.get("pending"),
-                        category_id=None  # Explicitly set category_id to None for modified transactions
-                    )
-                    
-                    # Create explicit transaction data dictionary
-                    transaction_dict = {
-                        "amount": -transaction["amount"],
-                        "name": transaction["name"],
-                        "date": transaction['date'].strftime("%Y-%m-%d"),
-                        "user_id": user_id,
-                        "plaid_transaction_id": transaction["transaction_id"],
-                        "institution_name": item_data["institution_name"],
-                        "account_name": account_name,
-                        "merchant_name": transaction.get("merchant_name"),
-                        "personal_finance_category": convert_plaid_personal_finance_category(transaction.get("personal_finance_category")),
-                        "pending": transaction.get("pending"),
-                        "category_id": NULL_VALUE,  # Use the explicit NULL_VALUE constant
-                        "created_at": datetime.now(timezone.utc),
-                        "type": "debit" if -transaction["amount"] < 0 else "credit"
-                    }
-                    
-                    print(f"Debug modified transaction with NULL_VALUE: {transaction_dict}")
-                    
-                    transaction_ref = db.collection("transactions").document()
-                    # Use merge=False to ensure fields are set exactly as provided
-                    transaction_ref.set(transaction_dict, merge=False)
-                
-                modified_successful += 1
-                print(f"✅ Successfully processed modified transaction {transaction['transaction_id']}")
-                
-            except Exception as e:
-                print(f"❌ Failed to process modified transaction {transaction['transaction_id']}: {e}")
-                continue
-        
-        print(f"Completed modified transactions: {modified_successful}/{len(modified_transactions)} successful")
-        
-        # Check if all modified transactions were successful
-        if modified_successful < len(modified_transactions):
-            print(f"❌ Not all modified transactions were successful ({modified_successful}/{len(modified_transactions)}). Skipping cursor updates to allow retry.")
-            raise HTTPException(status_code=500, detail=f"Failed to process all modified transactions. Only {modified_successful}/{len(modified_transactions)} were successful.")
-
-        # Process deleted transactions
-        print(f"Processing {len(deleted_transactions)} deleted transactions")
-        deleted_successful = 0
-        for transaction in deleted_transactions:
-            try:
-                print(f"Deleting transaction: {transaction['transaction_id']}")
-                existing_query = db.collection("transactions").where("plaid_transaction_id", "==", transaction["transaction_id"]).where("user_id", "==", user_id)
-                existing_docs = existing_query.stream()
-
-                transaction_found = False
-                for doc in existing_docs:
-                    transaction_found = True
-                    print(f"Deleting transaction with ID: {doc.id}")
-                    
-                    # Get transaction data before deleting to check for category
-                    transaction_data = doc.to_dict()
-                    category_id = transaction_data.get("category_id")
-                    new_available = None
-                    
-                    if category_id:
-                        category_ref = db.collection("categories").document(category_id)
-                        category_doc = category_ref.get()
-                        
-                        if category_doc.exists:
-                            # Calculate new available amount for the category
-                            category_data = category_doc.to_dict()
-                            transaction_amount = Decimal(str(transaction_data["amount"]))
-                            current_available = Decimal(str(category_data.get("available", 0.0)))
-                            new_available = current_available - transaction_amount
-                            print(f"Updating category {category_id} available amount from {current_available} to {new_available}")
-                        else:
-                            print(f"Warning: Category {category_id} not found for transaction {doc.id}")
-                    else:
-                        print(f"Transaction {doc.id} has no category - skipping category update")
-
-                    # Use batch write for atomicity
-                    batch = db.batch()
-                    
-                    # 1. Delete the transaction
-                    batch.delete(doc.reference)
-                    
-                    # 2. Update category available amount if transaction had a category
-                    if category_id and new_available is not None and category_doc.exists:
-                        batch.update(category_ref, {"available": float(new_available)})
-                    
-                    # Execute all writes atomically
-                    batch.commit()
-                
-                if transaction_found:
-                    deleted_successful += 1
-                    print(f"✅ Successfully processed deleted transaction {transaction['transaction_id']}")
-                else:
-                    print(f"⚠️ Transaction {transaction['transaction_id']} not found in database (may have been already deleted)")
-                    deleted_successful += 1  # Count as successful since it's already deleted
-                
-            except Exception as e:
-                print(f"❌ Failed to process deleted transaction {transaction['transaction_id']}: {e}")
-                continue
-        
-        print(f"Completed deleted transactions: {deleted_successful}/{len(deleted_transactions)} successful")
-        
-        # Check if all deleted transactions were successful
-        if deleted_successful < len(deleted_transactions):
-            print(f"❌ Not all deleted transactions were successful ({deleted_successful}/{len(deleted_transactions)}). Skipping cursor updates to allow retry.")
-            raise HTTPException(status_code=500, detail=f"Failed to process all deleted transactions. Only {deleted_successful}/{len(deleted_transactions)} were successful.")
-
-        # Now that all transactions have been processed successfully, update the cursors with batch write
-        print("✅ All transactions processed successfully. Updating cursors...")
-        if cursor_updates:
-            try:
-                batch = db.batch()
-                for item_id, cursor in cursor_updates.items():
-                    print(f"Updating cursor for item {item_id} to {cursor}")
-                    item_ref = db.collection("plaid_items").document(item_id)
-                    batch.update(item_ref, {"cursor": cursor})
-                batch.commit()
-                print(f"✅ Updated {len(cursor_updates)} cursors atomically")
-            except Exception as e:
-                print(f"❌ Failed to update cursors: {e}")
-                raise HTTPException(status_code=500, detail=f"Transactions synced successfully but failed to update cursors: {e}")
-        
-        print("🎉 Sync completed successfully")
-        return {
-            "message": "Transactions synced successfully.",
-            "summary": {
-                "added": f"{successful_batches}/{total_batches} batches ({len(added_transactions)} transactions)",
-                "modified": f"{modified_successful}/{len(modified_transactions)} transactions",
-                "deleted": f"{deleted_successful}/{len(deleted_transactions)} transactions",
-                "cursors_updated": len(cursor_updates)
-            }
-        }
+        # A double tap shares the sync already running in this process; a sync running
+        # elsewhere is found through the user's sync lease
+        flight_key = ("sync-plaid-transactions", request.user_id, tuple(sorted(doc.id for doc in plaid_items_docs)))
+        result = await single_flight(flight_key, run_leased_plaid_sync, request.user_id, plaid_items_docs)
+        if result.get("status") == "running":
+            # Another sync of these items is still going; the client can check back later
+            response.status_code = 202
+        return result
+    except HTTPException as e:
+        raise e
     except Exception as e:
         print(f"Error during sync: {e}")
-        raise HTTPException(status_code=500, detail=f"Failed to sync transactions: {e}")
\ No newline at end of file
+        raise HTTPException(status_code=500, detail=f"Failed to sync transactions: {e}")
+
+# Subscriptions, bills and paychecks detected after each Plaid sync, served from one document
+@router.post("/get-recurring-series")
+async def get_recurring_series_route(request: RecurringSeriesRequest):
+    try:
+        return {"recurring_series": get_recurring_series(request.user_id)}
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Failed to get recurring series: {str(e)}")
@@ -1,8 +1,12 @@
-from fastapi import APIRouter, HTTPException
+from fastapi import APIRouter, HTTPException, BackgroundTasks
 from pydantic import BaseModel
 from datetime import datetime, timezone
 from typing import Optional
-from .db import db
+from .db import db, new_batch, add_background_task
+from .data_version import bump_data_version
+from .period_keys import get_pay_start, backfill_period_keys
+from .sharded_counters import UNALLOCATED_SHARD_COUNT
+from .cascade_delete import JOBS_COLLECTION, count_user_documents, run_cascade, cascade_delete_user, fail_stale_job
 from backend.db.schemas import User as UserSchema, UserPreferences, PaySchedule, Category as CategorySchema
 
 router = APIRouter()
@@ -16,6 +20,13 @@ class UpdatePreferencesRequest(BaseModel):
     user_id: str
     preferences: UserPreferences
 
+class UserIDRequest(BaseModel):
+    user_id: str
+
+class DeleteJobRequest(BaseModel):
+    user_id: str
+    job_id: str
+
 # User Methods
 @router.post("/create-user")
 async def create_user(user: User):
@@ -27,17 +38,21 @@ async def create_user(user: User):
         
         # Convert to dict for Firestore (validation happens automatically)
         user_data = user_schema.to_dict()
+        # A new user has no documents yet, so period key queries are usable right away
+        user_data["period_keys"] = {"pay_start": None, "complete": True}
         
         # Create "Unallocated Funds" category for the new user using schema
         unallocated_category = CategorySchema(
             name="Unallocated Funds",
             user_id=user.user_id,  # Use the provided user_id instead of user_ref.id
             available=0.0,
-            is_unallocated_funds=True
+            is_unallocated_funds=True,
+            # Every assignment and income transaction writes this balance
+            shard_count=UNALLOCATED_SHARD_COUNT
         )
         
         # Use batch write for atomicity
-        batch = db.batch()
+        batch = new_batch()
         
         # 1. Create the user
         user_ref = db.collection(UserSchema.collection_name()).document(user.user_id)
@@ -59,7 +74,7 @@ async def create_user(user: User):
         raise HTTPException(status_code=500, detail=f"Failed to create user: {e}")
 
 @router.post("/update-preferences")
-async def update_preferences(request: UpdatePreferencesRequest):
+async def update_preferences(request: UpdatePreferencesRequest, background_tasks: BackgroundTasks):
     try:
         # print request
         # print(f"Updating preferences: {request.preferences}")
@@ -71,9 +86,21 @@ async def update_preferences(request: UpdatePreferencesRequest):
 
         # The preferences are already validated by Pydantic
         # Update the user document with the preferences
-        user_ref.update({
-            "preferences": request.preferences.model_dump(exclude_none=True)
+        new_preferences = request.preferences.model_dump(exclude_none=True)
+        pay_schedule_changed = get_pay_start(user_doc.to_dict()) != get_pay_start({"preferences": new_preferences})
+
+        batch = new_batch()
+        batch.update(user_ref, {
+            "preferences": new_preferences
         })
+        if pay_schedule_changed:
+            # Existing pay period keys are stale until the backfill below finishes
+            batch.update(user_ref, {"period_keys.complete": False})
+        bump_data_version(request.user_id, batch)
+        batch.commit()
+
+        if pay_schedule_changed:
+            add_background_task(background_tasks, backfill_period_keys, request.user_id)
 
         # print("Preferences updated successfully")
         return {"message": "Preferences updated successfully."}
@@ -83,3 +110,55 @@ async def update_preferences(request: UpdatePreferencesRequest):
     except Exception as e:
         print(f"Failed to update preferences: {e}")
         raise HTTPException(status_code=500, detail=f"Failed to update preferences: {e}")
+
+
+# Batched backfill of the period keys on all of a user's transactions and assignments
+@router.post("/backfill-period-keys")
+async def backfill_period_keys_route(request: UserIDRequest, background_tasks: BackgroundTasks):
+    try:
+        user_doc = db.collection("users").document(request.user_id).get()
+        if not user_doc.exists:
+            raise HTTPException(status_code=404, detail="User not found")
+
+        add_background_task(background_tasks, backfill_period_keys, request.user_id)
+        return {"message": "Period key backfill started."}
+    except HTTPException as e:
+        raise e
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Failed to start period key backfill: {e}")
+
+
+# Account deletion removes every document the user owns, in the background for large accounts
+@router.post("/delete-user")
+async def delete_user(request: UserIDRequest, background_tasks: BackgroundTasks):
+    try:
+        user_doc = db.collection("users").document(request.user_id).get()
+        if not user_doc.exists:
+            raise HTTPException(status_code=404, detail="User not found")
+
+        estimated_total = count_user_documents(request.user_id)
+        result = run_cascade(background_tasks, request.user_id, "user", request.user_id, estimated_total, cascade_delete_user, request.user_id)
+
+        message = "User deleted successfully" if result["status"] == "completed" else "User deletion started"
+        return {"message": message, **result}
+    except HTTPException as e:
+        raise e
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Failed to delete user: {e}")
+
+# Progress of a background cascade delete started by delete-user, delete-category or delete-plaid-item
+@router.post("/get-delete-job")
+async def get_delete_job(request: DeleteJobRequest):
+    try:
+        job_doc = db.collection(JOBS_COLLECTION).document(request.job_id).get()
+        if not job_doc.exists or job_doc.to_dict().get("user_id") != request.user_id:
+            raise HTTPException(status_code=404, detail="Delete job not found")
+
+        # A job whose instance stopped mid-delete would otherwise stay running until its TTL
+        job_data = fail_stale_job(job_doc)
+        job_data["id"] = job_doc.id
+        return {"job": job_data}
+    except HTTPException as e:
+        raise e
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Failed to get delete job: {e}")
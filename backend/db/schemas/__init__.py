@@ -5,6 +5,7 @@ from .transaction import Transaction
 from .assignment import Assignment
 from .plaid_item import PlaidItem
 from .category_group import CategoryGroup
+from .categorization_rule import CategorizationRule
 
 # Export classes for easier imports
-__all__ = ['FirestoreModel', 'User', 'UserPreferences', 'PaySchedule', 'Category', 'Transaction', 'Assignment', 'PlaidItem', 'CategoryGroup']
\ No newline at end of file
+__all__ = ['FirestoreModel', 'User', 'UserPreferences', 'PaySchedule', 'Category', 'Transaction', 'Assignment', 'PlaidItem', 'CategoryGroup', 'CategorizationRule']
\ No newline at end of file
@@ -1,6 +1,6 @@
 from pydantic import BaseModel, Field, field_validator
 from datetime import datetime, timezone
-from typing import Dict, Any
+from typing import Dict, Any, Optional
 from decimal import Decimal
 from .base import FirestoreModel
 
@@ -11,6 +11,8 @@ class Assignment(FirestoreModel):
     user_id: str
     category_id: str
     date: str
+    period_month: Optional[str] = None  # YYYY-MM of `date`
+    pay_period: Optional[int] = None  # Pay periods since the user's pay schedule start
     created_at: datetime = Field(default_factory=lambda: datetime.now(timezone.utc))
     
     @classmethod
@@ -0,0 +1,57 @@
+from pydantic import BaseModel, Field, field_validator, model_validator
+from datetime import datetime, timezone
+from typing import Dict, Any, Optional
+from decimal import Decimal
+from .base import FirestoreModel
+
+class CategorizationRule(FirestoreModel):
+    """Model for categorization rule documents in Firestore"""
+    
+    user_id: str
+    category_id: str
+    # Case-insensitive; a pattern with * or ? is a wildcard match, otherwise a substring match
+    merchant_pattern: Optional[str] = None
+    name_pattern: Optional[str] = None
+    personal_finance_category: Optional[str] = None  # Plaid primary or detailed category, e.g. FOOD_AND_DRINK
+    # Bounds on the absolute transaction amount
+    min_amount: Optional[Decimal] = None
+    max_amount: Optional[Decimal] = None
+    priority: int = 0  # Higher priority rules are tried first
+    created_at: datetime = Field(default_factory=lambda: datetime.now(timezone.utc))
+    
+    @classmethod
+    def collection_name(cls) -> str:
+        return "categorization_rules"
+    
+    @field_validator('user_id', 'category_id')
+    @classmethod
+    def validate_ids(cls, v):
+        if not v or len(v.strip()) == 0:
+            raise ValueError("User ID and category ID cannot be empty")
+        return v
+    
+    @field_validator('merchant_pattern', 'name_pattern', 'personal_finance_category')
+    @classmethod
+    def validate_patterns(cls, v):
+        if v is None:
+            return v
+        v = v.strip()
+        return v or None
+    
+    @model_validator(mode='after')
+    def validate_conditions(self):
+        if not any([self.merchant_pattern, self.name_pattern, self.personal_finance_category, self.min_amount is not None, self.max_amount is not None]):
+            raise ValueError("A rule needs at least one condition")
+        if self.min_amount is not None and self.max_amount is not None and self.min_amount > self.max_amount:
+            raise ValueError("min_amount cannot be greater than max_amount")
+        return self
+    
+    def to_dict(self) -> Dict[str, Any]:
+        """Convert model to a dictionary for Firestore"""
+        data = self.model_dump(exclude_none=True)
+        # Convert Decimal fields to float for Firestore storage
+        if self.min_amount is not None:
+            data["min_amount"] = float(self.min_amount)
+        if self.max_amount is not None:
+            data["max_amount"] = float(self.max_amount)
+        return data
@@ -13,6 +13,7 @@ class Category(FirestoreModel):
     available: Decimal = Decimal('0.0')
     is_unallocated_funds: bool = False
     goal_amount: Optional[Decimal] = None
+    shard_count: Optional[int] = None  # Set when `available` is a sharded counter, see api/sharded_counters.py
     created_at: datetime = Field(default_factory=lambda: datetime.now(timezone.utc))
     
     @classmethod
@@ -15,11 +15,15 @@ class Transaction(FirestoreModel):
     created_at: datetime = Field(default_factory=lambda: datetime.now(timezone.utc))
     type: str = "debit"  # 'debit' or 'credit'
     plaid_transaction_id: Optional[str] = None
+    plaid_item_id: Optional[str] = None  # ID of the plaid_items document the transaction was synced from
     institution_name: Optional[str] = None
     account_name: Optional[str] = None
     merchant_name: Optional[str] = None  # Plaid merchant name
+    merchant_key: Optional[str] = None  # Normalized merchant used to group recurring transactions
     personal_finance_category: Optional[Dict[str, Any]] = None  # Plaid personal finance category
     pending: Optional[bool] = None  # Whether the transaction is pending
+    period_month: Optional[str] = None  # YYYY-MM of `date`
+    pay_period: Optional[int] = None  # Pay periods since the user's pay schedule start
     
     @classmethod
     def collection_name(cls) -> str:
@@ -31,6 +31,7 @@ class User(FirestoreModel):
     email: str
     created_at: datetime = Field(default_factory=lambda: datetime.now(timezone.utc))
     preferences: UserPreferences = Field(default_factory=UserPreferences)
+    data_version: int = 0  # Bumped by every mutation, used to build read ETags
     
     @classmethod
     def collection_name(cls) -> str:
@@ -0,0 +1,146 @@
+from datetime import date, timedelta
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+import hashlib
+import json
+import random
+import threading
+
+# Minimal Plaid API served over HTTP so the real plaid-python client is exercised.
+# Only /transactions/sync is implemented. Every access token gets a deterministic
+# transaction history, served page by page with the offset as the cursor, and each
+# sync past the end of the history reports a few new transactions.
+
+PAGE_SIZE = 100
+
+MERCHANTS = [
+    ("Whole Foods", "FOOD_AND_DRINK", "FOOD_AND_DRINK_GROCERIES"),
+    ("Shell", "TRANSPORTATION", "TRANSPORTATION_GAS"),
+    ("Netflix", "ENTERTAINMENT", "ENTERTAINMENT_TV_AND_MOVIES"),
+    ("Starbucks", "FOOD_AND_DRINK", "FOOD_AND_DRINK_COFFEE"),
+    ("Amazon", "GENERAL_MERCHANDISE", "GENERAL_MERCHANDISE_ONLINE_MARKETPLACES"),
+    ("Uber", "TRANSPORTATION", "TRANSPORTATION_TAXIS_AND_RIDE_SHARES"),
+    ("Comcast", "RENT_AND_UTILITIES", "RENT_AND_UTILITIES_INTERNET_AND_CABLE"),
+    ("Acme Corp Payroll", "INCOME", "INCOME_WAGES"),
+]
+
+def fake_account_id(access_token: str) -> str:
+    return "acct-" + hashlib.sha1(access_token.encode()).hexdigest()[:16]
+
+def fake_transaction(access_token: str, index: int) -> dict:
+    rng = random.Random(f"{access_token}:{index}")
+    merchant, primary, detailed = rng.choice(MERCHANTS)
+    is_income = primary == "INCOME"
+    amount = -round(rng.uniform(1500, 3000), 2) if is_income else round(rng.uniform(3, 250), 2)
+    day = date.today() - timedelta(days=rng.randint(0, 120))
+    return {
+        "account_id": fake_account_id(access_token),
+        "account_owner": None,
+        "amount": amount,
+        "authorized_date": day.isoformat(),
+        "authorized_datetime": None,
+        "category": None,
+        "category_id": None,
+        "check_number": None,
+        "counterparties": [],
+        "date": day.isoformat(),
+        "datetime": None,
+        "iso_currency_code": "USD",
+        "location": {
+            "address": None, "city": None, "region": None, "postal_code": None,
+            "country": None, "lat": None, "lon": None, "store_number": None
+        },
+        "logo_url": None,
+        "merchant_entity_id": None,
+        "merchant_name": merchant,
+        "name": merchant.upper(),
+        "payment_channel": "in store",
+        "payment_meta": {
+            "by_order_of": None, "payee": None, "payer": None, "payment_method": None,
+            "payment_processor": None, "ppd_id": None, "reason": None, "reference_number": None
+        },
+        "pending": False,
+        "pending_transaction_id": None,
+        "personal_finance_category": {"primary": primary, "detailed": detailed, "confidence_level": "VERY_HIGH"},
+        "personal_finance_category_icon_url": f"https://plaid-category-icons.plaid.com/PFC_{primary}.png",
+        "transaction_code": None,
+        "transaction_id": f"txn-{hashlib.sha1(f'{access_token}:{index}'.encode()).hexdigest()[:24]}",
+        "transaction_type": "place",
+        "unofficial_currency_code": None,
+        "website": None
+    }
+
+class FakePlaidHandler(BaseHTTPRequestHandler):
+    server_version = "FakePlaid/1.0"
+
+    def log_message(self, format, *args):
+        pass
+
+    def send_json(self, status: int, payload: dict) -> None:
+        body = json.dumps(payload).encode()
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def do_POST(self):
+        length = int(self.headers.get("Content-Length", 0))
+        request = json.loads(self.rfile.read(length) or b"{}")
+        if self.path == "/transactions/sync":
+            self.send_json(200, self.server.transactions_sync(request))
+        else:
+            self.send_json(400, {
+                "error_type": "INVALID_REQUEST",
+                "error_code": "NOT_FOUND",
+                "error_message": f"{self.path} is not implemented by the fake Plaid server",
+                "display_message": None,
+                "request_id": "fake"
+            })
+
+class FakePlaidServer(ThreadingHTTPServer):
+    daemon_threads = True
+
+    def __init__(self, history_size: int = 300, new_per_sync: int = 3, port: int = 0):
+        super().__init__(("127.0.0.1", port), FakePlaidHandler)
+        self.history_size = history_size
+        self.new_per_sync = new_per_sync
+        self.sync_calls = 0
+        self._lock = threading.Lock()
+        # access_token -> number of transactions that exist so far
+        self._sizes = {}
+        self._thread = None
+
+    @property
+    def url(self) -> str:
+        host, port = self.server_address[:2]
+        return f"http://{host}:{port}"
+
+    def transactions_sync(self, request: dict) -> dict:
+        access_token = request["access_token"]
+        offset = int(request.get("cursor") or 0)
+        with self._lock:
+            self.sync_calls += 1
+            size = self._sizes.setdefault(access_token, self.history_size)
+            if offset >= size:
+                # Caught up, new activity has happened since the last sync
+                size = self._sizes[access_token] = size + self.new_per_sync
+        end = min(offset + PAGE_SIZE, size)
+        return {
+            "accounts": [],
+            "added": [fake_transaction(access_token, index) for index in range(offset, end)],
+            "modified": [],
+            "removed": [],
+            "next_cursor": str(end),
+            "has_more": end < size,
+            "transactions_update_status": "HISTORICAL_UPDATE_COMPLETE",
+            "request_id": f"fake-{self.sync_calls}"
+        }
+
+    def start(self) -> "FakePlaidServer":
+        self._thread = threading.Thread(target=self.serve_forever, daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self) -> None:
+        self.shutdown()
+        self.server_close()
@@ -0,0 +1,232 @@
+"""
+Replay app sessions against one in-process worker backed by in-memory Firestore and
+a fake Plaid server, and report throughput, per-route latency percentiles and
+Firestore read/write amplification.
+
+Run from the backend directory:
+
+    python -m loadtest.run --scenario loadtest/scenarios/open_app.json --users 25 --iterations 4
+
+The exit code is 1 when the scenario's thresholds are exceeded, so a run can gate a deploy.
+"""
+from datetime import date, timedelta
+import argparse
+import asyncio
+import contextlib
+import io
+import json
+import logging
+import os
+import sys
+import time
+
+from .fake_plaid import FakePlaidServer, fake_account_id
+
+def percentile(values: list, fraction: float) -> float:
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    index = min(len(ordered) - 1, max(0, round(fraction * (len(ordered) - 1))))
+    return ordered[index]
+
+def session_variables(user_id: str, category_ids: list) -> dict:
+    today = date.today()
+    month_start = today.replace(day=1)
+    month_end = (month_start + timedelta(days=32)).replace(day=1) - timedelta(days=1)
+    return {
+        "user_id": user_id,
+        "category_ids": category_ids,
+        "today": today.isoformat(),
+        "month_start": month_start.isoformat(),
+        "month_end": month_end.isoformat()
+    }
+
+async def call(app, path: str, body: dict) -> dict:
+    from api.batch_routes import BatchOperation, dispatch_operation
+    result = await dispatch_operation(app, BatchOperation(path=path, body=body))
+    if result["status"] >= 400:
+        raise RuntimeError(f"Seeding call {path} failed with {result['status']}: {result['body']}")
+    return result["body"]
+
+async def seed_user(app, index: int, categories_per_user: int, sync: bool) -> dict:
+    """Create a user through the real routes and import a Plaid history for them"""
+    from api.db import db
+    from backend.db.schemas import PlaidItem as PlaidItemSchema
+
+    user_id = f"loadtest-user-{index}"
+    await call(app, "/user/create-user", {"email": f"{user_id}@example.com", "user_id": user_id})
+
+    group_ids = []
+    for sort_order, name in enumerate(["Bills", "Everyday", "Fun"]):
+        group = await call(app, "/category/create-category-group", {"name": name, "user_id": user_id, "sort_order": sort_order})
+        group_ids.append(group["category_group_id"])
+
+    category_ids = []
+    for category_index in range(categories_per_user):
+        category = await call(app, "/category/create-category", {"name": f"Category {category_index}", "user_id": user_id})
+        category_ids.append(category["category_id"])
+        await call(app, "/category/update-category-group", {
+            "category_id": category["category_id"],
+            "user_id": user_id,
+            "group_id": group_ids[category_index % len(group_ids)]
+        })
+
+    access_token = f"access-loadtest-{index}"
+    plaid_item = PlaidItemSchema(
+        user_id=user_id,
+        access_token=access_token,
+        item_id=f"item-loadtest-{index}",
+        institution_id="ins_loadtest",
+        institution_name="Load Test Bank",
+        accounts=[{"account_id": fake_account_id(access_token), "name": "Checking", "type": "depository"}]
+    )
+    db.collection("plaid_items").document().set(plaid_item.to_dict())
+    if sync:
+        await call(app, "/transaction/sync-plaid-transactions", {"user_id": user_id})
+
+    return session_variables(user_id, category_ids)
+
+async def run_virtual_user(app, scenario: dict, variables: dict, iterations: int, deadline, results: list) -> int:
+    from .scenario import Session
+    completed = 0
+    while True:
+        if deadline is not None and time.perf_counter() >= deadline:
+            break
+        if deadline is None and completed >= iterations:
+            break
+        await Session(app, variables, results).run(scenario)
+        completed += 1
+    return completed
+
+def build_report(results: list, sessions: int, seconds: float) -> dict:
+    routes = {}
+    for result in results:
+        routes.setdefault(result["route"], []).append(result)
+
+    report_routes = {}
+    for route, calls in sorted(routes.items()):
+        latencies = [call["ms"] for call in calls]
+        report_routes[route] = {
+            "requests": len(calls),
+            "errors": sum(1 for call in calls if call["status"] >= 400),
+            "not_modified": sum(1 for call in calls if call["status"] == 304),
+            "p50_ms": round(percentile(latencies, 0.50), 1),
+            "p95_ms": round(percentile(latencies, 0.95), 1),
+            "p99_ms": round(percentile(latencies, 0.99), 1),
+            "max_ms": round(max(latencies), 1),
+            "reads_per_request": round(sum(call["reads"] for call in calls) / len(calls), 1),
+            "writes_per_request": round(sum(call["writes"] for call in calls) / len(calls), 1)
+        }
+
+    total_requests = len(results)
+    total_errors = sum(1 for result in results if result["status"] >= 400)
+    return {
+        "sessions": sessions,
+        "requests": total_requests,
+        "errors": total_errors,
+        "error_rate": round(total_errors / total_requests, 4) if total_requests else 0.0,
+        "seconds": round(seconds, 2),
+        "requests_per_second": round(total_requests / seconds, 1) if seconds else None,
+        "sessions_per_second": round(sessions / seconds, 2) if seconds else None,
+        "reads_per_session": round(sum(result["reads"] for result in results) / sessions, 1) if sessions else None,
+        "writes_per_session": round(sum(result["writes"] for result in results) / sessions, 1) if sessions else None,
+        "routes": report_routes
+    }
+
+def check_thresholds(report: dict, thresholds: dict) -> list:
+    """
+    Thresholds come from the scenario file:
+    {"max_error_rate": 0.01, "p95_ms": {"/category/get-categories": 50},
+     "max_reads_per_request": {"/category/get-allocated-and-spent": 200}}
+    """
+    failures = []
+    if "max_error_rate" in thresholds and report["error_rate"] > thresholds["max_error_rate"]:
+        failures.append(f"error rate {report['error_rate']} > {thresholds['max_error_rate']}")
+    for key, metric in (("p95_ms", "p95_ms"), ("p99_ms", "p99_ms"), ("max_reads_per_request", "reads_per_request"), ("max_writes_per_request", "writes_per_request")):
+        for route, limit in thresholds.get(key, {}).items():
+            route_report = report["routes"].get(route)
+            if route_report is not None and route_report[metric] > limit:
+                failures.append(f"{route} {metric} {route_report[metric]} > {limit}")
+    return failures
+
+def print_report(report: dict) -> None:
+    print(f"\n{report['sessions']} sessions, {report['requests']} requests in {report['seconds']}s")
+    print(f"throughput: {report['requests_per_second']} req/s, {report['sessions_per_second']} sessions/s, error rate {report['error_rate']}")
+    print(f"firestore per session: {report['reads_per_session']} reads, {report['writes_per_session']} writes\n")
+    header = f"{'route':<45}{'reqs':>7}{'err':>6}{'304':>6}{'p50':>9}{'p95':>9}{'p99':>9}{'max':>9}{'reads':>8}{'writes':>8}"
+    print(header)
+    print("-" * len(header))
+    for route, stats in report["routes"].items():
+        print(f"{route:<45}{stats['requests']:>7}{stats['errors']:>6}{stats['not_modified']:>6}{stats['p50_ms']:>9}{stats['p95_ms']:>9}{stats['p99_ms']:>9}{stats['max_ms']:>9}{stats['reads_per_request']:>8}{stats['writes_per_request']:>8}")
+
+async def main_async(args) -> int:
+    # Route handlers print a lot, keep the report readable unless asked otherwise
+    quiet = contextlib.redirect_stdout(io.StringIO()) if not args.verbose else contextlib.nullcontext()
+
+    from .scenario import load_scenario
+    from main import app
+    from api import assignment_routes, transaction_routes
+    scenario = load_scenario(args.scenario)
+
+    # The assignment and transaction routes log every write to api/logs/*.log; a run
+    # would fill them with loadtest users
+    for route_logger in (assignment_routes.assignment_logger, transaction_routes.transaction_logger):
+        for handler in list(route_logger.handlers):
+            route_logger.removeHandler(handler)
+        route_logger.addHandler(logging.NullHandler())
+
+    with quiet:
+        seeded = await asyncio.gather(*[seed_user(app, index, args.categories, not args.no_sync) for index in range(args.users)])
+
+    results = []
+    deadline = time.perf_counter() + args.duration if args.duration else None
+    start = time.perf_counter()
+    with quiet:
+        completed = await asyncio.gather(*[
+            run_virtual_user(app, scenario, variables, args.iterations, deadline, results)
+            for variables in seeded
+        ])
+    seconds = time.perf_counter() - start
+
+    report = build_report(results, sum(completed), seconds)
+    report["scenario"] = scenario.get("name", args.scenario)
+    report["users"] = args.users
+    print_report(report)
+
+    if args.json:
+        with open(args.json, "w") as report_file:
+            json.dump(report, report_file, indent=2)
+
+    failures = check_thresholds(report, scenario.get("thresholds", {}))
+    for failure in failures:
+        print(f"THRESHOLD EXCEEDED: {failure}")
+    return 1 if failures else 0
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description="Replay app sessions against an in-memory backend")
+    parser.add_argument("--scenario", default=os.path.join(os.path.dirname(__file__), "scenarios", "open_app.json"))
+    parser.add_argument("--users", type=int, default=20, help="concurrent virtual users")
+    parser.add_argument("--iterations", type=int, default=5, help="sessions per virtual user")
+    parser.add_argument("--duration", type=float, default=None, help="run for this many seconds instead of a fixed number of iterations")
+    parser.add_argument("--categories", type=int, default=8, help="categories seeded per user")
+    parser.add_argument("--history", type=int, default=300, help="Plaid transactions seeded per user")
+    parser.add_argument("--no-sync", action="store_true", help="skip the initial Plaid import")
+    parser.add_argument("--json", help="also write the report to this file")
+    parser.add_argument("--verbose", action="store_true", help="show the app's own output")
+    args = parser.parse_args()
+
+    plaid_server = FakePlaidServer(history_size=args.history).start()
+    # Must be set before the app is imported, db.py and plaid_utils.py read them at import time
+    os.environ["FIRESTORE_BACKEND"] = "memory"
+    os.environ["PLAID_HOST"] = plaid_server.url
+    os.environ.setdefault("PLAID_CLIENT_ID", "loadtest")
+    os.environ.setdefault("PLAID_SECRET_PRODUCTION", "loadtest")
+    sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+    try:
+        return asyncio.run(main_async(args))
+    finally:
+        plaid_server.stop()
+
+if __name__ == "__main__":
+    sys.exit(main())
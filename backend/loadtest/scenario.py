@@ -0,0 +1,127 @@
+from api.batch_routes import BatchOperation, dispatch_operation
+from api.memory_firestore import op_counts
+from typing import Any, Dict, List
+import asyncio
+import json
+import random
+import re
+import time
+
+# A scenario is a JSON file describing one app session as a list of steps:
+#
+#   {"call": "/category/get-categories", "body": {"user_id": "{user_id}"},
+#    "save": {"category_ids": "categories[*].id"}, "conditional": true}
+#   {"parallel": [<step>, ...]}           run steps concurrently, like screens mounting together
+#   {"repeat": 3, "steps": [<step>, ...]}  run steps several times in order
+#   {"think": 0.5}                         pause like a user reading the screen
+#
+# Strings in a body are templates over the session's variables: "{name}" alone is
+# replaced by the raw value, "{choice:name}" by a random element of a list variable,
+# and "{name}" inside a longer string is formatted in. "save" stores values from the
+# response body, selected with a dotted path where [*] maps over a list and [n] indexes.
+# "conditional" sends If-None-Match with the ETag the session last got for that call.
+
+TEMPLATE = re.compile(r"\{(choice:)?([a-zA-Z_][a-zA-Z0-9_]*)\}")
+
+def load_scenario(path: str) -> dict:
+    with open(path) as scenario_file:
+        scenario = json.load(scenario_file)
+    if not isinstance(scenario.get("steps"), list):
+        raise ValueError(f"Scenario {path} has no steps")
+    return scenario
+
+def resolve_template(value: Any, variables: Dict[str, Any]) -> Any:
+    if isinstance(value, dict):
+        return {key: resolve_template(item, variables) for key, item in value.items()}
+    if isinstance(value, list):
+        return [resolve_template(item, variables) for item in value]
+    if not isinstance(value, str):
+        return value
+
+    def lookup(match):
+        item = variables.get(match.group(2))
+        if match.group(1):
+            return random.choice(item) if item else None
+        return item
+
+    whole = TEMPLATE.fullmatch(value)
+    if whole:
+        return lookup(whole)
+    return TEMPLATE.sub(lambda match: str(lookup(match)), value)
+
+def select_value(data: Any, selector: str) -> Any:
+    """Pick a value out of a response body, e.g. transactions[*].id or pagination.next_cursor"""
+    values = [data]
+    mapped = False
+    for part in re.findall(r"[^.\[\]]+|\[\*\]|\[\d+\]", selector):
+        next_values = []
+        for value in values:
+            if part == "[*]":
+                next_values.extend(value if isinstance(value, list) else [])
+                mapped = True
+            elif part.startswith("["):
+                index = int(part[1:-1])
+                next_values.append(value[index] if isinstance(value, list) and len(value) > index else None)
+            else:
+                next_values.append(value.get(part) if isinstance(value, dict) else None)
+        values = next_values
+    if mapped:
+        return [value for value in values if value is not None]
+    return values[0] if values else None
+
+class Session:
+    """One virtual user running a scenario against the app, recording every call"""
+
+    def __init__(self, app, variables: Dict[str, Any], results: List[dict]):
+        self.app = app
+        self.variables = dict(variables)
+        self.results = results
+        self.etags = {}
+
+    async def call(self, step: dict) -> None:
+        path = step["call"]
+        body = resolve_template(step.get("body", {}), self.variables)
+        headers = {}
+        etag_key = (path, json.dumps(body, sort_keys=True, default=str))
+        if step.get("conditional") and etag_key in self.etags:
+            headers["If-None-Match"] = self.etags[etag_key]
+
+        counts = {"reads": 0, "writes": 0}
+        token = op_counts.set(counts)
+        start = time.perf_counter()
+        try:
+            result = await dispatch_operation(self.app, BatchOperation(path=path, body=body, headers=headers))
+        finally:
+            op_counts.reset(token)
+        elapsed_ms = (time.perf_counter() - start) * 1000
+
+        self.results.append({
+            "route": step.get("name", path),
+            "status": result["status"],
+            "ms": elapsed_ms,
+            "reads": counts["reads"],
+            "writes": counts["writes"]
+        })
+        if result.get("etag"):
+            self.etags[etag_key] = result["etag"]
+        if result["status"] < 300:
+            for name, selector in step.get("save", {}).items():
+                self.variables[name] = select_value(result["body"], selector)
+
+    async def run_step(self, step: dict) -> None:
+        if "call" in step:
+            await self.call(step)
+        elif "parallel" in step:
+            await asyncio.gather(*[self.run_step(child) for child in step["parallel"]])
+        elif "repeat" in step:
+            for _ in range(step["repeat"]):
+                for child in step["steps"]:
+                    await self.run_step(child)
+        elif "think" in step:
+            await asyncio.sleep(step["think"])
+        else:
+            raise ValueError(f"Unknown scenario step: {step}")
+
+    async def run(self, scenario: dict) -> None:
+        for step in scenario["steps"]:
+            await self.run_step(step)
@@ -15,6 +15,11 @@ from api.account_routes import router as account_router
 from api.plaid_routes import router as plaid_router
 from api.plaid_item_routes import router as plaid_item_router
 from api.health_routes import router as health_router
+from api.batch_routes import router as batch_router
+from api.categorization_rule_routes import router as categorization_rule_router
+from api.admin_routes import router as admin_router
+from api.insights_routes import router as insights_router
+from api.request_profiler import RequestProfilerMiddleware
 
 app = FastAPI()
 
@@ -26,8 +31,12 @@ app.add_middleware(
     allow_credentials=True,
     allow_methods=["*"],
     allow_headers=["*"],
+    expose_headers=["ETag"],
 )
 
+# Opt-in per-request profiling, see api/request_profiler.py
+app.add_middleware(RequestProfilerMiddleware)
+
 # Include routers
 app.include_router(health_router, prefix="/health")
 app.include_router(user_router, prefix="/user")
@@ -38,6 +47,10 @@ app.include_router(assignment_router, prefix="/assignment")
 app.include_router(account_router, prefix="/account")
 app.include_router(plaid_router, prefix="/plaid")
 app.include_router(plaid_item_router, prefix="/plaid_item")
+app.include_router(batch_router, prefix="/batch")
+app.include_router(categorization_rule_router, prefix="/categorization_rule")
+app.include_router(admin_router, prefix="/admin")
+app.include_router(insights_router, prefix="/insights")
 
 @app.get("/")
 def read_root():
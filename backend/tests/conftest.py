@@ -0,0 +1,74 @@
+import asyncio
+import os
+import sys
+
+# The suite runs against the in-process Firestore stand-in, see api/memory_firestore.py.
+# Run from the backend directory:
+#
+#     python -m pytest -q tests
+os.environ["FIRESTORE_BACKEND"] = "memory"
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, BACKEND_DIR)
+sys.path.insert(0, os.path.dirname(BACKEND_DIR))
+
+import logging
+import pytest
+from api.db import db
+from api import data_version, sharded_counters, categorization_rules, single_flight, category_routes
+from api import assignment_routes, transaction_routes, plaid_utils, insights_routes
+
+@pytest.fixture(autouse=True, scope="session")
+def route_log_files(tmp_path_factory):
+    """Write the assignment and transaction logs to a temporary directory, not api/logs/"""
+    log_dir = tmp_path_factory.mktemp("logs")
+    swapped = []
+    for route_logger, handler in ((assignment_routes.assignment_logger, assignment_routes.assignment_handler),
+                                  (transaction_routes.transaction_logger, transaction_routes.transaction_handler)):
+        replacement = logging.FileHandler(log_dir / os.path.basename(handler.baseFilename))
+        replacement.setFormatter(handler.formatter)
+        route_logger.removeHandler(handler)
+        route_logger.addHandler(replacement)
+        swapped.append((route_logger, handler, replacement))
+    yield log_dir
+    for route_logger, handler, replacement in swapped:
+        route_logger.removeHandler(replacement)
+        replacement.close()
+        route_logger.addHandler(handler)
+
+@pytest.fixture(autouse=True)
+def memory_db():
+    """A fresh in-memory database, and no process caches carried over from other tests"""
+    db.reset()
+    data_version.version_cache.clear()
+    sharded_counters.balance_cache.clear()
+    categorization_rules.matcher_cache.clear()
+    single_flight.in_flight.clear()
+    category_routes.gas_cache.clear()
+    category_routes.freqs.clear()
+    plaid_utils.webhook_key_cache.clear()
+    plaid_utils.webhook_key_lookups.clear()
+    insights_routes.breakdown_cache.clear()
+    yield db
+
+@pytest.fixture
+def call():
+    """Call a route through the app in-process: call(path, body) -> {"status", "body", ...}"""
+    from main import app
+    from api.batch_routes import BatchOperation, dispatch_operation
+
+    def call(path: str, body: dict = None, headers: dict = None, method: str = "POST") -> dict:
+        return asyncio.run(dispatch_operation(app, BatchOperation(path=path, method=method, body=body, headers=headers or {})))
+    return call
+
+@pytest.fixture
+def user(call):
+    """A user created through the routes, with two categories besides Unallocated Funds"""
+    user_id = "test-user"
+    assert call("/user/create-user", {"email": "test@example.com", "user_id": user_id})["status"] == 200
+    category_ids = [
+        call("/category/create-category", {"name": name, "user_id": user_id})["body"]["category_id"]
+        for name in ("Groceries", "Rent")
+    ]
+    unallocated = db.collection("categories").where("user_id", "==", user_id).where("is_unallocated_funds", "==", True).get()[0]
+    return {"user_id": user_id, "category_ids": category_ids, "unallocated_id": unallocated.id}
@@ -0,0 +1,67 @@
+from decimal import Decimal
+import pytest
+from google.api_core.exceptions import ServiceUnavailable
+from api.db import db
+from api import aggregations
+from api.aggregations import count_and_sum, count_documents, sums_by_group
+from api.memory_firestore import MemoryQuery
+
+@pytest.fixture(autouse=True)
+def fresh_read_costs(monkeypatch):
+    monkeypatch.setattr(aggregations, "read_costs", {})
+    monkeypatch.setattr(aggregations, "aggregations_unavailable", False)
+
+def add_transactions(amounts_by_category: dict) -> None:
+    for category_id, amounts in amounts_by_category.items():
+        for index, amount in enumerate(amounts):
+            db.collection("transactions").document(f"{category_id}-{index}").set({"user_id": "user-1", "category_id": category_id, "amount": amount})
+
+def user_transactions():
+    return db.collection("transactions").where("user_id", "==", "user-1")
+
+def test_count_and_sum_run_server_side():
+    add_transactions({"groceries": [-10.1, -20.2], "rent": [-900]})
+    assert count_and_sum(user_transactions(), "amount", label="test") == {"count": 3, "sum": Decimal("-930.30")}
+    assert count_documents(user_transactions().where("category_id", "==", "rent"), label="test") == 1
+    assert aggregations.read_costs == {"test": {"aggregation": {"calls": 2, "reads": 2, "documents": 4}}}
+
+def test_unsupported_client_falls_back_to_streaming_for_good(monkeypatch):
+    add_transactions({"groceries": [-10.1, -20.2]})
+    def unsupported(self, alias=None):
+        raise AttributeError("'Query' object has no attribute 'count'")
+    monkeypatch.setattr(MemoryQuery, "count", unsupported)
+
+    assert count_and_sum(user_transactions(), "amount", label="test") == {"count": 2, "sum": Decimal("-30.3")}
+    assert aggregations.aggregations_unavailable is True
+    assert aggregations.read_costs["test"] == {"stream": {"calls": 1, "reads": 2, "documents": 2}}
+
+def test_failed_aggregation_streams_once_and_is_retried(monkeypatch):
+    add_transactions({"groceries": [-10.1]})
+    count = MemoryQuery.count
+    failures = [ServiceUnavailable("aggregation backend unavailable")]
+    def flaky(self, alias=None):
+        if failures:
+            raise failures.pop()
+        return count(self, alias)
+    monkeypatch.setattr(MemoryQuery, "count", flaky)
+
+    assert count_documents(user_transactions(), label="test") == 1
+    assert count_documents(user_transactions(), label="test") == 1
+    assert aggregations.aggregations_unavailable is False
+    assert set(aggregations.read_costs["test"]) == {"stream", "aggregation"}
+
+def test_sums_by_group_aggregates_per_group_when_cheaper():
+    add_transactions({"groceries": [-10.1, -20.2, -5], "rent": [-900, -100], "empty": []})
+    totals = sums_by_group(user_transactions(), "category_id", ["groceries", "rent", "empty"], "amount", label="test")
+    assert totals == {"groceries": Decimal("-35.30"), "rent": Decimal("-1000.00")}
+    # One count of the whole query, then one aggregation per group
+    assert aggregations.read_costs["test"] == {"aggregation": {"calls": 4, "reads": 4, "documents": 10}}
+
+def test_sums_by_group_streams_when_there_are_fewer_documents_than_groups():
+    add_transactions({"groceries": [-10.1], "rent": [-900]})
+    totals = sums_by_group(user_transactions(), "category_id", ["groceries", "rent", "fun", "travel"], "amount", label="test")
+    assert totals == {"groceries": Decimal("-10.1"), "rent": Decimal("-900")}
+    assert aggregations.read_costs["test"]["stream"] == {"calls": 1, "reads": 2, "documents": 2}
+
+def test_sums_by_group_of_nothing():
+    assert sums_by_group(user_transactions(), "category_id", ["groceries"], "amount", label="test") == {}
@@ -0,0 +1,102 @@
+from api.db import db, SharedBatch
+from api.sharded_counters import read_balance
+
+def balance(category_id: str) -> float:
+    return read_balance(category_id, db.collection("categories").document(category_id).get().to_dict())
+
+def create_transaction_operation(user: dict, category_id: str, amount: float, name: str = "Coffee") -> dict:
+    return {"path": "/transaction/create-transaction", "body": {
+        "user_id": user["user_id"], "category_id": category_id, "amount": amount, "name": name, "date": "2026-10-05"
+    }}
+
+def test_atomic_batch_commits_all_mutations(user, call):
+    groceries, rent = user["category_ids"]
+    response = call("/batch", {"atomic": True, "operations": [
+        create_transaction_operation(user, groceries, -10.0),
+        create_transaction_operation(user, rent, -20.0)
+    ]})
+    assert response["status"] == 200
+    assert response["body"]["committed"] is True
+    assert [result["status"] for result in response["body"]["results"]] == [200, 200]
+    assert balance(groceries) == -10.0
+    assert balance(rent) == -20.0
+
+def test_atomic_batch_rejects_two_mutations_of_one_document(user, call):
+    groceries, rent = user["category_ids"]
+    transaction_id = call("/transaction/create-transaction", create_transaction_operation(user, groceries, -10.0)["body"])["body"]["transaction_id"]
+
+    response = call("/batch", {"atomic": True, "operations": [
+        {"path": "/transaction/update-transaction-category", "body": {"user_id": user["user_id"], "transaction_id": transaction_id, "category_id": rent}},
+        {"path": "/transaction/delete-transaction", "body": {"user_id": user["user_id"], "transaction_id": transaction_id}}
+    ]})
+    assert response["status"] == 400
+    assert "transactions/" + transaction_id in response["body"]["detail"]
+    assert balance(groceries) == -10.0
+
+def test_failed_operation_marks_the_other_mutations_not_committed(user, call):
+    groceries = user["category_ids"][0]
+    response = call("/batch", {"atomic": True, "operations": [
+        create_transaction_operation(user, groceries, -10.0),
+        create_transaction_operation(user, "missing-category", -20.0)
+    ]})
+    results = response["body"]["results"]
+    assert response["body"]["committed"] is False
+    assert results[0]["status"] == 424
+    assert results[1]["status"] == 404
+    assert db.collection("transactions").get() == []
+
+def test_failed_commit_marks_every_mutation_failed(user, call, monkeypatch):
+    groceries, rent = user["category_ids"]
+
+    def failing_commit(self):
+        raise RuntimeError("deadline exceeded")
+    monkeypatch.setattr(SharedBatch, "commit_shared", failing_commit)
+
+    response = call("/batch", {"atomic": True, "operations": [
+        create_transaction_operation(user, groceries, -10.0),
+        {"path": "/category/get-categories", "body": {"user_id": user["user_id"]}},
+        create_transaction_operation(user, rent, -20.0)
+    ]})
+    results = response["body"]["results"]
+    assert response["status"] == 500
+    assert response["body"]["committed"] is False
+    assert [result["status"] for result in results] == [500, 200, 500]
+    assert "deadline exceeded" in results[0]["body"]["detail"]
+    assert db.collection("transactions").get() == []
+
+def uncategorized_transaction(user: dict, transaction_id: str) -> None:
+    db.collection("transactions").document(transaction_id).set({
+        "user_id": user["user_id"], "category_id": None, "amount": -42.0, "name": "Corner Market", "merchant_name": "Corner Market", "date": "2026-10-05"
+    })
+
+def create_rule_operation(user: dict, category_id: str) -> dict:
+    return {"path": "/categorization_rule/create-rule", "body": {
+        "user_id": user["user_id"], "category_id": category_id, "merchant_pattern": "market", "apply_to_history": True
+    }}
+
+def test_background_work_runs_after_the_atomic_commit(user, call):
+    groceries, rent = user["category_ids"]
+    uncategorized_transaction(user, "txn-1")
+
+    response = call("/batch", {"atomic": True, "operations": [
+        create_rule_operation(user, groceries),
+        create_transaction_operation(user, rent, -20.0)
+    ]})
+    assert response["body"]["committed"] is True
+    # The rule only exists once the batch commits; applying it any earlier matches nothing
+    assert db.collection("transactions").document("txn-1").get().to_dict()["category_id"] == groceries
+    assert balance(groceries) == -42.0
+
+def test_background_work_of_an_uncommitted_batch_never_runs(user, call, monkeypatch):
+    groceries = user["category_ids"][0]
+    uncategorized_transaction(user, "txn-1")
+    applied = []
+    monkeypatch.setattr("api.categorization_rule_routes.apply_rules_to_history", applied.append)
+
+    response = call("/batch", {"atomic": True, "operations": [
+        create_rule_operation(user, groceries),
+        create_transaction_operation(user, "missing-category", -20.0)
+    ]})
+    assert response["body"]["committed"] is False
+    assert applied == []
+    assert db.collection("categorization_rules").get() == []
@@ -0,0 +1,57 @@
+from api.db import db
+from api.assignment_routes import BULK_ASSIGN_MAX_ASSIGNMENTS
+from api.memory_firestore import MemoryWriteBatch
+from api.sharded_counters import read_balance
+
+def balance(category_id: str) -> float:
+    return read_balance(category_id, db.collection("categories").document(category_id).get().to_dict())
+
+def test_bulk_assign_nets_unallocated_funds(user, call):
+    groceries, rent = user["category_ids"]
+    response = call("/assignment/bulk-assign", {"user_id": user["user_id"], "date": "2026-10-01", "assignments": [
+        {"category_id": groceries, "amount": 150},
+        {"category_id": rent, "amount": 900}
+    ]})
+    assert response["status"] == 200
+    assert len(response["body"]["assignment_ids"]) == 2
+    assert response["body"]["total"] == 1050.0
+    assert balance(groceries) == 150.0
+    assert balance(rent) == 900.0
+    assert balance(user["unallocated_id"]) == -1050.0
+
+def test_bulk_assign_over_the_cap_writes_nothing(user, call):
+    items = [{"category_id": f"category-{index}", "amount": 1} for index in range(BULK_ASSIGN_MAX_ASSIGNMENTS + 1)]
+    response = call("/assignment/bulk-assign", {"user_id": user["user_id"], "date": "2026-10-01", "assignments": items})
+    assert response["status"] == 400
+    assert db.collection("assignments").get() == []
+
+def test_bulk_assign_with_unknown_category_writes_nothing(user, call):
+    response = call("/assignment/bulk-assign", {"user_id": user["user_id"], "date": "2026-10-01", "assignments": [
+        {"category_id": user["category_ids"][0], "amount": 150},
+        {"category_id": "missing-category", "amount": 900}
+    ]})
+    assert response["status"] == 404
+    assert db.collection("assignments").get() == []
+
+def test_retry_replays_a_committed_bulk_assign(user, call):
+    body = {"user_id": user["user_id"], "date": "2026-10-01", "assignments": [{"category_id": user["category_ids"][0], "amount": 150}]}
+    first = call("/assignment/bulk-assign", body, {"Idempotency-Key": "bulk-1"})
+    retry = call("/assignment/bulk-assign", body, {"Idempotency-Key": "bulk-1"})
+    assert retry["body"] == first["body"]
+    assert len(db.collection("assignments").get()) == 1
+    assert balance(user["category_ids"][0]) == 150.0
+
+def test_retry_after_a_failed_commit_runs_again(user, call, monkeypatch):
+    body = {"user_id": user["user_id"], "date": "2026-10-01", "assignments": [{"category_id": user["category_ids"][0], "amount": 150}]}
+    original_commit = MemoryWriteBatch.commit
+
+    def failing_commit(self):
+        raise RuntimeError("deadline exceeded")
+    monkeypatch.setattr(MemoryWriteBatch, "commit", failing_commit)
+    assert call("/assignment/bulk-assign", body, {"Idempotency-Key": "bulk-1"})["status"] == 500
+
+    monkeypatch.setattr(MemoryWriteBatch, "commit", original_commit)
+    retry = call("/assignment/bulk-assign", body, {"Idempotency-Key": "bulk-1"})
+    assert retry["status"] == 200
+    assert len(db.collection("assignments").get()) == 1
+    assert balance(user["category_ids"][0]) == 150.0
@@ -0,0 +1,45 @@
+from datetime import datetime, timedelta, timezone
+from api.db import db
+from api import cascade_delete
+
+def create_plaid_item(user_id: str):
+    db.collection("plaid_items").document("plaid-item-1").set({"user_id": user_id, "access_token": "access-test", "item_id": "item-test", "institution_name": "Test Bank", "accounts": []})
+
+def test_delete_user_removes_items_at_plaid_and_every_user_document(user, call, monkeypatch):
+    removed = []
+    monkeypatch.setattr(cascade_delete, "remove_plaid_item", removed.append)
+    create_plaid_item(user["user_id"])
+    call("/transaction/create-transaction", {"user_id": user["user_id"], "category_id": user["category_ids"][0], "name": "Corner shop", "amount": -5, "date": "2026-10-02"}, {"Idempotency-Key": "tx-1"})
+
+    response = call("/user/delete-user", {"user_id": user["user_id"]})
+    assert response["status"] == 200
+    assert removed == ["access-test"]
+    for collection in cascade_delete.USER_COLLECTIONS:
+        assert db.collection(collection).where("user_id", "==", user["user_id"]).get() == [], collection
+    assert not db.collection("users").document(user["user_id"]).get().exists
+
+def test_plaid_failure_leaves_the_user_to_retry(user, call, monkeypatch):
+    def failing_remove(access_token):
+        raise RuntimeError("Plaid is unavailable")
+    monkeypatch.setattr(cascade_delete, "remove_plaid_item", failing_remove)
+    create_plaid_item(user["user_id"])
+
+    assert call("/user/delete-user", {"user_id": user["user_id"]})["status"] == 500
+    assert db.collection("plaid_items").document("plaid-item-1").get().exists
+    assert db.collection("categories").where("user_id", "==", user["user_id"]).get() != []
+
+def test_interrupted_job_is_reported_failed_and_a_rerun_resumes(user, call, monkeypatch):
+    monkeypatch.setattr(cascade_delete, "remove_plaid_item", lambda access_token: None)
+    job_ref = cascade_delete.create_job(user["user_id"], "user", user["user_id"], 1000)
+    body = {"user_id": user["user_id"], "job_id": job_ref.id}
+    assert call("/user/get-delete-job", body)["body"]["job"]["status"] == "running"
+
+    # The instance running the job stopped heartbeating
+    job_ref.update({"updated_at": datetime.now(timezone.utc) - cascade_delete.job_stale_after - timedelta(seconds=1)})
+    job = call("/user/get-delete-job", body)["body"]["job"]
+    assert job["status"] == "failed"
+    assert "resume" in job["error"]
+    assert job_ref.get().to_dict()["status"] == "failed"
+
+    assert call("/user/delete-user", {"user_id": user["user_id"]})["status"] == 200
+    assert not db.collection("users").document(user["user_id"]).get().exists
@@ -0,0 +1,66 @@
+from datetime import datetime, timezone
+from api.db import db
+from api import categorization_rules
+from api.categorization_rules import CompiledRule, RuleMatcher, apply_rules_to_history
+from api.sharded_counters import read_balance
+
+def rule(rule_id: str, category_id: str, priority: int = 0, **conditions) -> CompiledRule:
+    return CompiledRule(rule_id, {"category_id": category_id, "priority": priority, "created_at": datetime(2026, 1, int(rule_id[-1]), tzinfo=timezone.utc), **conditions})
+
+def add_uncategorized(user_id: str, transaction_id: str, amount: float, merchant_name: str, date: str = "2026-10-05") -> None:
+    db.collection("transactions").document(transaction_id).set({
+        "user_id": user_id,
+        "category_id": None,
+        "amount": amount,
+        "name": merchant_name,
+        "merchant_name": merchant_name,
+        "date": date
+    })
+
+def available(category_id: str) -> float:
+    return read_balance(category_id, db.collection("categories").document(category_id).get().to_dict())
+
+def test_substring_and_wildcard_patterns_ignore_case():
+    matcher = RuleMatcher([rule("rule-1", "coffee", merchant_pattern="STARBUCKS"), rule("rule-2", "travel", name_pattern="uber*trip")])
+    assert matcher.match({"merchant_name": "Starbucks #123", "name": "", "amount": -5}) == "coffee"
+    assert matcher.match({"merchant_name": "", "name": "Uber 8 Trip", "amount": -20}) == "travel"
+    assert matcher.match({"merchant_name": "Uber Eats", "name": "Uber Eats", "amount": -20}) is None
+
+def test_higher_priority_then_older_rule_wins():
+    matcher = RuleMatcher([
+        rule("rule-2", "newer", merchant_pattern="market"),
+        rule("rule-1", "older", merchant_pattern="market"),
+        rule("rule-3", "large", priority=1, merchant_pattern="market", min_amount=100),
+    ])
+    assert matcher.match({"merchant_name": "Farmers Market", "amount": -40}) == "older"
+    assert matcher.match({"merchant_name": "Farmers Market", "amount": -140}) == "large"
+
+def test_apply_to_history_categorizes_and_moves_available(user, call):
+    groceries = user["category_ids"][0]
+    add_uncategorized(user["user_id"], "txn-1", -42.0, "Corner Market")
+    add_uncategorized(user["user_id"], "txn-2", -9.0, "Cinema")
+    assert call("/categorization_rule/create-rule", {"user_id": user["user_id"], "category_id": groceries, "merchant_pattern": "market"})["status"] == 200
+
+    assert apply_rules_to_history(user["user_id"]) == {"scanned": 2, "categorized": 1}
+    assert db.collection("transactions").document("txn-1").get().to_dict()["category_id"] == groceries
+    assert db.collection("transactions").document("txn-2").get().to_dict()["category_id"] is None
+    assert available(groceries) == -42.0
+
+def test_recategorization_during_apply_is_not_overwritten(user, call, monkeypatch):
+    groceries, rent = user["category_ids"]
+    add_uncategorized(user["user_id"], "txn-1", -42.0, "Corner Market")
+    assert call("/categorization_rule/create-rule", {"user_id": user["user_id"], "category_id": groceries, "merchant_pattern": "market"})["status"] == 200
+
+    # The user moves the transaction to Rent after the chunk was read, before it commits
+    invalidate = categorization_rules.invalidate_closed_snapshots
+    def recategorize_then_invalidate(*args, **kwargs):
+        if db.collection("transactions").document("txn-1").get().to_dict()["category_id"] is None:
+            body = {"user_id": user["user_id"], "transaction_id": "txn-1", "category_id": rent}
+            assert call("/transaction/update-transaction-category", body)["status"] == 200
+        return invalidate(*args, **kwargs)
+    monkeypatch.setattr(categorization_rules, "invalidate_closed_snapshots", recategorize_then_invalidate)
+
+    assert apply_rules_to_history(user["user_id"]) == {"scanned": 0, "categorized": 0}
+    assert db.collection("transactions").document("txn-1").get().to_dict()["category_id"] == rent
+    assert available(rent) == -42.0
+    assert available(groceries) == 0.0
@@ -0,0 +1,23 @@
+from google.cloud import firestore
+from api.db import db, new_batch
+from api.data_version import bump_data_version, get_data_version
+
+def test_version_read_before_the_commit_is_not_kept(user):
+    before = get_data_version(user["user_id"])
+    batch = new_batch()
+    bump_data_version(user["user_id"], batch)
+    # A concurrent read between staging and committing caches the old version
+    assert get_data_version(user["user_id"]) == before
+    batch.commit()
+    assert get_data_version(user["user_id"]) == before + 1
+
+def test_write_on_another_instance_is_not_answered_with_304(user, call):
+    body = {"user_id": user["user_id"]}
+    etag = call("/category/get-categories", body)["etag"]
+    assert call("/category/get-categories", body, {"If-None-Match": etag})["status"] == 304
+
+    # Another instance bumps the version; this one still has the old version cached
+    db.collection("users").document(user["user_id"]).update({"data_version": firestore.Increment(1)})
+    response = call("/category/get-categories", body, {"If-None-Match": etag})
+    assert response["status"] == 200
+    assert response["etag"] != etag
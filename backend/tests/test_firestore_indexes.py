@@ -0,0 +1,28 @@
+import json
+import os
+from api.firestore_indexes import build_index_manifest
+
+MANIFEST_PATH = os.path.join(os.path.dirname(os.path.dirname(__file__)), "firestore.indexes.json")
+
+def index_keys(manifest: dict) -> set:
+    return {(index["collectionGroup"], tuple(field["fieldPath"] for field in index["fields"])) for index in manifest["indexes"]}
+
+def test_committed_manifest_is_up_to_date():
+    with open(MANIFEST_PATH) as manifest_file:
+        assert json.load(manifest_file) == build_index_manifest()
+
+def test_manifest_covers_budget_and_snapshot_queries():
+    keys = index_keys(build_index_manifest())
+    assert ("transactions", ("user_id", "period_month", "category_id", "amount")) in keys
+    assert ("assignments", ("user_id", "pay_period", "category_id", "amount")) in keys
+    assert ("assignments", ("user_id", "category_id", "date", "amount")) in keys
+    assert ("period_snapshots", ("user_id", "end_date")) in keys
+    assert ("transactions", ("user_id", "category_id", "__name__")) in keys
+
+def test_manifest_covers_lookup_and_cascade_queries():
+    keys = index_keys(build_index_manifest())
+    assert ("transactions", ("user_id", "plaid_transaction_id")) in keys
+    assert ("transactions", ("user_id", "merchant_key")) in keys
+    assert ("transactions", ("user_id", "plaid_item_id", "__name__")) in keys
+    assert ("transactions", ("user_id", "institution_name", "__name__")) in keys
+    assert ("categories", ("user_id", "is_unallocated_funds")) in keys
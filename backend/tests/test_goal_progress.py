@@ -0,0 +1,53 @@
+from api.budget_aggregates import compute_goal_progress
+
+def totals(*items) -> dict:
+    return {"allocated_and_spent": [{"category_id": category_id, "allocated": allocated, "spent": spent} for category_id, allocated, spent in items], "unallocated_income": 0.0}
+
+def goal(result: dict, category_id: str) -> dict:
+    return next(item for item in result["goals"] if item["category_id"] == category_id)
+
+def test_partly_funded_goal():
+    result = compute_goal_progress(
+        [{"id": "groceries", "available": 150.0, "goal_amount": 400.0}],
+        totals(("groceries", 150.0, 0.0))
+    )
+    groceries = goal(result, "groceries")
+    assert groceries["progress"] == 0.375
+    assert groceries["remaining"] == 250.0
+    assert groceries["needed_this_period"] == 250.0
+    assert not groceries["funded"]
+
+def test_overfunded_goal_is_capped_at_complete():
+    result = compute_goal_progress(
+        [{"id": "rent", "available": 1200.0, "goal_amount": 1000.0}],
+        totals(("rent", 1200.0, 0.0))
+    )
+    rent = goal(result, "rent")
+    assert rent["progress"] == 1.0
+    assert rent["remaining"] == 0.0
+    assert rent["funded"]
+
+def test_overspent_category_without_goal_needs_its_deficit_covered():
+    result = compute_goal_progress(
+        [{"id": "dining", "available": -45.5}],
+        totals(("dining", 0.0, 45.5))
+    )
+    dining = goal(result, "dining")
+    assert dining["progress"] is None
+    assert dining["needed_this_period"] == 45.5
+    assert not dining["funded"]
+
+def test_shortfall_is_what_unallocated_funds_cannot_cover():
+    result = compute_goal_progress(
+        [
+            {"id": "unallocated", "available": 200.0, "is_unallocated_funds": True},
+            {"id": "groceries", "available": 0.0, "goal_amount": 400.0},
+            {"id": "dining", "available": -50.0}
+        ],
+        totals()
+    )
+    assert [item["category_id"] for item in result["goals"]] == ["groceries", "dining"]
+    assert result["total_goal"] == 400.0
+    assert result["total_needed"] == 450.0
+    assert result["unallocated_available"] == 200.0
+    assert result["shortfall"] == 250.0
@@ -0,0 +1,29 @@
+import pytest
+from api import health_routes
+
+def failing_probe():
+    raise ConnectionError("connection refused")
+
+@pytest.fixture(autouse=True)
+def probes(monkeypatch):
+    health_routes.probe_cache.clear()
+    monkeypatch.setitem(health_routes.PROBES, "plaid", lambda: {"host": "sandbox.plaid.com"})
+
+def test_ready_when_every_dependency_is_up(call):
+    response = call("/health/ready", method="GET")
+    assert response["status"] == 200
+    assert response["body"]["status"] == "ready"
+
+def test_plaid_outage_only_degrades(call, monkeypatch):
+    monkeypatch.setitem(health_routes.PROBES, "plaid", failing_probe)
+    response = call("/health/ready", method="GET")
+    assert response["status"] == 200
+    assert response["body"]["status"] == "degraded"
+    assert response["body"]["checks"]["plaid"]["status"] == "error"
+    assert response["body"]["checks"]["plaid"]["required"] is False
+
+def test_firestore_outage_is_not_ready(call, monkeypatch):
+    monkeypatch.setitem(health_routes.PROBES, "firestore", failing_probe)
+    response = call("/health/ready", method="GET")
+    assert response["status"] == 503
+    assert response["body"]["status"] == "not_ready"
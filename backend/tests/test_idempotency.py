@@ -0,0 +1,38 @@
+from types import SimpleNamespace
+from api.db import db
+from api import plaid_routes
+
+def transaction_body(user, amount):
+    return {"user_id": user["user_id"], "category_id": user["category_ids"][0], "name": "Corner shop", "amount": amount, "date": "2026-10-02"}
+
+def test_retry_with_the_same_body_replays(user, call):
+    first = call("/transaction/create-transaction", transaction_body(user, -12.5), {"Idempotency-Key": "tx-1"})
+    retry = call("/transaction/create-transaction", transaction_body(user, -12.5), {"Idempotency-Key": "tx-1"})
+    assert first["status"] == retry["status"] == 200
+    assert retry["body"] == first["body"]
+    assert len(db.collection("transactions").get()) == 1
+
+def test_key_reused_with_another_body_is_rejected(user, call):
+    call("/transaction/create-transaction", transaction_body(user, -12.5), {"Idempotency-Key": "tx-1"})
+    reused = call("/transaction/create-transaction", transaction_body(user, -99), {"Idempotency-Key": "tx-1"})
+    assert reused["status"] == 422
+    assert len(db.collection("transactions").get()) == 1
+
+def test_exchange_replay_keeps_the_access_token_out_of_the_key(user, call, monkeypatch):
+    exchange = lambda request: SimpleNamespace(access_token="access-sandbox-secret", item_id="plaid-item-1")
+    monkeypatch.setattr(plaid_routes.client, "item_public_token_exchange", exchange)
+    body = {"public_token": "public-sandbox-1", "user_id": user["user_id"], "institution_name": "First Platypus Bank", "accounts": [
+        {"account_id": "account-1", "name": "Checking", "type": "depository"}
+    ]}
+
+    first = call("/plaid/exchange-public-token", body, {"Idempotency-Key": "link-1"})
+    assert first["status"] == 200
+    plaid_item_id = first["body"]["plaid_item_id"]
+    assert db.collection("plaid_items").document(plaid_item_id).get().exists
+
+    key_docs = [doc.to_dict() for doc in db.collection("idempotency_keys").get()]
+    assert [doc["response"] for doc in key_docs] == [{"item_id": "plaid-item-1", "plaid_item_id": plaid_item_id}]
+
+    retry = call("/plaid/exchange-public-token", body, {"Idempotency-Key": "link-1"})
+    assert retry["body"] == {"item_id": "plaid-item-1", "plaid_item_id": plaid_item_id}
+    assert len(db.collection("plaid_items").get()) == 1
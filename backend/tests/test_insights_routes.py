@@ -0,0 +1,53 @@
+from api.db import db
+from api.budget_periods import get_period_keys
+
+WINDOW = {"start_date": "2026-10-01", "end_date": "2026-10-31"}
+
+def add_transaction(user_id: str, transaction_id: str, amount: float, merchant_name: str, primary: str = None, detailed: str = None, date: str = "2026-10-05") -> None:
+    db.collection("transactions").document(transaction_id).set({
+        "user_id": user_id,
+        "category_id": None,
+        "amount": amount,
+        "name": merchant_name.upper(),
+        "merchant_name": merchant_name,
+        "merchant_key": merchant_name.lower(),
+        "personal_finance_category": {"primary": primary, "detailed": detailed} if primary else None,
+        "date": date,
+        **get_period_keys(date, None)
+    })
+
+def breakdown(call, user, headers=None, **body) -> dict:
+    return call("/insights/get-spending-breakdown", {"user_id": user["user_id"], **WINDOW, **body}, headers=headers)
+
+def test_spending_per_category_and_merchant(user, call):
+    add_transaction(user["user_id"], "txn-1", -40.0, "Whole Foods", "FOOD_AND_DRINK", "FOOD_AND_DRINK_GROCERIES")
+    add_transaction(user["user_id"], "txn-2", -4.5, "Starbucks", "FOOD_AND_DRINK", "FOOD_AND_DRINK_COFFEE")
+    add_transaction(user["user_id"], "txn-3", -15.0, "Starbucks", "FOOD_AND_DRINK", "FOOD_AND_DRINK_COFFEE")
+    add_transaction(user["user_id"], "txn-4", -60.0, "Corner Garage")
+    add_transaction(user["user_id"], "txn-5", 2500.0, "Acme Payroll", "INCOME", "INCOME_WAGES")
+    add_transaction(user["user_id"], "txn-6", -999.0, "Whole Foods", "FOOD_AND_DRINK", "FOOD_AND_DRINK_GROCERIES", date="2026-11-01")
+
+    response = breakdown(call, user)
+    assert response["status"] == 200
+    body = response["body"]
+    assert (body["total_spent"], body["total_inflow"]) == (119.5, 2500.0)
+    assert [(group["primary"], group["spent"], group["count"]) for group in body["categories"]] == [("UNCLASSIFIED", 60.0, 1), ("FOOD_AND_DRINK", 59.5, 3)]
+    assert [(group["detailed"], group["spent"]) for group in body["categories"][1]["detailed"]] == [("FOOD_AND_DRINK_GROCERIES", 40.0), ("FOOD_AND_DRINK_COFFEE", 19.5)]
+    assert [(merchant["merchant_name"], merchant["count"]) for merchant in body["merchants"]] == [("Corner Garage", 1), ("Whole Foods", 1), ("Starbucks", 2)]
+
+    top = breakdown(call, user, top_merchants=1)["body"]["merchants"]
+    assert [merchant["merchant_key"] for merchant in top] == ["corner garage"]
+
+def test_breakdown_is_conditional_and_follows_writes(user, call):
+    add_transaction(user["user_id"], "txn-1", -40.0, "Whole Foods", "FOOD_AND_DRINK", "FOOD_AND_DRINK_GROCERIES")
+    first = breakdown(call, user)
+    assert breakdown(call, user, headers={"If-None-Match": first["etag"]})["status"] == 304
+
+    body = {"user_id": user["user_id"], "category_id": user["category_ids"][0], "name": "Corner shop", "amount": -10, "date": "2026-10-06"}
+    assert call("/transaction/create-transaction", body)["status"] == 200
+    second = breakdown(call, user, headers={"If-None-Match": first["etag"]})
+    assert second["status"] == 200 and second["body"]["total_spent"] == 50.0
+
+def test_inverted_window_is_rejected(user, call):
+    response = call("/insights/get-spending-breakdown", {"user_id": user["user_id"], "start_date": "2026-10-31", "end_date": "2026-10-01"})
+    assert response["status"] == 400
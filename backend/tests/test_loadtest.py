@@ -0,0 +1,66 @@
+import asyncio
+from loadtest.fake_plaid import FakePlaidServer, PAGE_SIZE
+from loadtest.run import percentile, build_report, check_thresholds, session_variables
+from loadtest.scenario import Session, resolve_template, select_value
+
+def test_templates_keep_raw_values_and_format_strings():
+    variables = {"user_id": "user-1", "category_ids": ["groceries"], "limit": 20}
+    body = {"user_id": "{user_id}", "limit": "{limit}", "category_id": "{choice:category_ids}", "note": "for {user_id}"}
+    assert resolve_template(body, variables) == {"user_id": "user-1", "limit": 20, "category_id": "groceries", "note": "for user-1"}
+
+def test_select_value_maps_and_indexes():
+    body = {"transactions": [{"id": "a"}, {"id": "b"}, {}], "pagination": {"next_cursor": "b"}}
+    assert select_value(body, "transactions[*].id") == ["a", "b"]
+    assert select_value(body, "transactions[1].id") == "b"
+    assert select_value(body, "pagination.next_cursor") == "b"
+    assert select_value(body, "pagination.missing") is None
+
+def test_fake_plaid_pages_history_then_reports_new_activity():
+    server = FakePlaidServer(history_size=PAGE_SIZE + 20, new_per_sync=3)
+    try:
+        first = server.transactions_sync({"access_token": "access-1"})
+        assert len(first["added"]) == PAGE_SIZE and first["has_more"] is True
+        second = server.transactions_sync({"access_token": "access-1", "cursor": first["next_cursor"]})
+        assert len(second["added"]) == 20 and second["has_more"] is False
+        caught_up = server.transactions_sync({"access_token": "access-1", "cursor": second["next_cursor"]})
+        assert len(caught_up["added"]) == 3
+        # The history is deterministic per access token
+        again = server.transactions_sync({"access_token": "access-1"})
+        assert again["added"][0] == first["added"][0]
+    finally:
+        server.server_close()
+
+def test_report_percentiles_and_thresholds():
+    assert percentile([], 0.95) == 0.0
+    assert percentile(list(range(1, 101)), 0.50) == 51
+    assert percentile(list(range(1, 101)), 0.95) == 95
+
+    results = [{"route": "/category/get-categories", "status": 200, "ms": float(ms), "reads": 4, "writes": 0} for ms in range(1, 21)]
+    results.append({"route": "/category/get-categories", "status": 500, "ms": 300.0, "reads": 1, "writes": 0})
+    report = build_report(results, sessions=3, seconds=2.0)
+    route = report["routes"]["/category/get-categories"]
+    assert (route["requests"], route["errors"], route["p95_ms"], route["max_ms"]) == (21, 1, 20.0, 300.0)
+    assert report["error_rate"] == round(1 / 21, 4)
+
+    thresholds = {"max_error_rate": 0.01, "p95_ms": {"/category/get-categories": 50, "/unused": 1}, "max_reads_per_request": {"/category/get-categories": 3}}
+    assert check_thresholds(report, thresholds) == [
+        f"error rate {report['error_rate']} > 0.01",
+        "/category/get-categories reads_per_request 3.9 > 3"
+    ]
+
+def test_session_runs_steps_and_sends_saved_etags(user):
+    from main import app
+    scenario = {"steps": [
+        {"call": "/category/get-categories", "body": {"user_id": "{user_id}"}, "conditional": True, "save": {"ids": "categories[*].id"}},
+        {"parallel": [
+            {"call": "/category/get-categories", "name": "again", "body": {"user_id": "{user_id}"}, "conditional": True},
+            {"think": 0}
+        ]}
+    ]}
+    results = []
+    session = Session(app, session_variables(user["user_id"], user["category_ids"]), results)
+    asyncio.run(session.run(scenario))
+
+    assert [(result["route"], result["status"]) for result in results] == [("/category/get-categories", 200), ("again", 304)]
+    assert results[0]["reads"] > 0 and results[1]["reads"] < results[0]["reads"]
+    assert set(user["category_ids"]) <= set(session.variables["ids"])
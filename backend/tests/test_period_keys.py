@@ -0,0 +1,49 @@
+from api.db import db
+from api.budget_periods import get_period_keys, get_window_period_key
+from api.period_keys import get_window_filter, backfill_period_keys
+
+PAY_START = "2026-01-02"
+
+def create_transaction(call, user, date: str) -> str:
+    body = {"user_id": user["user_id"], "category_id": user["category_ids"][0], "name": "Corner shop", "amount": -5, "date": date}
+    response = call("/transaction/create-transaction", body)
+    assert response["status"] == 200
+    return response["body"]["transaction_id"]
+
+def set_pay_schedule(call, user, start_date: str) -> None:
+    body = {"user_id": user["user_id"], "preferences": {"budget_period": "bi-weekly", "pay_schedule": {"start_date": start_date}}}
+    assert call("/user/update-preferences", body)["status"] == 200
+
+def test_period_keys_of_a_date():
+    assert get_period_keys("2026-03-15", None) == {"period_month": "2026-03", "pay_period": None}
+    # 72 days after the pay schedule start is the sixth 14-day period after it
+    assert get_period_keys("2026-03-15", PAY_START) == {"period_month": "2026-03", "pay_period": 5}
+
+def test_only_whole_months_and_pay_periods_have_a_key():
+    assert get_window_period_key("2026-02-01", "2026-02-28", PAY_START) == ("period_month", "2026-02")
+    assert get_window_period_key("2026-01-16", "2026-01-29", PAY_START) == ("pay_period", 1)
+    assert get_window_period_key("2026-01-16", "2026-01-30", PAY_START) is None
+    assert get_window_period_key("2026-01-16", "2026-01-29", None) is None
+
+def test_new_user_windows_use_period_keys(user):
+    assert get_window_filter(user["user_id"], "2026-02-01", "2026-02-28") == ("period_month", "2026-02")
+
+def test_pay_schedule_change_backfills_pay_periods(user, call):
+    transaction_id = create_transaction(call, user, "2026-01-20")
+    assert db.collection("transactions").document(transaction_id).get().to_dict().get("pay_period") is None
+
+    # The backfill runs as a background task of the preferences update
+    set_pay_schedule(call, user, PAY_START)
+
+    assert db.collection("transactions").document(transaction_id).get().to_dict()["pay_period"] == 1
+    state = db.collection("users").document(user["user_id"]).get().to_dict()["period_keys"]
+    assert state["complete"] is True and state["pay_start"] == PAY_START
+    assert get_window_filter(user["user_id"], "2026-01-16", "2026-01-29") == ("pay_period", 1)
+
+def test_windows_fall_back_to_date_ranges_until_the_backfill_completes(user, call):
+    set_pay_schedule(call, user, PAY_START)
+    db.collection("users").document(user["user_id"]).update({"period_keys.complete": False})
+    assert get_window_filter(user["user_id"], "2026-02-01", "2026-02-28") is None
+
+    assert backfill_period_keys(user["user_id"]) == {"updated": 0, "scanned": 0}
+    assert get_window_filter(user["user_id"], "2026-02-01", "2026-02-28") == ("period_month", "2026-02")
@@ -0,0 +1,67 @@
+from api.db import db, Batch
+from api import category_routes
+from api.data_version import bump_data_version
+from api.period_snapshots import get_snapshot, invalidate_closed_snapshots
+from api.budget_periods import get_period_keys
+
+WINDOW = {"start_date": "2025-01-01", "end_date": "2025-01-31"}
+
+def spent(response: dict, category_id: str) -> float:
+    return next(item["spent"] for item in response["allocated_and_spent"] if item["category_id"] == category_id)
+
+def create_transaction(call, user, amount):
+    response = call("/transaction/create-transaction", {"user_id": user["user_id"], "category_id": user["category_ids"][0], "name": "Corner shop", "amount": amount, "date": "2025-01-15"})
+    assert response["status"] == 200
+
+def test_closed_period_is_snapshotted(user, call):
+    create_transaction(call, user, -20)
+    response = call("/category/get-allocated-and-spent", {"user_id": user["user_id"], **WINDOW})
+    assert spent(response["body"], user["category_ids"][0]) == 20.0
+    assert get_snapshot(user["user_id"], WINDOW["start_date"], WINDOW["end_date"]) is not None
+
+def test_write_during_computation_is_not_frozen(user, call, monkeypatch):
+    compute = category_routes.compute_allocated_and_spent
+
+    def compute_then_write(*args):
+        # A backdated write commits after the totals were read, before the snapshot is saved
+        response = compute(*args)
+        bump_data_version(user["user_id"])
+        return response
+    monkeypatch.setattr(category_routes, "compute_allocated_and_spent", compute_then_write)
+
+    call("/category/get-allocated-and-spent", {"user_id": user["user_id"], **WINDOW})
+    assert get_snapshot(user["user_id"], WINDOW["start_date"], WINDOW["end_date"]) is None
+
+def test_backdated_write_drops_the_snapshot(user, call):
+    create_transaction(call, user, -20)
+    call("/category/get-allocated-and-spent", {"user_id": user["user_id"], **WINDOW})
+    create_transaction(call, user, -5)
+
+    response = call("/category/get-allocated-and-spent", {"user_id": user["user_id"], **WINDOW})
+    assert spent(response["body"], user["category_ids"][0]) == 25.0
+    snapshot = get_snapshot(user["user_id"], WINDOW["start_date"], WINDOW["end_date"])
+    assert spent(snapshot, user["category_ids"][0]) == 25.0
+
+def test_snapshot_saved_while_a_write_is_staged_is_dropped(user, call):
+    # A backdated write marks its snapshots stale while building its batch, before a
+    # snapshot of the period is saved, and commits after it
+    batch = Batch()
+    batch.set(db.collection("transactions").document(), {
+        "user_id": user["user_id"], "category_id": user["category_ids"][0], "name": "Corner shop", "amount": -20.0, "date": "2025-01-15",
+        **get_period_keys("2025-01-15", None)
+    })
+    invalidate_closed_snapshots(user["user_id"], ["2025-01-15"], batch)
+    bump_data_version(user["user_id"], batch)
+
+    call("/category/get-allocated-and-spent", {"user_id": user["user_id"], **WINDOW})
+    assert get_snapshot(user["user_id"], WINDOW["start_date"], WINDOW["end_date"]) is not None
+    batch.commit()
+
+    response = call("/category/get-allocated-and-spent", {"user_id": user["user_id"], **WINDOW})
+    assert spent(response["body"], user["category_ids"][0]) == 20.0
+
+def test_response_cache_misses_after_a_write(user, call):
+    body = {"user_id": user["user_id"], "start_date": "2025-01-01", "end_date": "2099-01-31"}
+    assert spent(call("/category/get-allocated-and-spent", body)["body"], user["category_ids"][0]) == 0.0
+    create_transaction(call, user, -20)
+    assert spent(call("/category/get-allocated-and-spent", body)["body"], user["category_ids"][0]) == 20.0
@@ -0,0 +1,58 @@
+from datetime import date
+from api.db import NULL_VALUE
+from api.plaid_normalize import NormalizedPage, build_account_index, normalize_transaction, new_transaction_document, modified_transaction_fields, RECORD_FIELDS
+
+ITEM_DATA = {"institution_name": "Test Bank", "accounts": [{"account_id": "account-1", "name": "Checking"}]}
+
+class PersonalFinanceCategory:
+    """A model-like object without to_dict, converted attribute by attribute"""
+    primary = "FOOD_AND_DRINK"
+    detailed = "FOOD_AND_DRINK_COFFEE"
+    confidence_level = "HIGH"
+
+def plaid_transaction(transaction_id: str, amount: float, **fields) -> dict:
+    return {
+        "transaction_id": transaction_id,
+        "account_id": "account-1",
+        "amount": amount,
+        "date": date(2026, 10, 5),
+        "name": "SQ *BLUE BOTTLE #12",
+        "merchant_name": None,
+        "pending": False,
+        **fields
+    }
+
+def test_transaction_is_converted_once_for_storage():
+    record = normalize_transaction(plaid_transaction("txn-1", 4.5, personal_finance_category=PersonalFinanceCategory()), build_account_index(ITEM_DATA), "2026-09-25")
+    assert record["amount"] == -4.5 and record["date"] == "2026-10-05"
+    assert record["account_name"] == "Checking" and record["merchant_key"] == "blue bottle"
+    assert (record["period_month"], record["pay_period"]) == ("2026-10", 0)
+    assert record["personal_finance_category"] == {"confidence_level": "HIGH", "detailed": "FOOD_AND_DRINK_COFFEE", "primary": "FOOD_AND_DRINK"}
+
+def test_page_is_keyed_by_plaid_id_and_pairs_posted_with_pending():
+    page = NormalizedPage({
+        "added": [
+            plaid_transaction("posted-1", 4.5, pending_transaction_id="pending-1"),
+            plaid_transaction("posted-2", 9.0, pending_transaction_id="pending-elsewhere"),
+        ],
+        "modified": [plaid_transaction("txn-3", 12.0, account_id="closed-account")],
+        "removed": [{"transaction_id": "pending-1"}],
+        "next_cursor": "cursor-2",
+        "has_more": True
+    }, ITEM_DATA)
+    assert list(page.added) == ["posted-1", "posted-2"]
+    assert page.modified["txn-3"]["account_name"] is None
+    assert page.removed == ["pending-1"]
+    assert (page.next_cursor, page.has_more) == ("cursor-2", True)
+    # pending-elsewhere was removed by an earlier page, it is not a pair of this one
+    assert page.pending_pairs() == {"posted-1": "pending-1"}
+
+def test_new_and_modified_documents_share_record_fields():
+    record = normalize_transaction(plaid_transaction("txn-1", -1200.0), {})
+    document = new_transaction_document(record, "user-1", "plaid-item-1", ITEM_DATA)
+    assert document["type"] == "credit" and document["category_id"] is NULL_VALUE
+    assert (document["user_id"], document["plaid_item_id"], document["institution_name"]) == ("user-1", "plaid-item-1", "Test Bank")
+
+    fields = modified_transaction_fields(record)
+    assert set(fields) == set(RECORD_FIELDS) | {"type"}
+    assert "category_id" not in fields and "plaid_transaction_id" not in fields
@@ -0,0 +1,136 @@
+import pytest
+from api.db import db
+from api import sync_lease
+from api.plaid_sync import persist_sync_page, LeaseLostError
+from api.bulk_writer import plaid_transaction_ref
+from api.sharded_counters import read_balance
+from api.memory_firestore import MemoryQuery
+
+def plaid_transaction(transaction_id: str, amount: float, date: str = "2026-10-05", name: str = "Corner Store", **fields) -> dict:
+    """A transactions_sync transaction; Plaid amounts are positive for money leaving the account"""
+    return {
+        "transaction_id": transaction_id,
+        "account_id": "account-1",
+        "amount": amount,
+        "date": date,
+        "name": name,
+        "merchant_name": name,
+        "personal_finance_category": {"primary": "FOOD_AND_DRINK", "detailed": "FOOD_AND_DRINK_GROCERIES", "confidence_level": "HIGH"},
+        "pending": False,
+        "pending_transaction_id": None,
+        **fields
+    }
+
+def sync_page(added=(), modified=(), removed=(), next_cursor="cursor-1", has_more=False) -> dict:
+    return {
+        "added": list(added),
+        "modified": list(modified),
+        "removed": [{"transaction_id": transaction_id} for transaction_id in removed],
+        "next_cursor": next_cursor,
+        "has_more": has_more
+    }
+
+def create_plaid_item(user_id: str):
+    item_data = {
+        "user_id": user_id,
+        "access_token": "access-test",
+        "item_id": "item-test",
+        "institution_name": "Test Bank",
+        "accounts": [{"account_id": "account-1", "name": "Checking"}]
+    }
+    item_ref = db.collection("plaid_items").document("plaid-item-1")
+    item_ref.set(item_data)
+    return item_ref, item_data
+
+def balance(category_id: str) -> float:
+    category_doc = db.collection("categories").document(category_id).get()
+    return read_balance(category_id, category_doc.to_dict())
+
+def test_replayed_page_writes_each_transaction_once(user):
+    item_ref, item_data = create_plaid_item(user["user_id"])
+    page = sync_page(added=[plaid_transaction("txn-1", 12.5), plaid_transaction("txn-2", 40.0)])
+
+    persist_sync_page(user["user_id"], item_ref, item_data, page)
+    persist_sync_page(user["user_id"], item_ref, item_data, page)
+
+    transactions = db.collection("transactions").where("user_id", "==", user["user_id"]).get()
+    assert sorted(doc.to_dict()["plaid_transaction_id"] for doc in transactions) == ["txn-1", "txn-2"]
+    assert item_ref.get().to_dict()["cursor"] == "cursor-1"
+
+def test_replayed_page_keeps_category_set_since(user, call):
+    item_ref, item_data = create_plaid_item(user["user_id"])
+    groceries = user["category_ids"][0]
+    page = sync_page(added=[plaid_transaction("txn-1", 12.5)])
+    persist_sync_page(user["user_id"], item_ref, item_data, page)
+
+    transaction_ref = plaid_transaction_ref("txn-1")
+    created_at = transaction_ref.get().to_dict()["created_at"]
+    response = call("/transaction/update-transaction-category", {
+        "user_id": user["user_id"],
+        "transaction_id": transaction_ref.id,
+        "category_id": groceries
+    })
+    assert response["status"] == 200
+    assert balance(groceries) == -12.5
+
+    # Plaid restarts the pagination loop and the same page comes in again
+    persist_sync_page(user["user_id"], item_ref, item_data, page)
+
+    transaction_data = transaction_ref.get().to_dict()
+    assert transaction_data["category_id"] == groceries
+    assert transaction_data["created_at"] == created_at
+    assert balance(groceries) == -12.5
+
+def test_posted_transactions_take_over_pending_documents_in_bulk(user, monkeypatch):
+    item_ref, item_data = create_plaid_item(user["user_id"])
+    groceries = user["category_ids"][0]
+    # Pending transactions stored before deterministic ids, under random document ids
+    for index in range(40):
+        db.collection("transactions").document().set({
+            "user_id": user["user_id"], "plaid_transaction_id": f"pending-{index}", "category_id": groceries,
+            "amount": -10.0, "name": "Corner Store", "date": "2026-10-05", "pending": True
+        })
+
+    lookups = []
+    stream = MemoryQuery.stream
+    def counting_stream(query):
+        if any(field == "plaid_transaction_id" for field, _, _ in query._filters):
+            lookups.append(query)
+        return stream(query)
+    monkeypatch.setattr(MemoryQuery, "stream", counting_stream)
+
+    page = sync_page(
+        added=[plaid_transaction(f"posted-{index}", 10.0, pending_transaction_id=f"pending-{index}") for index in range(40)],
+        removed=[f"pending-{index}" for index in range(40)]
+    )
+    persist_sync_page(user["user_id"], item_ref, item_data, page)
+
+    # 80 ids left after the get_all, looked up 30 at a time
+    assert len(lookups) == 3
+    transactions = [doc.to_dict() for doc in db.collection("transactions").get()]
+    assert sorted(transaction["plaid_transaction_id"] for transaction in transactions) == sorted(f"posted-{index}" for index in range(40))
+    assert all(transaction["category_id"] == groceries for transaction in transactions)
+
+def test_sync_that_lost_its_lease_stops_writing(user):
+    item_ref, item_data = create_plaid_item(user["user_id"])
+    assert sync_lease.try_acquire_lease(user["user_id"], "stalled-sync", [item_ref.id]) is None
+    fence = sync_lease.lease_fence(user["user_id"], "stalled-sync")
+    persist_sync_page(user["user_id"], item_ref, item_data, sync_page(added=[plaid_transaction("txn-1", 12.5)]), fence=fence)
+
+    # The lease expired while the sync stalled, and another sync took it over
+    sync_lease.get_lease_ref(user["user_id"]).update({"owner": "new-sync"})
+    with pytest.raises(LeaseLostError):
+        persist_sync_page(user["user_id"], item_ref, item_data, sync_page(added=[plaid_transaction("txn-2", 40.0)], next_cursor="cursor-2"), fence=fence)
+
+    assert not plaid_transaction_ref("txn-2").get().exists
+    assert item_ref.get().to_dict()["cursor"] == "cursor-1"
+
+def test_sync_request_does_not_wait_out_a_running_sync(user, call, monkeypatch):
+    monkeypatch.setattr(sync_lease, "MAX_WAIT_SECONDS", 0.05)
+    monkeypatch.setattr(sync_lease, "POLL_SECONDS", 0.01)
+    item_ref, _ = create_plaid_item(user["user_id"])
+    assert sync_lease.try_acquire_lease(user["user_id"], "other-sync", [item_ref.id]) is None
+
+    response = call("/transaction/sync-plaid-transactions", {"user_id": user["user_id"]})
+    assert response["status"] == 202
+    assert response["body"]["status"] == "running"
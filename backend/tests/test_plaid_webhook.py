@@ -0,0 +1,65 @@
+from types import SimpleNamespace
+import hashlib
+import json
+import time
+import jwt
+import plaid
+import pytest
+from cryptography.hazmat.primitives.asymmetric import ec
+from api import plaid_utils
+from api.plaid_utils import verify_plaid_webhook, WebhookVerificationError
+
+BODY = b'{"webhook_type": "TRANSACTIONS", "webhook_code": "SYNC_UPDATES_AVAILABLE", "item_id": "item-test"}'
+
+@pytest.fixture
+def signing_key():
+    return ec.generate_private_key(ec.SECP256R1())
+
+@pytest.fixture
+def key_lookups(signing_key, monkeypatch):
+    """Key ids looked up at Plaid; only "key-1" exists"""
+    lookups = []
+    def webhook_verification_key_get(request):
+        lookups.append(request.key_id)
+        if request.key_id != "key-1":
+            raise plaid.ApiException(status=400, reason="INVALID_WEBHOOK_VERIFICATION_KEY_ID")
+        jwk = json.loads(jwt.algorithms.ECAlgorithm.to_jwk(signing_key.public_key()))
+        return SimpleNamespace(key=SimpleNamespace(to_dict=lambda: {**jwk, "kid": "key-1", "alg": "ES256", "expired_at": None}))
+    monkeypatch.setattr(plaid_utils.client, "webhook_verification_key_get", webhook_verification_key_get)
+    return lookups
+
+def sign(signing_key, body: bytes, headers: dict) -> str:
+    claims = {"iat": int(time.time()), "request_body_sha256": hashlib.sha256(body).hexdigest()}
+    return jwt.encode(claims, signing_key, algorithm="ES256", headers=headers)
+
+def test_signed_webhook_is_verified_with_a_cached_key(signing_key, key_lookups):
+    verify_plaid_webhook(BODY, sign(signing_key, BODY, {"kid": "key-1"}))
+    verify_plaid_webhook(BODY, sign(signing_key, BODY, {"kid": "key-1"}))
+    assert key_lookups == ["key-1"]
+
+def test_cached_key_is_fetched_again_once_it_expires(signing_key, key_lookups):
+    verify_plaid_webhook(BODY, sign(signing_key, BODY, {"kid": "key-1"}))
+    plaid_utils.webhook_key_cache["key-1"]["expiration_time"] = 0
+    verify_plaid_webhook(BODY, sign(signing_key, BODY, {"kid": "key-1"}))
+    assert key_lookups == ["key-1", "key-1"]
+
+def test_token_without_a_key_id_is_rejected(signing_key, key_lookups):
+    with pytest.raises(WebhookVerificationError):
+        verify_plaid_webhook(BODY, sign(signing_key, BODY, {}))
+    assert key_lookups == []
+
+def test_unknown_key_id_is_looked_up_once(signing_key, key_lookups):
+    for _ in range(3):
+        with pytest.raises(WebhookVerificationError):
+            verify_plaid_webhook(BODY, sign(signing_key, BODY, {"kid": "forged"}))
+    assert key_lookups == ["forged"]
+
+def test_lookups_of_random_key_ids_are_capped(signing_key, key_lookups):
+    for index in range(plaid_utils.WEBHOOK_KEY_LOOKUPS_PER_MINUTE + 5):
+        with pytest.raises(WebhookVerificationError):
+            verify_plaid_webhook(BODY, sign(signing_key, BODY, {"kid": f"forged-{index}"}))
+    assert len(key_lookups) == plaid_utils.WEBHOOK_KEY_LOOKUPS_PER_MINUTE
+
+def test_forged_webhook_without_a_key_id_gets_401(signing_key, call):
+    response = call("/plaid/webhook", headers={"Plaid-Verification": sign(signing_key, BODY, {})})
+    assert response["status"] == 401
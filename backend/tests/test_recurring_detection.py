@@ -0,0 +1,73 @@
+from datetime import date, timedelta
+from api.db import db
+from api.recurring_detection import normalize_merchant, analyze_series, update_recurring_series, get_recurring_series, get_recurring_ref
+
+TODAY = date(2026, 10, 19)
+
+def charges(amounts: list, interval_days: int, last: date = TODAY, merchant_name: str = "Netflix") -> list:
+    first = last - timedelta(days=interval_days * (len(amounts) - 1))
+    return [
+        {"date": (first + timedelta(days=interval_days * index)).isoformat(), "amount": amount, "merchant_name": merchant_name}
+        for index, amount in enumerate(amounts)
+    ]
+
+def add_transaction(user_id: str, transaction_id: str, transaction: dict) -> None:
+    db.collection("transactions").document(transaction_id).set({"user_id": user_id, "name": transaction["merchant_name"], **transaction})
+
+def test_normalize_merchant_strips_processors_and_store_numbers():
+    assert normalize_merchant("SQ *BLUE BOTTLE #1234", None) == "blue bottle"
+    assert normalize_merchant(None, "POS NETFLIX.COM 10/02") == "netflix com"
+    assert normalize_merchant("", "#123") is None
+
+def test_monthly_subscription_is_detected():
+    series = analyze_series("netflix", charges([-15.49] * 4, 30), today=TODAY)
+    assert series["period"] == "monthly" and series["type"] == "expense"
+    assert series["amount_stable"] is True and series["active"] is True
+    assert series["occurrences"] == 4 and series["next_expected_date"] == (TODAY + timedelta(days=30)).isoformat()
+
+def test_same_day_charges_count_once_and_pending_is_ignored():
+    transactions = charges([-10, -10, -10], 7)
+    transactions.append(dict(transactions[-1], amount=-2))
+    transactions.append({"date": (TODAY + timedelta(days=7)).isoformat(), "amount": -10, "pending": True})
+    series = analyze_series("coffee", transactions, today=TODAY)
+    assert series["occurrences"] == 3 and series["last_amount"] == -12
+
+def test_irregular_or_too_short_histories_are_not_recurring():
+    assert analyze_series("netflix", charges([-15.49] * 2, 30), today=TODAY) is None
+    irregular = [{"date": day, "amount": -5} for day in ("2026-01-01", "2026-01-08", "2026-03-01", "2026-03-08")]
+    assert analyze_series("shop", irregular, today=TODAY) is None
+    assert analyze_series("shop", charges([-5, -80, -12, -150], 7), today=TODAY) is None
+
+def test_series_that_stopped_is_inactive():
+    series = analyze_series("gym", charges([-40] * 3, 7, last=TODAY - timedelta(days=30)), today=TODAY)
+    assert series["period"] == "weekly" and series["active"] is False
+
+def test_first_run_backfills_merchant_keys_then_updates_touched_merchants():
+    today = date.today()
+    for index, transaction in enumerate(charges([-15.49] * 3, 30, last=today)):
+        add_transaction("user-1", f"netflix-{index}", transaction)
+
+    series = update_recurring_series("user-1", [])
+    assert list(series) == ["netflix"]
+    assert db.collection("transactions").document("netflix-0").get().to_dict()["merchant_key"] == "netflix"
+
+    # Later syncs only re-analyze the merchants they touched
+    for index, transaction in enumerate(charges([2500.0] * 3, 14, last=today, merchant_name="Acme Payroll")):
+        add_transaction("user-1", f"payroll-{index}", dict(transaction, merchant_key="acme payroll"))
+    db.collection("transactions").document("netflix-2").delete()
+    assert set(update_recurring_series("user-1", ["acme payroll"])) == {"netflix", "acme payroll"}
+    assert set(update_recurring_series("user-1", ["netflix"])) == {"acme payroll"}
+
+    stored = get_recurring_ref("user-1").get().to_dict()
+    assert stored["complete"] is True
+    [paycheck] = get_recurring_series("user-1")
+    assert paycheck["type"] == "income" and paycheck["period"] == "bi-weekly"
+
+def test_get_recurring_series_refreshes_active(call):
+    stale = analyze_series("gym", charges([-40] * 3, 7, last=date.today()), today=date.today())
+    stale["last_date"] = (date.today() - timedelta(days=60)).isoformat()
+    get_recurring_ref("user-1").set({"user_id": "user-1", "series": {"gym": stale}, "complete": True})
+
+    response = call("/transaction/get-recurring-series", {"user_id": "user-1"})
+    assert response["status"] == 200
+    assert [item["active"] for item in response["body"]["recurring_series"]] == [False]
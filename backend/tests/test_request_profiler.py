@@ -0,0 +1,15 @@
+from api import request_profiler, admin_routes
+
+def test_profiles_are_saved_for_every_worker(user, call, monkeypatch):
+    monkeypatch.setattr(request_profiler, "PROFILE_DEBUG_TOKEN", "debug-token")
+    monkeypatch.setattr(admin_routes, "ADMIN_TOKEN", "admin-token")
+
+    call("/category/get-allocated-and-spent", {"user_id": user["user_id"], "start_date": "2026-10-01", "end_date": "2026-10-31"}, {"X-Debug-Profile": "debug-token"})
+    # Another worker holds nothing in memory; the listing comes from Firestore
+    listed = call("/admin/profiles?user_id=test-user", method="GET", headers={"X-Admin-Token": "admin-token"})["body"]["profiles"]
+    assert [profile["route"] for profile in listed] == ["/category/get-allocated-and-spent"]
+    assert "folded" not in listed[0]
+
+    profile = call(f"/admin/profiles/{listed[0]['id']}", method="GET", headers={"X-Admin-Token": "admin-token"})
+    assert profile["status"] == 200
+    assert isinstance(profile["body"]["folded"], str)
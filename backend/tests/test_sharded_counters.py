@@ -0,0 +1,57 @@
+from api.db import db, DELETE_FIELD
+from api.data_version import bump_data_version, get_data_version
+from api.sharded_counters import read_balance, stage_available_change, get_shard_counts, get_shard_ref, balance_cache
+
+def category(category_id: str) -> dict:
+    return db.collection("categories").document(category_id).get().to_dict()
+
+def test_unsharded_balance_is_the_available_field(user):
+    groceries = user["category_ids"][0]
+    db.collection("categories").document(groceries).update({"available": 12.5})
+    assert read_balance(groceries, category(groceries)) == 12.5
+
+def test_sharded_balance_adds_base_and_shards(user):
+    unallocated_id = user["unallocated_id"]
+    shard_count = get_shard_counts(user["user_id"])[unallocated_id]
+    unallocated_ref = db.collection("categories").document(unallocated_id)
+    unallocated_ref.update({"available": 100.0})
+
+    batch = db.batch()
+    for amount in (-30.0, -20.25, 5.0):
+        stage_available_change(batch, unallocated_ref, amount, shard_count)
+    batch.commit()
+    assert read_balance(unallocated_id, category(unallocated_id)) == 54.75
+
+def test_cached_sum_lasts_until_the_data_version_moves(user):
+    unallocated_id = user["unallocated_id"]
+    shard_count = get_shard_counts(user["user_id"])[unallocated_id]
+    unallocated_ref = db.collection("categories").document(unallocated_id)
+    assert read_balance(unallocated_id, category(unallocated_id)) == 0.0
+
+    get_shard_ref(unallocated_ref, 0).set({"available": 40.0}, merge=True)
+    # Same data version, so the cached sum is served
+    assert read_balance(unallocated_id, category(unallocated_id), get_data_version(user["user_id"])) == 0.0
+
+    bump_data_version(user["user_id"])
+    assert read_balance(unallocated_id, category(unallocated_id)) == 40.0
+    assert balance_cache[unallocated_id][1] == 40.0
+
+def test_unsharded_unallocated_is_switched_by_the_first_assignment(user, call):
+    unallocated_id = user["unallocated_id"]
+    groceries = user["category_ids"][0]
+    # Users created before sharding have an unsharded Unallocated Funds category
+    unallocated_ref = db.collection("categories").document(unallocated_id)
+    unallocated_ref.update({"shard_count": DELETE_FIELD, "available": 100.0})
+
+    # Reading shard counts without a batch to stage the switch in leaves it alone
+    assert get_shard_counts(user["user_id"]) == {unallocated_id: 0}
+    assert "shard_count" not in category(unallocated_id)
+    assert read_balance(unallocated_id, category(unallocated_id)) == 100.0
+
+    version = get_data_version(user["user_id"])
+    body = {"user_id": user["user_id"], "category_id": groceries, "amount": 30, "date": "2026-10-05"}
+    assert call("/assignment/create-assignment", body)["status"] == 200
+
+    assert category(unallocated_id)["shard_count"] > 0
+    assert get_data_version(user["user_id"]) == version + 1
+    assert read_balance(unallocated_id, category(unallocated_id)) == 70.0
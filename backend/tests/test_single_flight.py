@@ -0,0 +1,71 @@
+import asyncio
+import threading
+import pytest
+from api.single_flight import single_flight, in_flight
+
+def test_concurrent_calls_with_one_key_share_a_computation():
+    calls = []
+    release = threading.Event()
+
+    def compute(value):
+        calls.append(value)
+        release.wait(5)
+        return {"value": value}
+
+    async def run():
+        first = asyncio.ensure_future(single_flight("key", compute, 1))
+        second = asyncio.ensure_future(single_flight("key", compute, 2))
+        other = asyncio.ensure_future(single_flight("other-key", compute, 3))
+        await asyncio.sleep(0.05)
+        release.set()
+        return await asyncio.gather(first, second, other)
+
+    first, second, other = asyncio.run(run())
+    assert first is second and first == {"value": 1}
+    assert other == {"value": 3}
+    assert sorted(calls) == [1, 3]
+    assert in_flight == {}
+
+def test_finished_flight_is_not_reused():
+    calls = []
+
+    def compute():
+        calls.append(None)
+        return len(calls)
+
+    async def run():
+        return [await single_flight("key", compute), await single_flight("key", compute)]
+
+    assert asyncio.run(run()) == [1, 2]
+
+def test_failure_reaches_every_waiter_and_is_not_kept():
+    release = threading.Event()
+
+    def compute():
+        release.wait(5)
+        raise RuntimeError("deadline exceeded")
+
+    async def run():
+        waiters = [asyncio.ensure_future(single_flight("key", compute)) for _ in range(2)]
+        await asyncio.sleep(0.05)
+        release.set()
+        return await asyncio.gather(*waiters, return_exceptions=True)
+
+    errors = asyncio.run(run())
+    assert [str(error) for error in errors] == ["deadline exceeded", "deadline exceeded"]
+    assert in_flight == {}
+
+def test_cancelled_caller_does_not_cancel_the_others():
+    release = threading.Event()
+
+    async def run():
+        first = asyncio.ensure_future(single_flight("key", lambda: release.wait(5) and "done"))
+        second = asyncio.ensure_future(single_flight("key", lambda: "not run"))
+        await asyncio.sleep(0.05)
+        first.cancel()
+        release.set()
+        with pytest.raises(asyncio.CancelledError):
+            await first
+        return await second
+
+    assert asyncio.run(run()) == "done"
@@ -0,0 +1,27 @@
+import asyncio
+from api import sync_scheduler
+
+def test_scheduled_sync_is_held_until_it_finishes(monkeypatch):
+    finished = []
+    monkeypatch.setattr(sync_scheduler, "sync_delay_seconds", 0)
+
+    async def scenario():
+        release = asyncio.Event()
+
+        async def run_item_sync(item_doc_id):
+            await release.wait()
+            finished.append(item_doc_id)
+            sync_scheduler.item_sync_state.pop(item_doc_id, None)
+        monkeypatch.setattr(sync_scheduler, "run_item_sync", run_item_sync)
+
+        assert sync_scheduler.schedule_item_sync("item-1")
+        assert not sync_scheduler.schedule_item_sync("item-1")
+        await asyncio.sleep(0.01)
+        # Started by the timer and referenced only from the scheduler
+        assert len(sync_scheduler.sync_tasks) == 1
+        release.set()
+        await asyncio.gather(*sync_scheduler.sync_tasks)
+    asyncio.run(scenario())
+
+    assert finished == ["item-1"]
+    assert sync_scheduler.sync_tasks == set()
@@ -0,0 +1,38 @@
+from api.transaction_routes import LIST_FIELDS
+
+def create_transactions(call, user) -> None:
+    for amount, day in ((-20, "2026-10-02"), (-35, "2026-10-03")):
+        body = {"user_id": user["user_id"], "category_id": user["category_ids"][0], "name": "Corner shop", "amount": amount, "date": day}
+        assert call("/transaction/create-transaction", body)["status"] == 200
+
+def test_list_fields_by_default(user, call):
+    create_transactions(call, user)
+    response = call("/transaction/get-transactions", {"user_id": user["user_id"]})
+    assert response["status"] == 200
+    for transaction in response["body"]["transactions"]:
+        assert set(transaction) <= set(LIST_FIELDS) | {"id"}
+    assert response["body"]["pagination"] == {"has_more": False, "next_cursor": None}
+
+def test_requested_fields_and_whole_documents(user, call):
+    create_transactions(call, user)
+    projected = call("/transaction/get-transactions", {"user_id": user["user_id"], "fields": ["amount", "date"]})
+    assert [set(transaction) for transaction in projected["body"]["transactions"]] == [{"amount", "date", "id"}] * 2
+
+    whole = call("/transaction/get-transactions", {"user_id": user["user_id"], "fields": ["*"]})
+    assert "created_at" in whole["body"]["transactions"][0]
+
+    # Each projection is cached under its own ETag
+    assert len({projected["etag"], whole["etag"]}) == 2
+
+def test_unknown_field_is_rejected(user, call):
+    response = call("/transaction/get-transactions", {"user_id": user["user_id"], "fields": ["amount", "password"]})
+    assert response["status"] == 400
+    assert response["body"]["detail"] == "Unknown transaction fields: password"
+
+def test_details_view_reads_the_whole_document(user, call):
+    create_transactions(call, user)
+    [first, _] = call("/transaction/get-transactions", {"user_id": user["user_id"]})["body"]["transactions"]
+    response = call("/transaction/get-transaction", {"user_id": user["user_id"], "transaction_id": first["id"]})
+    assert response["status"] == 200
+    transaction = response["body"]["transaction"]
+    assert transaction["name"] == "Corner shop" and "created_at" in transaction
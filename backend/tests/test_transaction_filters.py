@@ -0,0 +1,39 @@
+import pytest
+from fastapi import HTTPException
+from api.db import NULL_VALUE
+from api.transaction_routes import UserIDRequest, TransactionFilter, resolve_filter
+
+def resolve(**request) -> dict:
+    return resolve_filter(UserIDRequest(user_id="test-user", **request))
+
+def test_unset_filters_are_dropped():
+    assert resolve() == {}
+    assert resolve(filter=TransactionFilter(institution_name="Test Bank", pending=False)) == {"institution_name": "Test Bank", "pending": False}
+
+def test_legacy_category_id_parameter():
+    assert resolve(category_id="groceries") == {"category_id": "groceries"}
+    assert resolve(category_id="null") == {"category_id": NULL_VALUE}
+
+def test_uncategorized_is_the_null_category():
+    assert resolve(filter=TransactionFilter(uncategorized=True)) == {"category_id": NULL_VALUE}
+
+@pytest.mark.parametrize("request_fields", [
+    {"filter": TransactionFilter(category_id="groceries", uncategorized=True)},
+    {"category_id": "null", "filter": TransactionFilter(category_id="groceries")},
+    {"filter": TransactionFilter(type="transfer")},
+    {"filter": TransactionFilter(start_date="2026-10-31", end_date="2026-10-01")},
+    {"filter": TransactionFilter(min_amount=10, max_amount=-10)},
+])
+def test_invalid_filters_are_rejected(request_fields):
+    with pytest.raises(HTTPException) as error:
+        resolve(**request_fields)
+    assert error.value.status_code == 400
+
+def test_filtered_feed(user, call):
+    groceries, rent = user["category_ids"]
+    for category_id, amount, day in ((groceries, -20, "2026-10-02"), (rent, -900, "2026-10-03"), (groceries, -35, "2026-10-20")):
+        call("/transaction/create-transaction", {"user_id": user["user_id"], "category_id": category_id, "name": "Payment", "amount": amount, "date": day})
+
+    response = call("/transaction/get-transactions", {"user_id": user["user_id"], "filter": {"category_id": groceries, "end_date": "2026-10-10"}})
+    assert response["status"] == 200
+    assert [transaction["amount"] for transaction in response["body"]["transactions"]] == [-20.0]
@@ -10,6 +10,7 @@ import { Ionicons } from '@expo/vector-icons';
 import { useBudgetPeriod } from '@/hooks/useBudgetPeriod';
 import { useAllocatedAndSpent } from '@/hooks/useAllocatedAndSpent';
 import { useCategoryHandlers } from '@/hooks/useCategoryHandlers';
+import { useSpendingBreakdown } from '@/hooks/useSpendingBreakdown';
 import {
   setPreviousBudgetPeriodTimeFrame,
   setNextBudgetPeriodTimeFrame,
@@ -34,6 +35,12 @@ export default function InsightsScreen() {
     getSpentAmount,
     getAllocatedAmount,
   } = useAllocatedAndSpent(user, startDate, endDate);
+  const {
+    categories: plaidCategories,
+    merchants: topMerchants,
+    totalSpent: breakdownTotalSpent,
+    loading: breakdownLoading,
+  } = useSpendingBreakdown(user, startDate, endDate);
   const [infoModalVisible, setInfoModalVisible] = useState(false);
   const [selectedInfoCategory, setSelectedInfoCategory] = useState<any>(null);
 
@@ -75,6 +82,12 @@ export default function InsightsScreen() {
     .filter(item => item.allocated > 0) // Only show categories with allocations
     .sort((a, b) => b.allocated - a.allocated);
 
+  // Plaid category names come as UPPER_SNAKE_CASE
+  const formatPlaidName = (name: string) =>
+    name.replace(/_/g, ' ').toLowerCase().replace(/\b\w/g, l => l.toUpperCase());
+  const breakdownPercentage = (spent: number) =>
+    breakdownTotalSpent > 0 ? (spent / breakdownTotalSpent) * 100 : 0;
+
   // Prepare chart data - limit to top 8 categories for readability
   const chartData = spendingByCategory.slice(0, 8);
   const screenWidth = Dimensions.get('window').width;
@@ -289,6 +302,56 @@ export default function InsightsScreen() {
                 </Text>
               )}
             </View>
+
+            {/* Spending by Plaid personal finance category */}
+            <View style={styles.section}>
+              <Text style={styles.sectionTitle}>Spending by Type</Text>
+              {plaidCategories.length > 0 ? (
+                plaidCategories.map((item) => (
+                  <View key={item.primary} style={styles.categoryItem}>
+                    <View style={styles.categoryInfo}>
+                      <Text style={styles.categoryName}>{formatPlaidName(item.primary)}</Text>
+                      <Text style={styles.categoryAmount}>${item.spent.toFixed(2)}</Text>
+                    </View>
+                    <View style={styles.progressBar}>
+                      <View
+                        style={[styles.progressFill, { width: `${breakdownPercentage(item.spent)}%` }]}
+                      />
+                    </View>
+                    <Text style={styles.percentage}>
+                      {breakdownPercentage(item.spent).toFixed(1)}%
+                      {item.detailed.length > 1 && ` · Top: ${formatPlaidName(item.detailed[0].detailed.replace(`${item.primary}_`, ''))}`}
+                    </Text>
+                  </View>
+                ))
+              ) : (
+                <Text style={styles.noDataText}>
+                  {breakdownLoading ? 'Loading...' : 'No spending data for this period'}
+                </Text>
+              )}
+            </View>
+
+            {/* Top merchants */}
+            <View style={styles.section}>
+              <Text style={styles.sectionTitle}>Top Merchants</Text>
+              {topMerchants.length > 0 ? (
+                topMerchants.map((item) => (
+                  <View key={item.merchant_key} style={styles.categoryItem}>
+                    <View style={styles.categoryInfo}>
+                      <Text style={styles.categoryName}>{item.merchant_name || item.merchant_key}</Text>
+                      <Text style={styles.categoryAmount}>${item.spent.toFixed(2)}</Text>
+                    </View>
+                    <Text style={styles.percentage}>
+                      {item.count} {item.count === 1 ? 'transaction' : 'transactions'}
+                    </Text>
+                  </View>
+                ))
+              ) : (
+                <Text style={styles.noDataText}>
+                  {breakdownLoading ? 'Loading...' : 'No spending data for this period'}
+                </Text>
+              )}
+            </View>
           </View>
         )}
       </ScrollView>
@@ -82,7 +82,10 @@ export default function Tab() {
         setIsLoading(true);
         const data = await syncPlaidTransactions(user.uid);
         console.log('Fetched new transactions:', data);
-        if (data) {
+        if (data?.status === 'running') {
+          // Another sync of these accounts was still going after the backend's wait
+          Alert.alert('Info', 'A sync is already running, new transactions will appear shortly');
+        } else if (data) {
           fetchTransactions(); // Refresh the transactions list after syncing
           Alert.alert('Success', `transactions synced`);
         } else {
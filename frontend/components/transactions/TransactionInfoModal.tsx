@@ -4,7 +4,7 @@ import Modal from 'react-native-modal';
 import DateTimePicker from '@react-native-community/datetimepicker';
 import { Ionicons } from '@expo/vector-icons';
 import { Transaction, Category } from '@/types';
-import { updateTransactionDate } from '@/services/transactions';
+import { getTransaction, updateTransactionDate } from '@/services/transactions';
 import { formatDateToYYYYMMDD } from '@/utils/dateUtils';
 
 interface TransactionInfoModalProps {
@@ -31,6 +31,22 @@ export default function TransactionInfoModal({
     }
   }, [transaction]);
 
+  // The list only loaded the fields it shows; fetch the rest when the modal opens
+  useEffect(() => {
+    if (!visible || !transaction) return;
+    let cancelled = false;
+    getTransaction(transaction.user_id, transaction.id)
+      .then((fullTransaction) => {
+        if (!cancelled) {
+          setLocalTransaction((current) => ({ ...(current || {}), ...fullTransaction }));
+        }
+      })
+      .catch((error) => console.error('Error loading transaction details:', error));
+    return () => {
+      cancelled = true;
+    };
+  }, [visible, transaction?.id]);
+
   if (!localTransaction) return null;
 
 //   const formatDate = (dateString: string) => {
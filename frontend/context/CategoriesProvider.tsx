@@ -11,6 +11,7 @@ type Category = {
   available: number;
   is_unallocated_funds?: boolean;
   group_id?: string;
+  shard_count?: number; // set when `available` is a sharded counter
   // add other category fields if needed
 };
 
@@ -39,6 +40,9 @@ export const CategoriesProvider: React.FC<{ children: React.ReactNode }> = ({ ch
   const [loading, setLoading] = useState(true);
   const [groupsLoading, setGroupsLoading] = useState(true);
   const [unallocatedFunds, setUnallocatedFunds] = useState<Category | null>(null);
+  const [rawCategories, setRawCategories] = useState<Category[]>([]);
+  // Sum of the balance shards of each sharded category (their doc holds only the base balance)
+  const [shardTotals, setShardTotals] = useState<Record<string, number>>({});
 
   useEffect(() => {
     if (!user) return;
@@ -66,12 +70,7 @@ export const CategoriesProvider: React.FC<{ children: React.ReactNode }> = ({ ch
         return a.name.toLowerCase().localeCompare(b.name.toLowerCase());
       });
       
-      setCategories(sortedCategories);
-      
-      // Find the unallocated funds category
-      const unallocated = fetchedCategories.find(category => category.is_unallocated_funds) || null;
-      setUnallocatedFunds(unallocated);
-      
+      setRawCategories(sortedCategories);
       setLoading(false);
     });
 
@@ -107,6 +106,38 @@ export const CategoriesProvider: React.FC<{ children: React.ReactNode }> = ({ ch
     };
   }, [user]);
 
+  // Subscribe to the shards of sharded categories (Unallocated Funds)
+  const shardedKey = rawCategories
+    .filter((category) => category.shard_count)
+    .map((category) => category.id)
+    .join(',');
+
+  useEffect(() => {
+    if (!shardedKey) {
+      setShardTotals({});
+      return;
+    }
+    const unsubscribes = shardedKey.split(',').map((categoryId) =>
+      onSnapshot(collection(db, 'categories', categoryId, 'available_shards'), (snapshot) => {
+        const total = snapshot.docs.reduce((sum, doc) => sum + (doc.data().available || 0), 0);
+        setShardTotals((previous) => ({ ...previous, [categoryId]: total }));
+      })
+    );
+    return () => unsubscribes.forEach((unsubscribe) => unsubscribe());
+  }, [shardedKey]);
+
+  useEffect(() => {
+    const withBalances = rawCategories.map((category) =>
+      category.shard_count
+        ? { ...category, available: (category.available || 0) + (shardTotals[category.id] || 0) }
+        : category
+    );
+    setCategories(withBalances);
+
+    // Find the unallocated funds category
+    setUnallocatedFunds(withBalances.find((category) => category.is_unallocated_funds) || null);
+  }, [rawCategories, shardTotals]);
+
   return (
     <CategoriesContext.Provider value={{ categories, categoryGroups, loading, groupsLoading, unallocatedFunds }}>
       {children}
@@ -1,5 +1,6 @@
 export { useBudgetPeriod } from './useBudgetPeriod';
 export { useAllocatedAndSpent } from './useAllocatedAndSpent';
+export { useSpendingBreakdown } from './useSpendingBreakdown';
 export { useCategoryHandlers } from './useCategoryHandlers';
 export { useColorScheme } from './useColorScheme';
 export { useThemeColor } from './useThemeColor';
@@ -0,0 +1,77 @@
+import { useState, useEffect, useCallback } from 'react';
+import { getSpendingBreakdown } from '@/services/insights';
+
+interface User {
+  uid: string;
+}
+
+export interface DetailedCategorySpend {
+  detailed: string;
+  spent: number;
+  count: number;
+}
+
+export interface PrimaryCategorySpend {
+  primary: string;
+  spent: number;
+  count: number;
+  detailed: DetailedCategorySpend[];
+}
+
+export interface MerchantSpend {
+  merchant_key: string;
+  merchant_name: string | null;
+  spent: number;
+  count: number;
+}
+
+interface UseSpendingBreakdownReturn {
+  categories: PrimaryCategorySpend[];
+  merchants: MerchantSpend[];
+  totalSpent: number;
+  loading: boolean;
+  fetchSpendingBreakdown: () => Promise<void>;
+}
+
+// Spend per Plaid personal finance category and top merchants, computed on the server
+export function useSpendingBreakdown(
+  user: User | null,
+  startDate: string,
+  endDate: string,
+  topMerchants: number = 10
+): UseSpendingBreakdownReturn {
+  const [categories, setCategories] = useState<PrimaryCategorySpend[]>([]);
+  const [merchants, setMerchants] = useState<MerchantSpend[]>([]);
+  const [totalSpent, setTotalSpent] = useState<number>(0);
+  const [loading, setLoading] = useState(false);
+
+  const fetchSpendingBreakdown = useCallback(async () => {
+    if (user) {
+      try {
+        setLoading(true);
+        const data = await getSpendingBreakdown(user.uid, startDate, endDate, topMerchants);
+        setCategories(data.categories || []);
+        setMerchants(data.merchants || []);
+        setTotalSpent(data.total_spent || 0);
+      } catch (error) {
+        console.error('Failed to fetch spending breakdown', error);
+      } finally {
+        setLoading(false);
+      }
+    }
+  }, [user, startDate, endDate, topMerchants]);
+
+  useEffect(() => {
+    if (startDate && endDate) {
+      fetchSpendingBreakdown();
+    }
+  }, [fetchSpendingBreakdown]);
+
+  return {
+    categories,
+    merchants,
+    totalSpent,
+    loading,
+    fetchSpendingBreakdown,
+  };
+}
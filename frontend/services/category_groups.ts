@@ -1,6 +1,7 @@
+import { fetchWithETag } from '@/utils/etagCache';
 
 export const getCategoryGroups = async (userId: string) => {
-    const response = await fetch(`${process.env.EXPO_PUBLIC_API_URL}${process.env.EXPO_PUBLIC_CATEGORY_PREFIX}/get-category-groups`, {
+    const response = await fetchWithETag(`${process.env.EXPO_PUBLIC_API_URL}${process.env.EXPO_PUBLIC_CATEGORY_PREFIX}/get-category-groups`, {
         method: 'POST',
         headers: {
             'Content-Type': 'application/json',
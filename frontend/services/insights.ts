@@ -0,0 +1,22 @@
+import { fetchWithETag } from '@/utils/etagCache';
+export const getSpendingBreakdown = async (userId: string, startDate: string, endDate: string, topMerchants: number = 10) => {
+    const response = await fetchWithETag(`${process.env.EXPO_PUBLIC_API_URL}/insights/get-spending-breakdown`, {
+        method: 'POST',
+        headers: {
+            'Content-Type': 'application/json',
+        },
+        body: JSON.stringify({
+            user_id: userId,
+            start_date: startDate,
+            end_date: endDate,
+            top_merchants: topMerchants,
+        }),
+    });
+
+    if (!response.ok) {
+        throw new Error('Failed to fetch spending breakdown');
+    }
+
+    const data = await response.json();
+    return data;
+};
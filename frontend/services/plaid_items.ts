@@ -1,5 +1,6 @@
+import { fetchWithETag } from '@/utils/etagCache';
 export const getPlaidItems = async (userId: string) => {
-    const response = await fetch(`${process.env.EXPO_PUBLIC_API_URL}${process.env.EXPO_PUBLIC_PLAID_ITEM_PREFIX}/get-plaid-items`, {
+    const response = await fetchWithETag(`${process.env.EXPO_PUBLIC_API_URL}${process.env.EXPO_PUBLIC_PLAID_ITEM_PREFIX}/get-plaid-items`, {
         method: 'POST',
         headers: {
             'Content-Type': 'application/json',
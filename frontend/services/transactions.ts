@@ -1,4 +1,19 @@
-export const getTransactions = async (userId: string, categoryId: string | null = null, limit: number = 20, cursorId: string | null = null) => {
+import { fetchWithETag } from '@/utils/etagCache';
+// Server-side filters of the transactions feed, see TransactionFilter in transaction_routes.py
+export interface TransactionFilter {
+    category_id?: string;
+    uncategorized?: boolean;
+    institution_name?: string;
+    account_name?: string;
+    pending?: boolean;
+    type?: 'debit' | 'credit';
+    start_date?: string;
+    end_date?: string;
+    min_amount?: number;
+    max_amount?: number;
+}
+
+export const getTransactions = async (userId: string, categoryId: string | null = null, limit: number = 20, cursorId: string | null = null, filter: TransactionFilter | null = null) => {
     // Create the request body, ensuring we only include defined values
     const requestBody: any = {
       user_id: userId
@@ -19,8 +34,13 @@ export const getTransactions = async (userId: string, categoryId: string | null
       requestBody.cursor_id = cursorId;
     }
 
+    // Only add filter if it's provided
+    if (filter !== null) {
+      requestBody.filter = filter;
+    }
+
 
-    const response = await fetch(`${process.env.EXPO_PUBLIC_API_URL}${process.env.EXPO_PUBLIC_TRANSACTION_PREFIX}/get-transactions`, {
+    const response = await fetchWithETag(`${process.env.EXPO_PUBLIC_API_URL}${process.env.EXPO_PUBLIC_TRANSACTION_PREFIX}/get-transactions`, {
       method: 'POST',
       headers: {
       'Content-Type': 'application/json',
@@ -36,6 +56,27 @@ export const getTransactions = async (userId: string, categoryId: string | null
     return data;
 };
 
+// Lists only carry the fields they render; this loads the whole transaction
+export const getTransaction = async (userId: string, transactionId: string) => {
+    const response = await fetch(`${process.env.EXPO_PUBLIC_API_URL}${process.env.EXPO_PUBLIC_TRANSACTION_PREFIX}/get-transaction`, {
+        method: 'POST',
+        headers: {
+            'Content-Type': 'application/json',
+        },
+        body: JSON.stringify({
+            user_id: userId,
+            transaction_id: transactionId,
+        }),
+    });
+
+    if (!response.ok) {
+        throw new Error('Failed to fetch transaction');
+    }
+
+    const data = await response.json();
+    return data.transaction;
+};
+
 export const addTransaction = async (userId: string, amount: number, categoryId: string, name: string, date: string) => {  
     const response = await fetch(`${process.env.EXPO_PUBLIC_API_URL}${process.env.EXPO_PUBLIC_TRANSACTION_PREFIX}/create-transaction`, {
         method: 'POST',
@@ -76,7 +117,7 @@ export const getTransactionsForCategory = async (userId: string, categoryId: str
       requestBody.cursor_id = cursorId;
     }
 
-    const response = await fetch(`${process.env.EXPO_PUBLIC_API_URL}${process.env.EXPO_PUBLIC_TRANSACTION_PREFIX}/get-transactions`, {
+    const response = await fetchWithETag(`${process.env.EXPO_PUBLIC_API_URL}${process.env.EXPO_PUBLIC_TRANSACTION_PREFIX}/get-transactions`, {
       method: 'POST',
       headers: {
         'Content-Type': 'application/json',
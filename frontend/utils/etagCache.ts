@@ -0,0 +1,35 @@
+// Read endpoints answer with an ETag derived from the user's data version. Sending it
+// back as If-None-Match lets the backend answer 304 before running any query, and the
+// body cached here from the last 200 is returned instead.
+const MAX_ENTRIES = 100;
+
+const etagCache = new Map<string, { etag: string; body: string }>();
+
+export const fetchWithETag = async (url: string, init: RequestInit): Promise<Response> => {
+    const key = `${url}|${init.body ?? ''}`;
+    const cached = etagCache.get(key);
+    const headers: Record<string, string> = { ...(init.headers as Record<string, string>) };
+    if (cached) {
+        headers['If-None-Match'] = cached.etag;
+    }
+
+    const response = await fetch(url, { ...init, headers });
+    if (response.status === 304 && cached) {
+        return new Response(cached.body, {
+            status: 200,
+            headers: { 'Content-Type': 'application/json', ETag: cached.etag },
+        });
+    }
+
+    const etag = response.headers.get('ETag');
+    if (response.ok && etag) {
+        const body = await response.clone().text();
+        // Re-insert so the least recently fetched entry is the one evicted
+        etagCache.delete(key);
+        etagCache.set(key, { etag, body });
+        if (etagCache.size > MAX_ENTRIES) {
+            etagCache.delete(etagCache.keys().next().value as string);
+        }
+    }
+    return response;
+};